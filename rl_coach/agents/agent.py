@@ -17,6 +17,7 @@
 import copy
 import random
 from collections import OrderedDict
+from functools import partial
 from typing import Dict, List, Union, Tuple
 
 import numpy as np
@@ -24,8 +25,11 @@ import numpy as np
 from rl_coach.agents.agent_interface import AgentInterface
 from rl_coach.base_parameters import AgentParameters, DistributedTaskParameters
 from rl_coach.core_types import RunPhase, PredictionType, EnvironmentEpisodes, ActionType, Batch, Episode, StateType
-from rl_coach.core_types import Transition, ActionInfo, TrainingSteps, EnvironmentSteps, EnvResponse
+from rl_coach.core_types import Transition, ActionInfo, TrainingSteps, EnvironmentSteps, EnvResponse, stack_values
+from rl_coach.memories.batch_prefetcher import BatchPrefetcher
+from rl_coach.memories.columnar_format import is_saved_memory
 from rl_coach.memories.episodic.episodic_experience_replay import EpisodicExperienceReplay
+from rl_coach.memories.memory import get_replay_buffer_checkpoint_dir, get_latest_replay_buffer_checkpoint
 from pandas import read_pickle
 from six.moves import range
 from rl_coach.spaces import SpacesDefinition, VectorObservationSpace, GoalsSpace, AttentionActionSpace
@@ -75,12 +79,27 @@ class Agent(AgentInterface):
             self.memory = self.shared_memory_scratchpad.get(self.memory_lookup_name)
         else:
             # modules
-            if agent_parameters.memory.load_memory_from_file_path:
+            if agent_parameters.memory.load_memory_from_file_path \
+                    and is_saved_memory(agent_parameters.memory.load_memory_from_file_path):
+                screen.log_title("Loading replay buffer. Replay buffer path: {}"
+                                 .format(agent_parameters.memory.load_memory_from_file_path))
+                self.memory = dynamic_import_and_instantiate_module_from_params(self.ap.memory)
+                self.memory.load(agent_parameters.memory.load_memory_from_file_path)
+            elif agent_parameters.memory.load_memory_from_file_path:
                 screen.log_title("Loading replay buffer from pickle. Pickle path: {}"
                                  .format(agent_parameters.memory.load_memory_from_file_path))
                 self.memory = read_pickle(agent_parameters.memory.load_memory_from_file_path)
             else:
                 self.memory = dynamic_import_and_instantiate_module_from_params(self.ap.memory)
+            self.memory.set_experiment_path(self.ap.task_parameters.experiment_path, self.full_name_id)
+
+            checkpoint_restore_dir = getattr(self.ap.task_parameters, 'checkpoint_restore_dir', None)
+            if checkpoint_restore_dir:
+                replay_buffer_checkpoint = get_latest_replay_buffer_checkpoint(checkpoint_restore_dir,
+                                                                               self.full_name_id)
+                if replay_buffer_checkpoint is not None:
+                    screen.log_title("Restoring replay buffer from checkpoint: {}".format(replay_buffer_checkpoint))
+                    self.memory.restore_checkpoint(replay_buffer_checkpoint)
 
             if self.shared_memory and self.is_chief:
                 self.shared_memory_scratchpad.add(self.memory_lookup_name, self.memory)
@@ -129,6 +148,8 @@ class Agent(AgentInterface):
         self.exploration_policy = None
         self.networks = {}
         self.last_action_info = None
+        self.batch_prefetcher = None
+        self.network_input_keys = None
         self.running_observation_stats = None
         self.running_reward_stats = None
         self.accumulated_rewards_across_evaluation_episodes = 0
@@ -299,6 +320,11 @@ class Agent(AgentInterface):
         self._phase = val
         self.exploration_policy.change_phase(val)
 
+        # the batches which were prefetched during the training phase are dropped, so that the next training phase
+        # will train on batches which include the transitions collected until then
+        if val != RunPhase.TRAIN and self.batch_prefetcher is not None:
+            self.batch_prefetcher.stop()
+
     def reset_evaluation_state(self, val: RunPhase) -> None:
         starting_evaluation = (val == RunPhase.TEST)
         ending_evaluation = (self.phase == RunPhase.TEST)
@@ -339,7 +365,7 @@ class Agent(AgentInterface):
         :param args: the arguments to supply to the function
         :return: the return value of the function
         """
-        if self.shared_memory:
+        if self.shared_memory and not self.memory.shares_storage_between_processes:
             result = self.shared_memory_scratchpad.internal_call(self.memory_lookup_name, func, args)
         else:
             if type(args) != tuple:
@@ -394,6 +420,9 @@ class Agent(AgentInterface):
         self.agent_logger.create_signal_value('In Heatup', int(self._phase == RunPhase.HEATUP))
         self.agent_logger.create_signal_value('ER #Transitions', self.call_memory('num_transitions'))
         self.agent_logger.create_signal_value('ER #Episodes', self.call_memory('length'))
+        self.agent_logger.create_signal_value('ER Memory Usage', sum(self.call_memory('memory_usage').values()))
+        for name, value in self.call_memory('get_statistics').items():
+            self.agent_logger.create_signal_value('ER {}'.format(name), value)
         self.agent_logger.create_signal_value('Episode Length', self.current_episode_steps_counter)
         self.agent_logger.create_signal_value('Total steps', self.total_steps_counter)
         self.agent_logger.create_signal_value("Epsilon", np.mean(self.exploration_policy.get_control_param()))
@@ -543,15 +572,26 @@ class Agent(AgentInterface):
                 self.training_iteration += 1
 
                 # sample a batch and train on it
-                batch = self.call_memory('sample', network_parameters.batch_size)
-                if self.pre_network_filter is not None:
-                    batch = self.pre_network_filter.filter(batch, update_internal_state=False, deep_copy=False)
+                if self.ap.algorithm.num_prefetched_batches > 0:
+                    if self.batch_prefetcher is None:
+                        # the inputs of all the networks are extracted from the batch in advance
+                        network_input_keys = set()
+                        for network in self.ap.network_wrappers.values():
+                            network_input_keys.update(network.input_embedders_parameters.keys())
+                        self.network_input_keys = sorted(network_input_keys)
+                        # the pre-network filter is not applied on the background thread, since it is used by the
+                        # agent on the main thread as well, and filters are not thread safe
+                        self.batch_prefetcher = BatchPrefetcher(
+                            partial(self._sample_from_memory, network_parameters.batch_size, self.network_input_keys),
+                            self.ap.algorithm.num_prefetched_batches)
+                    batch = self._prepare_batch(self.batch_prefetcher.get(), self.network_input_keys)
+                else:
+                    batch = self.sample_batch(network_parameters.batch_size)
 
                 # if the batch returned empty then there are not enough samples in the replay buffer -> skip
                 # training step
-                if len(batch) > 0:
+                if batch is not None:
                     # train
-                    batch = Batch(batch)
                     total_loss, losses, unclipped_grads = self.learn_from_batch(batch)
                     loss += total_loss
                     self.unclipped_grads.add_sample(unclipped_grads)
@@ -583,6 +623,65 @@ class Agent(AgentInterface):
 
         return loss
 
+    def sample_batch(self, batch_size: int, network_input_keys: List[str]=None) -> Union[None, Batch]:
+        """
+        Sample a batch of transitions from the memory and prepare it for training
+        :param batch_size: the number of transitions to sample
+        :param network_input_keys: if given, the values of these keys in the states and the next states, as well as the
+                                   actions, the rewards and the game over flags are extracted to arrays in advance
+        :return: the batch, or None if the memory returned an empty batch
+        """
+        return self._prepare_batch(self._sample_from_memory(batch_size, network_input_keys), network_input_keys)
+
+    def _sample_from_memory(self, batch_size: int, network_input_keys: List[str]=None) \
+            -> Union[None, Batch, Tuple[List[Transition], Dict[str, np.ndarray]]]:
+        """
+        Sample a batch of transitions from the memory. When there is no pre-network filter, the batch is also prepared
+        for training. This does not use the agent state, so it can run on the background thread of a batch prefetcher.
+        :param batch_size: the number of transitions to sample
+        :param network_input_keys: the keys to extract to arrays in advance, as in sample_batch
+        :return: the prepared batch, None if the memory returned an empty batch, or the sampled transitions and their
+                 info if the pre-network filter should still be applied on them
+        """
+        if self.pre_network_filter is not None and not self.pre_network_filter.is_empty():
+            return self.call_memory('sample_with_info', batch_size)
+
+        # the memory can build the batch arrays directly, since there is nothing to apply on the transitions
+        batch = self.call_memory('sample_batch', batch_size)
+        if batch.size == 0:
+            return None
+        self._extract_batch_arrays(batch, network_input_keys)
+        return batch
+
+    def _prepare_batch(self, sampled_batch: Union[None, Batch, Tuple[List[Transition], Dict[str, np.ndarray]]],
+                       network_input_keys: List[str]=None) -> Union[None, Batch]:
+        """
+        Apply the pre-network filter on a batch returned by _sample_from_memory, if it was not prepared yet
+        :param sampled_batch: the batch returned by _sample_from_memory
+        :param network_input_keys: the keys to extract to arrays in advance, as in sample_batch
+        :return: the batch, or None if the memory returned an empty batch
+        """
+        if sampled_batch is None or isinstance(sampled_batch, Batch):
+            return sampled_batch
+
+        transitions, batch_info = sampled_batch
+        transitions = self.pre_network_filter.filter(transitions, update_internal_state=False, deep_copy=False)
+        if len(transitions) == 0:
+            return None
+
+        batch = Batch(transitions, info=batch_info)
+        self._extract_batch_arrays(batch, network_input_keys)
+        return batch
+
+    @staticmethod
+    def _extract_batch_arrays(batch: Batch, network_input_keys: List[str]=None) -> None:
+        if network_input_keys is not None:
+            batch.states(network_input_keys)
+            batch.next_states(network_input_keys)
+            batch.actions()
+            batch.rewards()
+            batch.game_overs()
+
     def choose_action(self, curr_state):
         """
         choose an action to act with in the current episode being played. Different behavior might be exhibited when training
@@ -607,7 +706,7 @@ class Agent(AgentInterface):
             # through the network and this has to be added externally (e.g. ddpg where the action needs to be given in
             # addition to the current_state, so that all the inputs of the network will be filled)
             if key in states[0].keys():
-                batches_dict[key] = np.array([np.array(state[key]) for state in states])
+                batches_dict[key] = stack_values([state[key] for state in states])
 
         return batches_dict
 
@@ -721,9 +820,9 @@ class Agent(AgentInterface):
 
             # add action info to transition
             if type(self.parent).__name__ == 'CompositeAgent':
-                transition.add_info(self.parent.last_action_info.__dict__)
+                transition.add_info(self.parent.last_action_info)
             else:
-                transition.add_info(self.last_action_info.__dict__)
+                transition.add_info(self.last_action_info)
 
             # create and store the transition
             if self.phase in [RunPhase.TRAIN, RunPhase.HEATUP]:
@@ -775,7 +874,11 @@ class Agent(AgentInterface):
         :param checkpoint_id: the id of the checkpoint
         :return: None
         """
-        pass
+        # memories which are too large to be pickled with the rest of the agent are saved to a directory of their own
+        # next to the checkpoint
+        if not self.shared_memory or self.is_chief:
+            self.memory.save_checkpoint(get_replay_buffer_checkpoint_dir(self.ap.task_parameters.save_checkpoint_dir,
+                                                                         checkpoint_id, self.full_name_id))
 
     def sync(self) -> None:
         """
@@ -785,6 +888,18 @@ class Agent(AgentInterface):
         for network in self.networks.values():
             network.sync()
 
+    def close(self) -> None:
+        """
+        Release the resources held by the agent, such as the background thread of the batch prefetcher and the
+        memory (if it is not shared with other workers)
+        :return: None
+        """
+        if self.batch_prefetcher is not None:
+            self.batch_prefetcher.stop()
+        # a shared memory is closed through the shared memory scratchpad, after all the workers are done
+        if not self.shared_memory:
+            self.memory.close()
+
 
 
 
@@ -105,6 +105,13 @@ class AgentInterface(object):
         """
         raise NotImplementedError("")
 
+    def close(self) -> None:
+        """
+        Release the resources held by the agent when the run ends
+        :return: None
+        """
+        raise NotImplementedError("")
+
     def get_predictions(self, states: Dict, prediction_type: PredictionType) -> np.ndarray:
         """
         Get a prediction from the agent with regard to the requested prediction_type. If the agent cannot predict this
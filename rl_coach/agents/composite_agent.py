@@ -413,3 +413,10 @@ class CompositeAgent(AgentInterface):
         :return:
         """
         [agent.sync() for agent in self.agents.values()]
+
+    def close(self) -> None:
+        """
+        Release the resources held by all the agents in the group
+        :return: None
+        """
+        [agent.close() for agent in self.agents.values()]
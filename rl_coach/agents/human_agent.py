@@ -27,7 +27,6 @@ from rl_coach.base_parameters import AlgorithmParameters, NetworkParameters, Inp
     AgentParameters
 from rl_coach.core_types import ActionInfo
 from rl_coach.memories.episodic.episodic_experience_replay import EpisodicExperienceReplayParameters
-from pandas import to_pickle
 
 from rl_coach.exploration_policies.e_greedy import EGreedyParameters
 from rl_coach.logger import screen
@@ -100,9 +99,8 @@ class HumanAgent(Agent):
         return action
 
     def save_replay_buffer_and_exit(self):
-        replay_buffer_path = os.path.join(self.agent_logger.experiments_path, 'replay_buffer.p')
-        self.memory.tp = None
-        to_pickle(self.memory, replay_buffer_path)
+        replay_buffer_path = os.path.join(self.agent_logger.experiments_path, 'replay_buffer')
+        self.memory.save(replay_buffer_path)
         screen.log_title("Replay buffer was stored in {}".format(replay_buffer_path))
         exit()
 
@@ -26,6 +26,7 @@ from rl_coach.base_parameters import AlgorithmParameters, NetworkParameters, Age
     InputEmbedderParameters
 from rl_coach.core_types import RunPhase, EnvironmentSteps, Episode, StateType
 from rl_coach.memories.episodic.episodic_experience_replay import EpisodicExperienceReplayParameters, MemoryGranularity
+from rl_coach.memories.non_episodic.differentiable_neural_dictionary import DNDIndexType
 from rl_coach.schedules import ConstantSchedule
 
 from rl_coach.exploration_policies.e_greedy import EGreedyParameters
@@ -51,6 +52,7 @@ class NECAlgorithmParameters(AlgorithmParameters):
         self.new_value_shift_coefficient = 0.1
         self.number_of_knn = 50
         self.DND_key_error_threshold = 0
+        self.DND_index_type = DNDIndexType.Annoy
         self.num_consecutive_playing_steps = EnvironmentSteps(4)
         self.propagate_updates_to_DND = False
         self.n_step = 100
@@ -56,7 +56,7 @@ class ValueOptimizationAgent(Agent):
         # update errors in prioritized replay buffer
         importance_weights = None
         if isinstance(self.memory, PrioritizedExperienceReplay):
-            self.call_memory('update_priorities', (batch.info('idx'), TD_errors))
+            self.call_memory('update_priorities', (batch.info('idx'), TD_errors, batch.info('version')))
             importance_weights = batch.info('weight')
         return importance_weights
 
@@ -58,6 +58,9 @@ class Architecture(object):
     def accumulate_gradients(self, inputs, targets):
         pass
 
+    def get_internal_memory(self):
+        pass
+
     def apply_and_reset_gradients(self, gradients):
         pass
 
@@ -367,7 +367,7 @@ class TensorFlowArchitecture(Architecture):
             self.accumulated_gradients[ix] = grad * 0
 
     def accumulate_gradients(self, inputs, targets, additional_fetches=None, importance_weights=None,
-                             no_accumulation=False):
+                             no_accumulation=False, initial_internal_memory=None):
         """
         Runs a forward pass & backward pass, clips gradients if needed and accumulates them into the accumulation
         placeholders
@@ -379,6 +379,11 @@ class TensorFlowArchitecture(Architecture):
         :param no_accumulation: If is set to True, the gradients in the accumulated gradients placeholder will be
                                 replaced by the newely calculated gradients instead of accumulating the new gradients.
                                 This can speed up the function runtime by around 10%.
+        :param initial_internal_memory: The internal memory to start the input sequence from, as returned by
+                                        get_internal_memory (for example, a recurrent state stored with a replayed
+                                        sequence). If it is not given, an LSTM starts from its initial state. The
+                                        LSTM middleware processes the whole input batch as a single sequence, so this
+                                        is the state of a single sequence
         :return: A list containing the total loss and the individual network heads losses
         """
 
@@ -410,9 +415,18 @@ class TensorFlowArchitecture(Architecture):
 
             # feed the lstm state if necessary
             if self.middleware.__class__.__name__ == 'LSTMMiddleware':
-                # we can't always assume that we are starting from scratch here can we?
-                feed_dict[self.middleware.c_in] = self.middleware.c_init
-                feed_dict[self.middleware.h_in] = self.middleware.h_init
+                if initial_internal_memory is None:
+                    feed_dict[self.middleware.c_in] = self.middleware.c_init
+                    feed_dict[self.middleware.h_in] = self.middleware.h_init
+                else:
+                    c, h = initial_internal_memory
+                    if np.size(c) != self.middleware.c_init.size or np.size(h) != self.middleware.h_init.size:
+                        raise ValueError("The LSTM middleware processes the input batch as a single sequence, so the "
+                                         "initial internal memory should be the state of a single sequence, with {} "
+                                         "values in each of its parts. The given state parts have the shapes {} and "
+                                         "{}".format(self.middleware.c_init.size, np.shape(c), np.shape(h)))
+                    feed_dict[self.middleware.c_in] = np.reshape(c, self.middleware.c_init.shape)
+                    feed_dict[self.middleware.h_in] = np.reshape(h, self.middleware.h_init.shape)
 
             fetches = self.train_fetches + additional_fetches
             if self.ap.visualization.tensorboard:
@@ -661,4 +675,13 @@ class TensorFlowArchitecture(Architecture):
         # initialize LSTM hidden states
         if self.middleware.__class__.__name__ == 'LSTMMiddleware':
             self.curr_rnn_c_in = self.middleware.c_init
-            self.curr_rnn_h_in = self.middleware.h_init
\ No newline at end of file
+            self.curr_rnn_h_in = self.middleware.h_init
+
+    def get_internal_memory(self):
+        """
+        Get a copy of the internal memory used by the network. For example, an LSTM internal state
+        :return: the internal memory, or None if the network does not use any
+        """
+        if self.middleware.__class__.__name__ == 'LSTMMiddleware':
+            return self.curr_rnn_c_in[0].copy(), self.curr_rnn_h_in[0].copy()
+        return None
\ No newline at end of file
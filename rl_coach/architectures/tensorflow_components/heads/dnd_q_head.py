@@ -34,6 +34,7 @@ class DNDQHead(QHead):
         self.name = 'dnd_q_values_head'
         self.DND_size = agent_parameters.algorithm.dnd_size
         self.DND_key_error_threshold = agent_parameters.algorithm.DND_key_error_threshold
+        self.DND_index_type = agent_parameters.algorithm.DND_index_type
         self.l2_norm_added_delta = agent_parameters.algorithm.l2_norm_added_delta
         self.new_value_shift_coefficient = agent_parameters.algorithm.new_value_shift_coefficient
         self.number_of_nn = agent_parameters.algorithm.number_of_knn
@@ -54,22 +55,30 @@ class DNDQHead(QHead):
                 key_error_threshold=self.DND_key_error_threshold,
                 learning_rate=self.network_parameters.learning_rate,
                 num_neighbors=self.number_of_nn,
-                override_existing_keys=True)
+                override_existing_keys=True,
+                index_type=self.DND_index_type)
 
         # Retrieve info from DND dictionary
         # We assume that all actions have enough entries in the DND
+        # the dictionaries of all the actions are queried with a single call
+        result = tf.py_func(self.DND.query_all_actions,
+                            [input_layer, self.number_of_nn],
+                            [tf.float64, tf.float64, tf.int64])
+        result[0].set_shape((self.num_actions, None, self.number_of_nn, input_layer.get_shape()[-1]))
+        result[1].set_shape((self.num_actions, None, self.number_of_nn))
+        result[2].set_shape((self.num_actions, None, self.number_of_nn))
+        all_dnd_embeddings = tf.to_float(result[0])
+        all_dnd_values = tf.to_float(result[1])
+
         self.output = tf.transpose([
-            self._q_value(input_layer, action)
+            self._q_value(input_layer, all_dnd_embeddings, all_dnd_values, result[2], action)
             for action in range(self.num_actions)
         ])
 
-    def _q_value(self, input_layer, action):
-        result = tf.py_func(self.DND.query,
-                            [input_layer, action, self.number_of_nn],
-                            [tf.float64, tf.float64, tf.int64])
-        self.dnd_embeddings[action] = tf.to_float(result[0])
-        self.dnd_values[action] = tf.to_float(result[1])
-        self.dnd_indices[action] = result[2]
+    def _q_value(self, input_layer, all_dnd_embeddings, all_dnd_values, all_dnd_indices, action):
+        self.dnd_embeddings[action] = all_dnd_embeddings[action]
+        self.dnd_values[action] = all_dnd_values[action]
+        self.dnd_indices[action] = all_dnd_indices[action]
 
         # DND calculation
         square_diff = tf.square(self.dnd_embeddings[action] - tf.expand_dims(input_layer, 1))
@@ -119,3 +119,115 @@ class SharedRunningStats(object):
             return self.sess.run(self.clipped_obs, feed_dict={self.raw_obs: batch})
         else:
             return self.sess.run(self.normalized_obs, feed_dict={self.raw_obs: batch})
+
+
+class LocalSharedRunningStats(SharedRunningStats):
+    """
+    Running statistics which are updated and used locally, and are synced with the shared variables only once every
+    few pushes. The pushed samples are accumulated with Welford's algorithm in NumPy, and are merged with the
+    statistics that were last read from the shared variables, so pushing samples, reading the mean and the standard
+    deviation and normalizing do not run the session. Syncing adds the accumulated samples to the shared variables and
+    reads back the statistics of all the workers in a single session run.
+    """
+    def __init__(self, replicated_device=None, epsilon=1e-2, name="", create_ops=True, sync_every_n_pushes=100):
+        """
+        :param replicated_device: the device to place the shared variables on
+        :param epsilon: the initial count and sum of squares of the statistics, and the minimal variance
+        :param name: the name of the variables scope
+        :param create_ops: create the ops for an observation of shape [1] right away
+        :param sync_every_n_pushes: the number of pushes between two syncs of the local and the shared statistics
+        """
+        if sync_every_n_pushes <= 0:
+            raise ValueError("The number of pushes between syncs of the running stats must be a positive number. The "
+                             "given number is {}".format(sync_every_n_pushes))
+        self.sync_every_n_pushes = sync_every_n_pushes
+        # the statistics which are used, as (count, mean, sum of squared differences from the mean). they are None
+        # until the shared statistics are read for the first time
+        self._local_count = None
+        self._local_mean = None
+        self._local_m2 = None
+        self._reset_unsynced_statistics()
+        super().__init__(replicated_device, epsilon, name, create_ops)
+
+    def _reset_unsynced_statistics(self):
+        # the statistics of the samples which were pushed since the last sync
+        self._unsynced_count = 0
+        self._unsynced_mean = 0.
+        self._unsynced_m2 = 0.
+        self._num_unsynced_pushes = 0
+
+    @staticmethod
+    def _merge(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+        # the parallel variant of Welford's algorithm (Chan et al.)
+        count = count_a + count_b
+        delta = mean_b - mean_a
+        mean = mean_a + delta * (count_b / count)
+        m2 = m2_a + m2_b + np.square(delta) * (count_a * count_b / count)
+        return count, mean, m2
+
+    @property
+    def has_unsynced_samples(self):
+        return self._unsynced_count > 0
+
+    def sync(self):
+        """
+        Add the samples that were pushed since the last sync to the shared statistics, and replace the local
+        statistics with the shared statistics of all the workers
+        :return: None
+        """
+        if self.has_unsynced_samples:
+            shared_sum, shared_sum_squared, shared_count = self.sess.run(
+                [self._inc_sum, self._inc_sum_squared, self._inc_count],
+                feed_dict={
+                    self.new_sum: self._unsynced_count * self._unsynced_mean,
+                    self.new_sum_squared: self._unsynced_m2 + self._unsynced_count * np.square(self._unsynced_mean),
+                    self.newcount: np.array(self._unsynced_count, dtype='float64')
+                })
+        else:
+            shared_sum, shared_sum_squared, shared_count = self.sess.run([self._sum, self._sum_squared, self._count])
+        self._local_count = shared_count
+        self._local_mean = shared_sum / shared_count
+        self._local_m2 = shared_sum_squared - shared_count * np.square(self._local_mean)
+        self._reset_unsynced_statistics()
+
+    def push(self, x):
+        if self._local_count is None:
+            self.sync()
+        x = np.asarray(x, dtype='float64')
+        count = len(x)
+        mean = x.mean(axis=0)
+        m2 = np.square(x - mean).sum(axis=0)
+        self._unsynced_count, self._unsynced_mean, self._unsynced_m2 = \
+            self._merge(self._unsynced_count, self._unsynced_mean, self._unsynced_m2, count, mean, m2)
+        self._local_count, self._local_mean, self._local_m2 = \
+            self._merge(self._local_count, self._local_mean, self._local_m2, count, mean, m2)
+        if self._shape is None:
+            self._shape = x.shape
+
+        self._num_unsynced_pushes += 1
+        if self._num_unsynced_pushes >= self.sync_every_n_pushes:
+            self.sync()
+
+    @property
+    def n(self):
+        if self._local_count is None:
+            self.sync()
+        return self._local_count
+
+    @property
+    def mean(self):
+        if self._local_count is None:
+            self.sync()
+        return self._local_mean
+
+    @property
+    def std(self):
+        if self._local_count is None:
+            self.sync()
+        return np.sqrt(np.maximum(self._local_m2 / max(self._local_count - 1, 1), self.epsilon))
+
+    def normalize(self, batch):
+        normalized_batch = (np.asarray(batch, dtype='float64') - self.mean) / self.std
+        if self.clip_values is not None:
+            normalized_batch = np.clip(normalized_batch, self.clip_values[0], self.clip_values[1])
+        return normalized_batch
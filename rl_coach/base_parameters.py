@@ -141,6 +141,8 @@ class AlgorithmParameters(Parameters):
         self.rate_for_copying_weights_to_target = 1.0
         self.load_memory_from_file_path = None
         self.collect_new_data = True
+        # prepare this number of training batches ahead of time on a background thread. 0 disables prefetching
+        self.num_prefetched_batches = 0
 
         # HRL / HER related params
         self.in_action_space = None
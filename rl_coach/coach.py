@@ -28,7 +28,7 @@ import atexit
 import time
 import sys
 from rl_coach.base_parameters import Frameworks, VisualizationParameters, TaskParameters, DistributedTaskParameters
-from multiprocessing import Process
+from multiprocessing import Process, resource_tracker
 from multiprocessing.managers import BaseManager
 import subprocess
 from rl_coach.graph_managers.graph_manager import HumanPlayScheduleParameters, GraphManager
@@ -186,10 +186,13 @@ def start_graph(graph_manager: 'GraphManager', task_parameters: 'TaskParameters'
     graph_manager.create_graph(task_parameters)
 
     # let the adventure begin
-    if task_parameters.evaluate_only:
-        graph_manager.evaluate(EnvironmentSteps(sys.maxsize), keep_networks_in_sync=True)
-    else:
-        graph_manager.improve()
+    try:
+        if task_parameters.evaluate_only:
+            graph_manager.evaluate(EnvironmentSteps(sys.maxsize), keep_networks_in_sync=True)
+        else:
+            graph_manager.improve()
+    finally:
+        graph_manager.close()
 
 
 def main():
@@ -350,7 +353,11 @@ def main():
         # Shared memory
         class CommManager(BaseManager):
             pass
-        CommManager.register('SharedMemoryScratchPad', SharedMemoryScratchPad, exposed=['add', 'get', 'internal_call'])
+        CommManager.register('SharedMemoryScratchPad', SharedMemoryScratchPad,
+                             exposed=['add', 'get', 'internal_call', 'close'])
+        # the resource tracker is started before forking the workers, so that they all share it. the segments of a
+        # shared replay buffer are then removed by the tracker only if all the workers exit without closing it
+        resource_tracker.ensure_running()
         comm_manager = CommManager()
         comm_manager.start()
         shared_memory_scratchpad = comm_manager.SharedMemoryScratchPad()
@@ -396,6 +403,10 @@ def main():
         [w.join() for w in workers]
         if args.evaluation_worker:
             evaluation_worker.terminate()
+            evaluation_worker.join()
+
+        # the memories which are shared between the workers are only closed after all of them stopped using them
+        shared_memory_scratchpad.close()
 
 
 if __name__ == "__main__":
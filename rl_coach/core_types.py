@@ -21,6 +21,7 @@ from random import shuffle
 
 import numpy as np
 import copy
+import scipy.signal
 
 ActionType = Union[int, float, np.ndarray, List]
 GoalType = Union[None, np.ndarray]
@@ -137,6 +138,20 @@ class RunPhase(Enum):
 # transitions
 
 class Transition(object):
+    # the fields are kept in slots and read as plain attributes. a field which was not filled is left unset, so reading
+    # it falls back to __getattr__, which raises an exception explaining which field is missing
+    __slots__ = ('state', 'action', 'reward', 'total_return', 'next_state', 'game_over', '_info', '_action_info')
+
+    _missing_field_errors = {
+        'state': "The state was not filled by any of the modules between the environment and the agent",
+        'action': "The action was not filled by any of the modules between the environment and the agent",
+        'reward': "The reward was not filled by any of the modules between the environment and the agent",
+        'total_return': "The total_return was not filled by any of the modules between the environment and the "
+                        "agent.  Make sure that you are using an episodic experience replay.",
+        'game_over': "The done flag was not filled by any of the modules between the environment and the agent",
+        'next_state': "The next state was not filled by any of the modules between the environment and the agent"
+    }
+
     def __init__(self, state: Dict[str, np.ndarray]=None, action: ActionType=None, reward: RewardType=None,
                  next_state: Dict[str, np.ndarray]=None, game_over: bool=None, info: Dict=None):
         """
@@ -156,102 +171,109 @@ class Transition(object):
                           the execution of the action.
         :param info: A dictionary containing any additional information to be stored in the transition
         """
-
-        self._state = self.state = state
-        self._action = self.action = action
-        self._reward = self.reward = reward
-        self._total_return = self.total_return = None
+        if state is not None:
+            self.state = state
+        if action is not None:
+            self.action = action
+        if reward is not None:
+            self.reward = reward
         if not next_state:
             next_state = state
-        self._next_state = self._next_state = next_state
-        self._game_over = self.game_over = game_over
-        if info is None:
-            self.info = {}
-        else:
-            self.info = info
+        if next_state is not None:
+            self.next_state = next_state
+        if game_over is not None:
+            self.game_over = game_over
+        self._info = {} if info is None else info
+        self._action_info = None
+
+    def __getattr__(self, name):
+        # called only for fields which were not filled
+        if name in self._missing_field_errors:
+            raise Exception(self._missing_field_errors[name])
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def _filled_fields(self) -> Dict[str, Any]:
+        fields = {}
+        for name in self.__slots__:
+            try:
+                fields[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return fields
 
     def __repr__(self):
-        return str(self.__dict__)
-
-    @property
-    def state(self):
-        if self._state is None:
-            raise Exception("The state was not filled by any of the modules between the environment and the agent")
-        return self._state
-
-    @state.setter
-    def state(self, val):
-        self._state = val
-
-    @property
-    def action(self):
-        if self._action is None:
-            raise Exception("The action was not filled by any of the modules between the environment and the agent")
-        return self._action
-
-    @action.setter
-    def action(self, val):
-        self._action = val
-
-    @property
-    def reward(self):
-
-        if self._reward is None:
-            raise Exception("The reward was not filled by any of the modules between the environment and the agent")
-        return self._reward
-
-    @reward.setter
-    def reward(self, val):
-        self._reward = val
-
-    @property
-    def total_return(self):
-        if self._total_return is None:
-            raise Exception("The total_return was not filled by any of the modules between the environment and the "
-                            "agent.  Make sure that you are using an episodic experience replay.")
-        return self._total_return
-
-    @total_return.setter
-    def total_return(self, val):
-        self._total_return = val
+        fields = self._filled_fields()
+        fields['info'] = self.info
+        del fields['_info'], fields['_action_info']
+        return str(fields)
 
     @property
-    def game_over(self):
-        if self._game_over is None:
-            raise Exception("The done flag was not filled by any of the modules between the environment and the agent")
-        return self._game_over
-
-    @game_over.setter
-    def game_over(self, val):
-        self._game_over = val
-
-    @property
-    def next_state(self):
-        if self._next_state is None:
-            raise Exception("The next state was not filled by any of the modules between the environment and the agent")
-        return self._next_state
-
-    @next_state.setter
-    def next_state(self, val):
-        self._next_state = val
-
-    def add_info(self, new_info: Dict[str, Any]) -> None:
-        if not new_info.keys().isdisjoint(self.info.keys()):
-            raise ValueError("The new info dictionary can not be appended to the existing info dictionary since there "
-                             "are overlapping keys between the two. old keys: {}, new keys: {}"
-                             .format(self.info.keys(), new_info.keys()))
-        self.info.update(new_info)
+    def info(self) -> Dict[str, Any]:
+        if self._action_info is not None:
+            # the action info record is merged into the info dictionary only when the dictionary is needed
+            self._info.update(self._action_info.to_dict())
+            self._action_info = None
+        return self._info
+
+    @info.setter
+    def info(self, val: Dict[str, Any]) -> None:
+        self._info = val
+        self._action_info = None
+
+    def add_info(self, new_info: Union[Dict[str, Any], 'ActionInfo']) -> None:
+        """
+        Add values to the info dictionary of the transition
+        :param new_info: a dictionary of values, or an ActionInfo record. the fields of an ActionInfo record are added
+                         under their names, and the record is only merged into the info dictionary when the
+                         dictionary is read, so it should not be changed after it is added
+        :return: None
+        """
+        if isinstance(new_info, ActionInfo) and self._action_info is None:
+            new_keys = ActionInfo.__slots__
+            if self._info.keys().isdisjoint(new_keys):
+                self._action_info = new_info
+                return
+        else:
+            if isinstance(new_info, ActionInfo):
+                new_info = new_info.to_dict()
+            new_keys = new_info.keys()
+            if new_keys.isdisjoint(self.info.keys()):
+                self._info.update(new_info)
+                return
+        raise ValueError("The new info dictionary can not be appended to the existing info dictionary since there "
+                         "are overlapping keys between the two. old keys: {}, new keys: {}"
+                         .format(self.info.keys(), new_keys))
 
     def __copy__(self):
-        new_transition = type(self)()
-        new_transition.__dict__.update(self.__dict__)
-        new_transition.state = copy.copy(new_transition.state)
-        new_transition.next_state = copy.copy(new_transition.next_state)
-        new_transition.info = copy.copy(new_transition.info)
+        new_transition = type(self).__new__(type(self))
+        for name, value in self._filled_fields().items():
+            setattr(new_transition, name, value)
+        for name in ['state', 'next_state', '_info']:
+            if name in new_transition._filled_fields():
+                setattr(new_transition, name, copy.copy(getattr(new_transition, name)))
         return new_transition
 
+    def __getstate__(self):
+        return None, self._filled_fields()
+
+    def __setstate__(self, state):
+        # the state of a slotted object is a pair of a dictionary and the slots values. transitions which were pickled
+        # before the fields were kept in slots have only a dictionary, with the fields names prefixed by an underscore
+        if isinstance(state, tuple):
+            state = state[1]
+        self._action_info = None
+        for name, value in state.items():
+            if name == 'info':
+                name = '_info'
+            elif name[1:] in self._missing_field_errors:
+                name = name[1:]
+            if value is not None or name.startswith('_'):
+                setattr(self, name, value)
+
 
 class EnvResponse(object):
+    __slots__ = ('next_state', 'reward', 'game_over', 'goal', 'info')
+
     def __init__(self, next_state: Dict[str, ObservationType], reward: RewardType, game_over: bool, info: Dict=None,
                  goal: ObservationType=None):
         """
@@ -265,49 +287,33 @@ class EnvResponse(object):
         :param info: any additional info from the environment
         :param goal: a goal defined by the environment
         """
-        self._next_state = self.next_state = next_state
-        self._reward = self.reward = reward
-        self._game_over = self.game_over = game_over
-        self._goal = self.goal = goal
+        self.next_state = next_state
+        self.reward = reward
+        self.game_over = game_over
+        self.goal = goal
         if info is None:
             self.info = {}
         else:
             self.info = info
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({name: getattr(self, name) for name in self.__slots__})
 
-    @property
-    def next_state(self):
-        return self._next_state
-
-    @next_state.setter
-    def next_state(self, val):
-        self._next_state = val
-
-    @property
-    def reward(self):
-        return self._reward
-
-    @reward.setter
-    def reward(self, val):
-        self._reward = val
-
-    @property
-    def game_over(self):
-        return self._game_over
-
-    @game_over.setter
-    def game_over(self, val):
-        self._game_over = val
-
-    @property
-    def goal(self):
-        return self._goal
-
-    @goal.setter
-    def goal(self, val):
-        self._goal = val
+    def __copy__(self):
+        new_env_response = type(self).__new__(type(self))
+        for name in self.__slots__:
+            setattr(new_env_response, name, getattr(self, name))
+        new_env_response.next_state = copy.copy(new_env_response.next_state)
+        new_env_response.info = copy.copy(new_env_response.info)
+        return new_env_response
+
+    def __setstate__(self, state):
+        # env responses which were pickled before the fields were kept in slots have only a dictionary, with the
+        # fields names prefixed by an underscore
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name.lstrip('_'), value)
 
     def add_info(self, info: Dict[str, Any]) -> None:
         if info.keys().isdisjoint(self.info.keys()):
@@ -320,6 +326,9 @@ class ActionInfo(object):
     """
     Action info is a class that holds an action and various additional information details about it
     """
+    __slots__ = ('action', 'action_probability', 'action_value', 'state_value', 'max_action_value',
+                 'action_intrinsic_reward')
+
     def __init__(self, action: ActionType, action_probability: float=0,
                  action_value: float=0., state_value: float=0., max_action_value: float=None,
                  action_intrinsic_reward: float=0):
@@ -344,14 +353,56 @@ class ActionInfo(object):
             self.max_action_value = max_action_value
         self.action_intrinsic_reward = action_intrinsic_reward
 
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: a dictionary from the names of the fields of the action info to their values
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def __dict__(self) -> Dict[str, Any]:
+        # kept for code which reads the fields of the action info through its __dict__
+        return self.to_dict()
+
+    def __repr__(self):
+        return str(self.to_dict())
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def stack_values(values: List[Any]) -> np.ndarray:
+    """
+    Stack a list of values into a single array. Values which can write themselves to a given array (e.g. the LazyStack
+    objects created by the ObservationStackingFilter) are written directly to the stacked array, instead of being
+    converted to separate arrays which are then copied again.
+    :param values: the values to stack. the values must all have the same shape
+    :return: the stacked array
+    """
+    if not hasattr(values[0], 'copy_to'):
+        return np.array([np.array(value) for value in values])
+    stacked_values = np.empty((len(values),) + values[0].shape, dtype=values[0].dtype)
+    for i, value in enumerate(values):
+        if hasattr(value, 'copy_to'):
+            value.copy_to(stacked_values[i])
+        else:
+            stacked_values[i] = value
+    return stacked_values
+
 
 class Batch(object):
-    def __init__(self, transitions: List[Transition]):
+    def __init__(self, transitions: List[Transition], info: Dict[str, np.ndarray]=None):
         """
         A wrapper around a list of transitions that helps extracting batches of parameters from it.
         For example, one can extract a list of states corresponding to the list of transitions.
         The class uses lazy evaluation in order to return each of the available parameters.
         :param transitions: a list of transitions to extract the batch from
+        :param info: arrays of additional values for the transitions in the batch, which are not part of the
+                     transitions info dictionaries (for example, the values returned by Memory.sample_with_info).
+                     these will be returned by the info method
         """
         self.transitions = transitions
         self._states = {}
@@ -362,6 +413,8 @@ class Batch(object):
         self._next_states = {}
         self._goals = None
         self._info = {}
+        if info is not None:
+            self._info = {k: np.asarray(v) for k, v in info.items()}
 
     def slice(self, start, end) -> None:
         """
@@ -404,7 +457,8 @@ class Batch(object):
         self._game_overs = None
         self._next_states = {}
         self._goals = None
-        self._info = {}
+        # the info values may not be part of the transitions, so they are reordered instead of being dropped
+        self._info = {k: v[batch_order] for k, v in self._info.items()}
 
         # This seems to be slower
         # for k, v in self._states.items():
@@ -438,7 +492,7 @@ class Batch(object):
         # addition to the current_state, so that all the inputs of the network will be filled)
         for key in set(fetches).intersection(self.transitions[0].state.keys()):
             if key not in self._states.keys():
-                self._states[key] = np.array([np.array(transition.state[key]) for transition in self.transitions])
+                self._states[key] = stack_values([transition.state[key] for transition in self.transitions])
             if expand_dims:
                 current_states[key] = np.expand_dims(self._states[key], -1)
             else:
@@ -508,7 +562,7 @@ class Batch(object):
         # addition to the current_state, so that all the inputs of the network will be filled)
         for key in set(fetches).intersection(self.transitions[0].next_state.keys()):
             if key not in self._next_states.keys():
-                self._next_states[key] = np.array([np.array(transition.next_state[key]) for transition in self.transitions])
+                self._next_states[key] = stack_values([transition.next_state[key] for transition in self.transitions])
             if expand_dims:
                 next_states[key] = np.expand_dims(self._next_states[key], -1)
             else:
@@ -566,6 +620,245 @@ class Batch(object):
         self.transitions[key] = item
 
 
+class ColumnarBatch(Batch):
+    def __init__(self, states: Dict[str, np.ndarray], actions: np.ndarray, rewards: np.ndarray,
+                 game_overs: np.ndarray, next_states: Dict[str, np.ndarray], transitions_info: np.ndarray=None,
+                 info: Dict[str, np.ndarray]=None):
+        """
+        A batch which is built directly from arrays of values (for example, the columns gathered from a column
+        storage), instead of from a list of transitions. The values are returned without any per-transition work,
+        and shuffling or slicing the batch only changes the order of an index array into the columns.
+        The transitions are built only if they are explicitly requested (e.g. through batch.transitions or
+        batch[i]), or for values which are not kept in the columns, such as the total returns and the goals.
+        :param states: a dictionary from the state keys to arrays holding the values of all the transitions
+        :param actions: an array of the actions of the transitions
+        :param rewards: an array of the rewards of the transitions
+        :param game_overs: an array of the game over flags of the transitions
+        :param next_states: a dictionary from the next state keys to arrays holding the values of all the transitions
+        :param transitions_info: an object array of the info dictionaries of the transitions
+        :param info: arrays of additional values for the transitions in the batch, which are not part of the
+                     transitions info dictionaries. these will be returned by the info method
+        """
+        self._columns = {'action': np.asarray(actions), 'reward': np.asarray(rewards),
+                         'game_over': np.asarray(game_overs)}
+        self._state_columns = states
+        self._next_state_columns = next_states
+        self._num_rows = len(self._columns['reward'])
+        if transitions_info is None:
+            transitions_info = np.empty(self._num_rows, dtype=object)
+            transitions_info[:] = [{} for _ in range(self._num_rows)]
+        self._transitions_info = transitions_info
+        self._info_columns = {}
+        if info is not None:
+            self._info_columns = {k: np.asarray(v) for k, v in info.items()}
+        # None (all the rows in their order), a slice or an array of the rows of the batch
+        self._indices = None
+        self._reset_cache()
+
+    def _reset_cache(self) -> None:
+        self._transitions = None
+        self._states = {}
+        self._actions = None
+        self._rewards = None
+        self._total_returns = None
+        self._game_overs = None
+        self._next_states = {}
+        self._goals = None
+        self._info = {}
+
+    def _select(self, values: np.ndarray) -> np.ndarray:
+        if self._indices is None:
+            return values
+        return values[self._indices]
+
+    def _expand(self, values: np.ndarray, expand_dims: bool) -> np.ndarray:
+        if expand_dims:
+            return np.expand_dims(values, -1)
+        return values
+
+    @property
+    def transitions(self) -> List[Transition]:
+        """
+        :return: the transitions of the batch. the transitions are built on the first call, and their states are views
+                 of the columns of the batch
+        """
+        if self._transitions is None:
+            rows = np.arange(self._num_rows)[self._indices] if self._indices is not None else range(self._num_rows)
+            self._transitions = [
+                Transition(state={k: v[row] for k, v in self._state_columns.items()},
+                           action=self._columns['action'][row],
+                           reward=self._columns['reward'][row],
+                           next_state={k: v[row] for k, v in self._next_state_columns.items()},
+                           game_over=self._columns['game_over'][row],
+                           info=self._transitions_info[row])
+                for row in rows
+            ]
+        return self._transitions
+
+    def slice(self, start, end) -> None:
+        """
+        Keep a slice from the batch and discard the rest of the batch. The columns of the batch are not copied.
+        :param start: the start index in the slice
+        :param end: the end index in the slice
+        :return: None
+        """
+        if self._indices is None or isinstance(self._indices, slice):
+            rows = range(self._num_rows)[self._indices if self._indices is not None else slice(None)][start:end]
+            self._indices = slice(rows.start, rows.stop, rows.step)
+        else:
+            self._indices = self._indices[start:end]
+
+        # the values which were already extracted are kept as views of the slice
+        for cache in [self._states, self._next_states, self._info]:
+            for k, v in cache.items():
+                cache[k] = v[start:end]
+        for name in ['_transitions', '_actions', '_rewards', '_total_returns', '_game_overs', '_goals']:
+            if getattr(self, name) is not None:
+                setattr(self, name, getattr(self, name)[start:end])
+
+    def shuffle(self) -> None:
+        """
+        Shuffle all the transitions in the batch. Only the order of the rows of the batch is changed, and the values
+        are gathered again from the columns when they are requested.
+        :return: None
+        """
+        batch_order = np.random.permutation(self.size)
+        if self._indices is None:
+            self._indices = batch_order
+        else:
+            self._indices = np.arange(self._num_rows)[self._indices][batch_order]
+        self._reset_cache()
+
+    def states(self, fetches: List[str], expand_dims=False) -> Dict[str, np.ndarray]:
+        current_states = {}
+        for key in set(fetches).intersection(self._state_columns.keys()):
+            if key not in self._states.keys():
+                self._states[key] = self._select(self._state_columns[key])
+            current_states[key] = self._expand(self._states[key], expand_dims)
+        return current_states
+
+    def next_states(self, fetches: List[str], expand_dims=False) -> Dict[str, np.ndarray]:
+        next_states = {}
+        for key in set(fetches).intersection(self._next_state_columns.keys()):
+            if key not in self._next_states.keys():
+                self._next_states[key] = self._select(self._next_state_columns[key])
+            next_states[key] = self._expand(self._next_states[key], expand_dims)
+        return next_states
+
+    def actions(self, expand_dims=False) -> np.ndarray:
+        if self._actions is None:
+            self._actions = self._select(self._columns['action'])
+        return self._expand(self._actions, expand_dims)
+
+    def rewards(self, expand_dims=False) -> np.ndarray:
+        if self._rewards is None:
+            self._rewards = self._select(self._columns['reward'])
+        return self._expand(self._rewards, expand_dims)
+
+    def game_overs(self, expand_dims=False) -> np.ndarray:
+        if self._game_overs is None:
+            self._game_overs = self._select(self._columns['game_over'])
+        return self._expand(self._game_overs, expand_dims)
+
+    def info(self, key, expand_dims=False) -> np.ndarray:
+        if key not in self._info.keys():
+            if key not in self._info_columns.keys():
+                self._info_columns[key] = np.array([info[key] for info in self._transitions_info])
+            self._info[key] = self._select(self._info_columns[key])
+        return self._expand(self._info[key], expand_dims)
+
+    @property
+    def size(self) -> int:
+        if self._indices is None:
+            return self._num_rows
+        if isinstance(self._indices, slice):
+            return len(range(self._num_rows)[self._indices])
+        return len(self._indices)
+
+    def __setitem__(self, key, item):
+        raise ValueError("The transitions of a columnar batch cannot be replaced")
+
+
+class SequenceBatch(object):
+    def __init__(self, transitions: List[List[Transition]], mask: np.ndarray, burn_in: int=0,
+                 recurrent_states: List[np.ndarray]=None):
+        """
+        A batch of sequences of consecutive transitions, for training recurrent networks. The values of the
+        transitions are returned as arrays of shape [batch size, sequence length, ...], where the padding steps
+        (the steps after the end of an episode which is shorter than the sequence length) are zeroed.
+        :param transitions: a list of sequences of transitions. all the sequences should have the same length, and the
+                            padding steps may hold any transition
+        :param mask: a boolean array of shape [batch size, sequence length], which is False in the padding steps
+        :param burn_in: the number of first steps of each sequence, which should only be used for updating the
+                        recurrent state of the network before training on the rest of the sequence
+        :param recurrent_states: the recurrent state of the network at the beginning of each sequence, as a list of
+                                 arrays of shape [batch size, ...], one for each part of the state (e.g. the c and h of
+                                 an LSTM). None if the recurrent states were not stored with the transitions
+        """
+        self.transitions = transitions
+        self.mask = mask
+        self.burn_in = burn_in
+        self.recurrent_states = recurrent_states
+        self._batch = Batch([transition for sequence in transitions for transition in sequence])
+
+    @property
+    def size(self) -> int:
+        """
+        :return: the number of sequences in the batch
+        """
+        return len(self.transitions)
+
+    @property
+    def sequence_length(self) -> int:
+        """
+        :return: the length of the sequences in the batch, including the burn in steps
+        """
+        return self.mask.shape[1]
+
+    def _to_sequences(self, values: np.ndarray) -> np.ndarray:
+        values = np.reshape(values, self.mask.shape + values.shape[1:])
+        values[~self.mask] = 0
+        return values
+
+    def states(self, fetches: List[str]) -> Dict[str, np.ndarray]:
+        """
+        :param fetches: the keys of the state dictionary to extract
+        :return: a dictionary containing a batch of sequences of values correponding to each of the given fetches keys
+        """
+        return {k: self._to_sequences(v) for k, v in self._batch.states(fetches).items()}
+
+    def next_states(self, fetches: List[str]) -> Dict[str, np.ndarray]:
+        """
+        :param fetches: the keys of the next state dictionary to extract
+        :return: a dictionary containing a batch of sequences of values correponding to each of the given fetches keys
+        """
+        return {k: self._to_sequences(v) for k, v in self._batch.next_states(fetches).items()}
+
+    def actions(self) -> np.ndarray:
+        """
+        :return: a numpy array containing the sequences of actions
+        """
+        return self._to_sequences(self._batch.actions())
+
+    def rewards(self) -> np.ndarray:
+        """
+        :return: a numpy array containing the sequences of rewards
+        """
+        return self._to_sequences(self._batch.rewards())
+
+    def total_returns(self) -> np.ndarray:
+        """
+        :return: a numpy array containing the sequences of total returns
+        """
+        return self._to_sequences(self._batch.total_returns())
+
+    def game_overs(self) -> np.ndarray:
+        """
+        :return: a numpy array containing the sequences of game over flags
+        """
+        return self._to_sequences(self._batch.game_overs())
+
+
 class TotalStepsCounter(object):
     """
     A wrapper around a dictionary counting different StepMethods steps done.
@@ -637,23 +930,51 @@ class Episode(object):
     def get_first_transition(self):
         return self.get_transition(0) if self.length() > 0 else None
 
+    @staticmethod
+    def calculate_discounted_returns(rewards: np.ndarray, discount: float, n_step: int=-1,
+                                     bootstraps: np.ndarray=None) -> np.ndarray:
+        """
+        Calculate the discounted n-step returns of a sequence of rewards in linear time. The full discounted returns
+        are calculated with a single reverse scan (an IIR filter), and the n-step returns are taken as the difference
+        between the full return at step t and the discounted full return at step t + n.
+        :param rewards: the rewards of the episode, with the steps on the first axis
+        :param discount: the discount factor
+        :param n_step: the number of future steps to sum the rewards over. -1 for summing until the end of the episode
+        :param bootstraps: optional values to bootstrap the n-step returns from. the return at step t is bootstrapped
+                           from the value at step t + n, and the returns of the last n steps are not bootstrapped
+        :return: the discounted returns of each step
+        """
+        rewards = np.asarray(rewards, dtype='float')
+        length = len(rewards)
+        if n_step == -1 or n_step > length:
+            n_step = length
+        if length == 0:
+            return rewards
+
+        total_return = scipy.signal.lfilter([1], [1, -discount], rewards[::-1], axis=0)[::-1]
+        if n_step < length:
+            total_return[:length - n_step] -= discount ** n_step * total_return[n_step:]
+
+        if bootstraps is not None:
+            bootstraps = np.asarray(bootstraps, dtype='float')
+            total_return[:length - n_step] += discount ** n_step * bootstraps[n_step:]
+
+        return total_return
+
     def update_returns(self):
-        if self.n_step == -1 or self.n_step > self.length():
-            self.n_step = self.length()
+        # the episode parameter is kept as is, since the episode may still grow
+        n_step = self.n_step
+        if n_step == -1 or n_step > self.length():
+            n_step = self.length()
         rewards = np.array([t.reward for t in self.transitions])
-        rewards = rewards.astype('float')
-        total_return = rewards.copy()
-        current_discount = self.discount
-        for i in range(1, self.n_step):
-            total_return += current_discount * np.pad(rewards[i:], (0, i), 'constant', constant_values=0)
-            current_discount *= self.discount
 
         # calculate the bootstrapped returns
+        bootstraps = None
         if self.bootstrap_total_return_from_old_policy:
-            bootstraps = np.array([np.squeeze(t.info['max_action_value']) for t in self.transitions[self.n_step:]])
-            bootstrapped_return = total_return + current_discount * np.pad(bootstraps, (0, self.n_step), 'constant',
-                                                                           constant_values=0)
-            total_return = bootstrapped_return
+            bootstraps = np.zeros(self.length())
+            bootstraps[n_step:] = [np.squeeze(t.info['max_action_value']) for t in self.transitions[n_step:]]
+
+        total_return = self.calculate_discounted_returns(rewards, self.discount, n_step, bootstraps)
 
         for transition_idx in range(self.length()):
             self.transitions[transition_idx].total_return = total_return[transition_idx]
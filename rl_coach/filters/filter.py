@@ -19,12 +19,18 @@ from collections import OrderedDict
 from copy import deepcopy
 from typing import Dict, Union, List
 
+import numpy as np
+
 from rl_coach.spaces import ActionSpace, RewardSpace, ObservationSpace
 from rl_coach.core_types import EnvResponse, ActionInfo, Transition
 from rl_coach.utils import force_list
 
 
 class Filter(object):
+    # filters which change their input data in place (instead of returning new data) should set this to True, so
+    # that the filters pipeline will give them a copy of the data
+    modifies_input_in_place = False
+
     def __init__(self):
         pass
 
@@ -102,7 +108,9 @@ class OutputFilter(Filter):
 
     def filter(self, action_info: ActionInfo) -> ActionInfo:
         """
-        A wrapper around _filter which first copies the action_info so that we don't change the original one
+        A wrapper around _filter which first copies the action_info so that we don't change the original one.
+        Only the action_info itself is copied, since the action filters return new actions instead of changing the
+        given ones. Filters which change the given action declare it with modifies_input_in_place, and get a copy.
         This function should not be updated!
         :param action_info: the input action_info
         :return: the filtered action_info
@@ -112,9 +120,11 @@ class OutputFilter(Filter):
                             "Instead get a duplicate from it by calling __call__.")
         if len(self.action_filters.values()) == 0:
             return action_info
-        filtered_action_info = copy.deepcopy(action_info)
+        filtered_action_info = copy.copy(action_info)
         filtered_action = filtered_action_info.action
         for filter in reversed(self.action_filters.values()):
+            if filter.modifies_input_in_place:
+                filtered_action = copy.deepcopy(filtered_action)
             filtered_action = filter.filter(filtered_action)
 
         filtered_action_info.action = filtered_action
@@ -123,7 +133,8 @@ class OutputFilter(Filter):
 
     def reverse_filter(self, action_info: ActionInfo) -> ActionInfo:
         """
-        A wrapper around _reverse_filter which first copies the action_info so that we don't change the original one
+        A wrapper around _reverse_filter which first copies the action_info so that we don't change the original one.
+        As in filter, only the action_info itself is copied.
         This function should not be updated!
         :param action_info: the input action_info
         :return: the filtered action_info
@@ -131,10 +142,12 @@ class OutputFilter(Filter):
         if self.i_am_a_reference_filter:
             raise Exception("The filter being used is a reference filter. It is not to be used directly. "
                             "Instead get a duplicate from it by calling __call__.")
-        filtered_action_info = copy.deepcopy(action_info)
+        filtered_action_info = copy.copy(action_info)
         filtered_action = filtered_action_info.action
         for filter in self.action_filters.values():
             filter.validate_output_action(filtered_action)
+            if filter.modifies_input_in_place:
+                filtered_action = copy.deepcopy(filtered_action)
             filtered_action = filter.reverse_filter(filtered_action)
 
         filtered_action_info.action = filtered_action
@@ -205,6 +218,11 @@ class InputFilter(Filter):
     """
     An input filter is a module that filters the input from an environment to the agent.
     """
+    # the minimal number of values which are stacked into a single batch for the filters which support batching.
+    # fewer values are filtered one by one, since stacking a few image observations is not faster, unless a filter
+    # requires the whole batch
+    MIN_STACKED_BATCH_SIZE = 16
+
     def __init__(self, observation_filters: Dict[str, Dict[str, 'ObservationFilter']]=None,
                  reward_filters: Dict[str, 'RewardFilter']=None,
                  is_a_reference_filter: bool=False):
@@ -243,23 +261,66 @@ class InputFilter(Filter):
         [f.set_session(sess) for f in self.reward_filters.values()]
         [[f.set_session(sess) for f in filters.values()] for filters in self.observation_filters.values()]
 
+    @classmethod
+    def _filter_values(cls, filters: List[Filter], values: List, update_internal_state: bool) -> List:
+        """
+        Filter the values of a single observation, or the rewards, of all the given data points with a chain of filters.
+        When there are enough values, filters which support batching get all the values stacked into a single array of
+        shape [N, ...], which is kept for the following filters as long as they support batching as well. Filters which
+        require the whole batch (e.g. normalization filters) always get all the values stacked, since their results
+        depend on all of them. Other filters get the values one by one.
+        :param filters: the filters to apply, by order
+        :param values: the value of each data point
+        :param update_internal_state: should the filters' internal state change due to this call
+        :return: the filtered value of each data point
+        """
+        is_stacking_faster = len(values) >= cls.MIN_STACKED_BATCH_SIZE
+        batch = None
+        for filter in filters:
+            if filter.supports_batching and (is_stacking_faster or filter.requires_whole_batch):
+                if batch is None:
+                    if len(set(np.shape(value) for value in values)) > 1:
+                        # values with different shapes can't be stacked, so each of them is filtered as a batch of one
+                        values = [filter.filter_batch(np.asarray(value)[np.newaxis], update_internal_state)[0]
+                                  for value in values]
+                        continue
+                    batch = np.stack(values)
+                if filter.modifies_input_in_place:
+                    batch = batch.copy()
+                batch = filter.filter_batch(batch, update_internal_state)
+            else:
+                if batch is not None:
+                    values = list(batch)
+                    batch = None
+                if filter.modifies_input_in_place:
+                    values = copy.deepcopy(values)
+                values = [filter.filter(value, update_internal_state) for value in values]
+        if batch is not None:
+            values = list(batch)
+        return values
+
     def filter(self, unfiltered_data: Union[EnvResponse, List[EnvResponse], Transition, List[Transition]],
-               update_internal_state: bool=True, deep_copy: bool=True) -> Union[List[EnvResponse], List[Transition]]:
+               update_internal_state: bool=True, deep_copy: bool=False) -> Union[List[EnvResponse], List[Transition]]:
         """
-        A wrapper around _filter which first copies the env_response so that we don't change the original one
+        A wrapper around _filter which first copies the env_response so that we don't change the original one.
+        By default, only the containers which the filtering changes are copied - the env responses or transitions
+        and their state and info dictionaries. The observations themselves are not copied, since the filters return
+        new observations instead of changing the given ones. Filters which change the given observation declare it
+        with modifies_input_in_place, and get a copy of it.
         This function should not be updated!
         :param unfiltered_data: the input data
         :param update_internal_state: should the filter's internal state change due to this call
+        :param deep_copy: copy all the data, including the observations which are not changed by the filters. this is
+                          only needed if the caller changes the observations in place after filtering them
         :return: the filtered env_response
         """
         if self.i_am_a_reference_filter:
             raise Exception("The filter being used is a reference filter. It is not to be used directly. "
                             "Instead get a duplicate from it by calling __call__.")
         if deep_copy:
-            filtered_data = copy.deepcopy(unfiltered_data)
+            filtered_data = force_list(copy.deepcopy(unfiltered_data))
         else:
-            filtered_data = [copy.copy(t) for t in unfiltered_data]
-        filtered_data = force_list(filtered_data)
+            filtered_data = [copy.copy(data) for data in force_list(unfiltered_data)]
 
         # TODO: implement observation space validation
         # filter observations
@@ -274,26 +335,18 @@ class InputFilter(Filter):
         for state_object_list in state_objects_to_filter:
             for observation_name, filters in self._observation_filters.items():
                 if observation_name in state_object_list[0].keys():
-                    for filter in filters.values():
-                        data_to_filter = [state_object[observation_name] for state_object in state_object_list]
-                        if filter.supports_batching:
-                            filtered_observations = filter.filter(
-                                data_to_filter, update_internal_state=update_internal_state)
-                        else:
-                            filtered_observations = []
-                            for data_point in data_to_filter:
-                                filtered_observations.append(filter.filter(
-                                    data_point, update_internal_state=update_internal_state))
-
-                        for i, state_object in enumerate(state_object_list):
-                            state_object[observation_name] = filtered_observations[i]
+                    filtered_observations = self._filter_values(
+                        filters.values(), [state_object[observation_name] for state_object in state_object_list],
+                        update_internal_state)
+                    for i, state_object in enumerate(state_object_list):
+                        state_object[observation_name] = filtered_observations[i]
 
         # filter reward
-        for f in filtered_data:
-            filtered_reward = f.reward
-            for filter in self._reward_filters.values():
-                filtered_reward = filter.filter(filtered_reward, update_internal_state)
-            f.reward = filtered_reward
+        if len(self._reward_filters) > 0:
+            filtered_rewards = self._filter_values(self._reward_filters.values(), [f.reward for f in filtered_data],
+                                                   update_internal_state)
+            for f, filtered_reward in zip(filtered_data, filtered_rewards):
+                f.reward = filtered_reward
 
         return filtered_data
 
@@ -337,6 +390,14 @@ class InputFilter(Filter):
             [observation_filter.reset() for observation_filter in curr_observation_filters.values()]
         [reward_filter.reset() for reward_filter in self._reward_filters.values()]
 
+    def is_empty(self) -> bool:
+        """
+        :return: True if the filter holds no observation filters and no reward filters, so filtering does not change
+                 the filtered data
+        """
+        return len(self._reward_filters) == 0 and \
+            all(len(filters) == 0 for filters in self._observation_filters.values())
+
     @property
     def observation_filters(self) -> Dict[str, Dict[str, 'ObservationFilter']]:
         return self._observation_filters
@@ -34,11 +34,16 @@ class ObservationClippingFilter(ObservationFilter):
         super().__init__()
         self.clip_min = clipping_low
         self.clip_max = clipping_high
+        self.supports_batching = True
 
     def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
         observation = np.clip(observation, self.clip_min, self.clip_max)
 
         return observation
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # the filter is applied to each value separately, so a batch is filtered the same way as a single observation
+        return self.filter(observations, update_internal_state)
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         return input_observation_space
@@ -43,6 +43,7 @@ class ObservationCropFilter(ObservationFilter):
 
         self.crop_low = crop_low
         self.crop_high = crop_high
+        self.supports_batching = True
 
         for h, l in zip(crop_high, crop_low):
             if h < l and h != -1:
@@ -74,14 +75,17 @@ class ObservationCropFilter(ObservationFilter):
             raise ValueError("The cropping indices are outside of the observation space")
 
     def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
+        return self.filter_batch(observation[np.newaxis], update_internal_state)[0]
+
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
         # replace -1 with the max size
-        crop_high = self._replace_negative_one_in_crop_size(self.crop_high, observation.shape)
-        crop_low = self._replace_negative_one_in_crop_size(self.crop_low, observation.shape)
+        crop_high = self._replace_negative_one_in_crop_size(self.crop_high, observations.shape[1:])
+        crop_low = self._replace_negative_one_in_crop_size(self.crop_low, observations.shape[1:])
 
-        # crop
-        indices = [slice(i, j) for i, j in zip(crop_low, crop_high)]
-        observation = observation[indices]
-        return observation
+        # crop all the observations in the batch
+        indices = [slice(None)] + [slice(i, j) for i, j in zip(crop_low, crop_high)]
+        observations = observations[tuple(indices)]
+        return observations
 
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         # replace -1 with the max size
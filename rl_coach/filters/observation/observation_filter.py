@@ -14,6 +14,8 @@
 # limitations under the License.
 #
 
+import numpy as np
+
 from rl_coach.filters.filter import Filter
 from rl_coach.spaces import ObservationSpace
 
@@ -21,7 +23,24 @@ from rl_coach.spaces import ObservationSpace
 class ObservationFilter(Filter):
     def __init__(self):
         super().__init__()
+        # filters which support batching implement filter_batch, which filters the observations of several data
+        # points at once
         self.supports_batching = False
+        # filters which support batching and whose results depend on all the filtered observations (e.g. a
+        # normalization filter which updates its statistics with them) always get all the observations as a single
+        # batch, no matter how many there are
+        self.requires_whole_batch = False
+
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        """
+        Filter a batch of observations, given as an array of shape [N, ...] with a leading batch axis. The axes
+        arguments of the filters (e.g. the crop window or the axes to move) refer to the axes of a single observation.
+        Only filters which support batching implement this.
+        :param observations: the batch of observations
+        :param update_internal_state: should the filter's internal state change due to this call
+        :return: the batch of filtered observations
+        """
+        raise NotImplementedError("")
 
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         """
@@ -0,0 +1,265 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from typing import List, Tuple
+
+import numpy as np
+from rl_coach.spaces import ObservationSpace, PlanarMapsObservationSpace
+
+from rl_coach.core_types import ObservationType
+from rl_coach.filters.observation.observation_crop_filter import ObservationCropFilter
+from rl_coach.filters.observation.observation_filter import ObservationFilter
+from rl_coach.filters.observation.observation_rescale_to_size_filter import ObservationRescaleToSizeFilter, \
+    RescaleInterpolationType
+from rl_coach.filters.observation.observation_rgb_to_y_filter import ObservationRGBToYFilter
+from rl_coach.filters.observation.observation_to_uint8_filter import ObservationToUInt8Filter
+
+
+RGB_TO_Y_COEFFICIENTS = np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+
+
+def _bilinear(x: np.ndarray) -> np.ndarray:
+    return np.maximum(1 - np.abs(x), 0)
+
+
+def _bicubic(x: np.ndarray, a: float=-0.5) -> np.ndarray:
+    x = np.abs(x)
+    return np.where(x < 1, ((a + 2) * x - (a + 3)) * x * x + 1,
+                    np.where(x < 2, (((x - 5) * x + 8) * x - 4) * a, 0))
+
+
+def _lanczos(x: np.ndarray) -> np.ndarray:
+    return np.where(np.abs(x) < 3, np.sinc(x) * np.sinc(x / 3), 0)
+
+
+# the resampling filters and their supports, as used by PIL (and therefore by scipy.misc.imresize)
+RESAMPLING_FILTERS = {
+    RescaleInterpolationType.BILINEAR: (_bilinear, 1.),
+    RescaleInterpolationType.BICUBIC: (_bicubic, 2.),
+    RescaleInterpolationType.CUBIC: (_bicubic, 2.),
+    RescaleInterpolationType.LANCZOS: (_lanczos, 3.),
+}
+
+
+def get_resize_weights(input_size: int, output_size: int,
+                       interpolation_type: RescaleInterpolationType) -> np.ndarray:
+    """
+    Calculate the weights that resize a single axis of an image with a matrix multiplication, in the same way that PIL
+    resamples images. When downscaling, the filter is stretched over the input pixels which are covered by each output
+    pixel, so that the image is antialiased.
+    :param input_size: the size of the axis in the input image
+    :param output_size: the size of the axis in the output image
+    :param interpolation_type: the interpolation type
+    :return: a matrix of shape (output_size, input_size) where each row holds the weights of an output pixel
+    """
+    scale = input_size / output_size
+    centers = (np.arange(output_size) + 0.5) * scale
+    if interpolation_type == RescaleInterpolationType.NEAREST:
+        weights = np.zeros((output_size, input_size))
+        weights[np.arange(output_size), np.minimum(centers.astype(int), input_size - 1)] = 1
+        return weights
+
+    filter_function, support = RESAMPLING_FILTERS[interpolation_type]
+    filter_scale = max(scale, 1.)
+    support *= filter_scale
+    pixels = np.arange(input_size)
+    x_min = np.maximum((centers - support + 0.5).astype(int), 0)
+    x_max = np.minimum((centers + support + 0.5).astype(int), input_size)
+    weights = filter_function((pixels[np.newaxis, :] - centers[:, np.newaxis] + 0.5) / filter_scale)
+    weights[(pixels[np.newaxis, :] < x_min[:, np.newaxis]) | (pixels[np.newaxis, :] >= x_max[:, np.newaxis])] = 0
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+class ObservationImagePreprocessingFilter(ObservationFilter):
+    """
+    Preprocesses an image observation in a single pass, instead of through a chain of filters which each allocate a
+    new image. The image is cropped, converted to gray scale (Y channel), resized, cropped again and converted to
+    uint8 values between 0 and 255. Since all the stages except for the conversion to uint8 are linear, the
+    gray scale conversion is done first, and the resizing, the second crop and the scaling of the values to 0-255 are
+    all folded into a pair of precomputed weight matrices which multiply the image from both sides. The intermediate
+    results are kept in buffers which are allocated once, and only the output image is allocated for every frame.
+    The results are within a couple of gray levels from those of the chain of the corresponding filters, which rounds
+    the image to uint8 after resizing it. The filter is therefore not used by default, and should be selected
+    explicitly, e.g. by replacing the rescale, RGB to Y and to uint8 filters of the Atari input filter with
+    ObservationImagePreprocessingFilter.from_filters of these filters.
+    The channels axis is assumed to be the last axis
+    """
+    def __init__(self, output_size: Tuple[int, int]=None, to_grayscale: bool=True,
+                 rescaling_interpolation_type: RescaleInterpolationType=RescaleInterpolationType.BILINEAR,
+                 input_crop_low: np.ndarray=None, input_crop_high: np.ndarray=None,
+                 output_crop_low: np.ndarray=None, output_crop_high: np.ndarray=None,
+                 input_low: float=0, input_high: float=255):
+        """
+        :param output_size: the height and width to resize the image to. if None, the image is not resized
+        :param to_grayscale: convert an RGB image to gray scale
+        :param rescaling_interpolation_type: the interpolation type for rescaling
+        :param input_crop_low: the start indices of the crop of the height and width axes of the image before it
+                               is resized
+        :param input_crop_high: the end indices of the crop of the height and width axes of the image before it is
+                                resized. a value of -1 will be mapped to the max size
+        :param output_crop_low: the start indices of the crop of the height and width axes of the image after it is
+                                resized
+        :param output_crop_high: the end indices of the crop of the height and width axes of the image after it is
+                                 resized. a value of -1 will be mapped to the max size
+        :param input_low: the value of the input which is mapped to 0
+        :param input_high: the value of the input which is mapped to 255
+        """
+        super().__init__()
+        if input_high <= input_low:
+            raise ValueError("The input observation space high values can be less or equal to the input observation "
+                             "space low values")
+        self.output_size = output_size
+        self.to_grayscale = to_grayscale
+        self.rescaling_interpolation_type = rescaling_interpolation_type
+        self.input_crop_low = input_crop_low
+        self.input_crop_high = input_crop_high
+        self.output_crop_low = output_crop_low
+        self.output_crop_high = output_crop_high
+        self.input_low = input_low
+        self.input_high = input_high
+        # the weights and the buffers are calculated for the shape of the first image that is filtered
+        self._input_shape = None
+        self._input_crop = None
+        self._height_weights = None
+        self._width_weights = None
+        self._offset = None
+        self._grayscale_buffer = None
+        self._height_resized_buffer = None
+        self._output_buffer = None
+
+    @classmethod
+    def from_filters(cls, observation_filters: List[ObservationFilter]) -> 'ObservationImagePreprocessingFilter':
+        """
+        Create a filter which is equivalent to the given chain of filters
+        :param observation_filters: a chain of RGB to Y, rescale to size and crop filters, and optionally a to uint8
+                                    filter at the end. the crop filters may only crop the height and width axes. at
+                                    most a single crop filter can come before the rescale filter and a single crop
+                                    filter after it
+        :return: the fused filter
+        """
+        kwargs = {'to_grayscale': False}
+        is_resized = False
+        for i, observation_filter in enumerate(observation_filters):
+            if isinstance(observation_filter, ObservationRGBToYFilter):
+                kwargs['to_grayscale'] = True
+            elif isinstance(observation_filter, ObservationRescaleToSizeFilter) and not is_resized:
+                output_observation_space = observation_filter.output_observation_space
+                if output_observation_space.channels_axis not in [-1, len(output_observation_space.shape) - 1]:
+                    raise ValueError("Only images where the channels axis is the last axis can be preprocessed by "
+                                     "the image preprocessing filter")
+                kwargs['output_size'] = tuple(output_observation_space.shape[:2])
+                kwargs['rescaling_interpolation_type'] = observation_filter.rescaling_interpolation_type
+                is_resized = True
+            elif isinstance(observation_filter, ObservationCropFilter):
+                prefix = 'output_crop_' if is_resized else 'input_crop_'
+                if prefix + 'low' in kwargs:
+                    raise ValueError("At most a single crop filter can be fused before and after the rescale filter")
+                crop_low, crop_high = observation_filter.crop_low, observation_filter.crop_high
+                if np.any(crop_low[2:] != 0) or np.any(crop_high[2:] != -1):
+                    raise ValueError("Only crop filters which crop the height and width axes of the image can be "
+                                     "fused")
+                kwargs[prefix + 'low'] = crop_low[:2]
+                kwargs[prefix + 'high'] = crop_high[:2]
+            elif isinstance(observation_filter, ObservationToUInt8Filter) and i == len(observation_filters) - 1:
+                kwargs['input_low'] = observation_filter.input_low
+                kwargs['input_high'] = observation_filter.input_high
+            else:
+                raise ValueError("The filter {} cannot be fused into an image preprocessing filter"
+                                 .format(observation_filter.__class__.__name__))
+        return cls(**kwargs)
+
+    @staticmethod
+    def _get_crop(crop_low: np.ndarray, crop_high: np.ndarray, shape: Tuple[int, int]) -> List[slice]:
+        if crop_low is None:
+            crop_low = [0, 0]
+        if crop_high is None:
+            crop_high = [-1, -1]
+        return [slice(low, size if high == -1 else high) for low, high, size in zip(crop_low, crop_high, shape)]
+
+    def _get_output_shape(self, input_shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        input_crop = self._get_crop(self.input_crop_low, self.input_crop_high, input_shape[:2])
+        size = self.output_size if self.output_size is not None \
+            else tuple(axis_crop.stop - axis_crop.start for axis_crop in input_crop)
+        output_crop = self._get_crop(self.output_crop_low, self.output_crop_high, size)
+        output_shape = tuple(axis_crop.stop - axis_crop.start for axis_crop in output_crop)
+        if len(input_shape) == 3 and not self.to_grayscale:
+            output_shape += input_shape[2:]
+        return output_shape
+
+    def _prepare(self, input_shape: Tuple[int, ...]) -> None:
+        self._input_shape = input_shape
+        self._input_crop = self._get_crop(self.input_crop_low, self.input_crop_high, input_shape[:2])
+        cropped_size = [axis_crop.stop - axis_crop.start for axis_crop in self._input_crop]
+        size = self.output_size if self.output_size is not None else cropped_size
+        output_crop = self._get_crop(self.output_crop_low, self.output_crop_high, size)
+
+        # the values are scaled to 0-255 by the height weights and the offset
+        scale = 255. / (self.input_high - self.input_low)
+        self._offset = np.float32(-self.input_low * scale)
+        weights = []
+        for input_size, output_size, axis_crop in zip(cropped_size, size, output_crop):
+            if input_size == output_size:
+                axis_weights = np.eye(input_size)
+            else:
+                axis_weights = get_resize_weights(input_size, output_size, self.rescaling_interpolation_type)
+            weights.append(axis_weights[axis_crop])
+        self._height_weights = (weights[0] * scale).astype(np.float32)
+        self._width_weights = np.ascontiguousarray(weights[1].T, dtype=np.float32)
+
+        self._grayscale_buffer = np.empty(cropped_size, dtype=np.float32)
+        self._height_resized_buffer = np.empty((self._height_weights.shape[0], cropped_size[1]), dtype=np.float32)
+        self._output_buffer = np.empty((self._height_weights.shape[0], self._width_weights.shape[1]),
+                                       dtype=np.float32)
+
+    def _resize(self, image: np.ndarray) -> np.ndarray:
+        np.matmul(self._height_weights, image, out=self._height_resized_buffer)
+        np.matmul(self._height_resized_buffer, self._width_weights, out=self._output_buffer)
+        self._output_buffer += self._offset
+        np.clip(self._output_buffer, 0, 255, out=self._output_buffer)
+        return self._output_buffer
+
+    def validate_input_observation_space(self, input_observation_space: ObservationSpace):
+        if not isinstance(input_observation_space, PlanarMapsObservationSpace) or \
+                input_observation_space.num_dimensions not in [2, 3]:
+            raise ValueError("The image preprocessing filter only applies to image observations with 2 or 3 "
+                             "dimensions. The input observation space was defined as: {}"
+                             .format(input_observation_space.__class__))
+        if self.to_grayscale and (input_observation_space.num_dimensions != 3 or
+                                  input_observation_space.shape[-1] != 3):
+            raise ValueError("The image preprocessing filter can only convert RGB images with 3 channels in the last "
+                             "dimension to gray scale. The shape of the input observation space was {}"
+                             .format(input_observation_space.shape))
+
+    def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
+        if observation.shape != self._input_shape:
+            self._prepare(observation.shape)
+        observation = observation[tuple(self._input_crop)]
+
+        if self.to_grayscale:
+            np.matmul(observation.astype(np.float32, copy=False), RGB_TO_Y_COEFFICIENTS, out=self._grayscale_buffer)
+            return self._resize(self._grayscale_buffer).astype(np.uint8)
+        elif observation.ndim == 2:
+            return self._resize(observation.astype(np.float32)).astype(np.uint8)
+        else:
+            output = np.empty(self._output_buffer.shape + observation.shape[2:], dtype=np.uint8)
+            for channel in range(observation.shape[2]):
+                output[..., channel] = self._resize(observation[..., channel].astype(np.float32))
+            return output
+
+    def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
+        input_observation_space.shape = np.array(self._get_output_shape(tuple(input_observation_space.shape)))
+        input_observation_space.low = 0
+        input_observation_space.high = 255
+        return input_observation_space
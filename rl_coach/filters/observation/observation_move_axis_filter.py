@@ -29,6 +29,7 @@ class ObservationMoveAxisFilter(ObservationFilter):
         super().__init__()
         self.axis_origin = axis_origin
         self.axis_target = axis_target
+        self.supports_batching = True
 
     def validate_input_observation_space(self, input_observation_space: ObservationSpace):
         shape = input_observation_space.shape
@@ -38,6 +39,11 @@ class ObservationMoveAxisFilter(ObservationFilter):
     def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
         return np.moveaxis(observation, self.axis_origin, self.axis_target)
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # the axes are shifted by the first axis of the batch
+        return np.moveaxis(observations, self.axis_origin + 1 if self.axis_origin >= 0 else self.axis_origin,
+                           self.axis_target + 1 if self.axis_target >= 0 else self.axis_target)
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         axis_size = input_observation_space.shape[self.axis_origin]
         input_observation_space.shape = np.delete(input_observation_space.shape, self.axis_origin)
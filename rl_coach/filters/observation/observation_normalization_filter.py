@@ -18,7 +18,8 @@ from typing import List
 import numpy as np
 from rl_coach.spaces import ObservationSpace
 
-from rl_coach.architectures.tensorflow_components.shared_variables import SharedRunningStats
+from rl_coach.architectures.tensorflow_components.shared_variables import SharedRunningStats, \
+    LocalSharedRunningStats
 from rl_coach.core_types import ObservationType
 from rl_coach.filters.observation.observation_filter import ObservationFilter
 
@@ -28,17 +29,24 @@ class ObservationNormalizationFilter(ObservationFilter):
     Normalize the observation with a running standard deviation and mean of the observations seen so far
     If there is more than a single worker, the statistics of the observations are shared between all the workers
     """
-    def __init__(self, clip_min: float=-5.0, clip_max: float=5.0, name='observation_stats'):
+    def __init__(self, clip_min: float=-5.0, clip_max: float=5.0, name='observation_stats',
+                 sync_every_n_steps: int=None):
         """
         :param clip_min: The minimum value to allow after normalizing the observation
         :param clip_max: The maximum value to allow after normalizing the observation
+        :param sync_every_n_steps: If given, the statistics are updated and the observations are normalized locally in
+                                   NumPy, and the statistics are synced with the shared statistics every given number
+                                   of steps and at the end of every episode. Otherwise, the shared statistics are
+                                   updated and read through the session on every step.
         """
         super().__init__()
         self.clip_min = clip_min
         self.clip_max = clip_max
         self.running_observation_stats = None
         self.name = name
+        self.sync_every_n_steps = sync_every_n_steps
         self.supports_batching = True
+        self.requires_whole_batch = True
         self.observation_space = None
 
     def set_device(self, device) -> None:
@@ -47,7 +55,11 @@ class ObservationNormalizationFilter(ObservationFilter):
         :param device: the device to use
         :return: None
         """
-        self.running_observation_stats = SharedRunningStats(device, name=self.name, create_ops=False)
+        if self.sync_every_n_steps is None:
+            self.running_observation_stats = SharedRunningStats(device, name=self.name, create_ops=False)
+        else:
+            self.running_observation_stats = LocalSharedRunningStats(device, name=self.name, create_ops=False,
+                                                                     sync_every_n_pushes=self.sync_every_n_steps)
 
     def set_session(self, sess) -> None:
         """
@@ -57,6 +69,12 @@ class ObservationNormalizationFilter(ObservationFilter):
         """
         self.running_observation_stats.set_session(sess)
 
+    def reset(self) -> None:
+        # the local statistics are synced at the end of every episode
+        if isinstance(self.running_observation_stats, LocalSharedRunningStats) and \
+                self.running_observation_stats.has_unsynced_samples:
+            self.running_observation_stats.sync()
+
     def filter(self, observations: List[ObservationType], update_internal_state: bool=True) -> ObservationType:
         observations = np.array(observations)
         if update_internal_state:
@@ -67,6 +85,9 @@ class ObservationNormalizationFilter(ObservationFilter):
         # TODO: make sure that a batch is given here
         return self.running_observation_stats.normalize(observations)
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        return self.filter(observations, update_internal_state)
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         self.running_observation_stats.create_ops(shape=input_observation_space.shape,
                                                   clip_values=(self.clip_min, self.clip_max))
@@ -16,6 +16,7 @@
 
 from enum import Enum
 
+import numpy as np
 import scipy.ndimage
 from rl_coach.spaces import ObservationSpace
 
@@ -46,6 +47,7 @@ class ObservationRescaleSizeByFactorFilter(ObservationFilter):
         super().__init__()
         self.rescale_factor = float(rescale_factor)  # scipy requires float scale factors
         self.rescaling_interpolation_type = rescaling_interpolation_type
+        self.supports_batching = True
         # TODO: allow selecting the channels dim
 
     def validate_input_observation_space(self, input_observation_space: ObservationSpace):
@@ -67,6 +69,10 @@ class ObservationRescaleSizeByFactorFilter(ObservationFilter):
 
         return observation
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # scipy rescales a single image at a time
+        return np.array([self.filter(observation, update_internal_state) for observation in observations])
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         input_observation_space.shape[:2] = (input_observation_space.shape[:2] * self.rescale_factor).astype('int')
         return input_observation_space
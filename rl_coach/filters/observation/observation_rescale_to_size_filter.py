@@ -49,6 +49,7 @@ class ObservationRescaleToSizeFilter(ObservationFilter):
         super().__init__()
         self.output_observation_space = output_observation_space
         self.rescaling_interpolation_type = rescaling_interpolation_type
+        self.supports_batching = True
 
         if not isinstance(output_observation_space, PlanarMapsObservationSpace):
             raise ValueError("The rescale filter only applies to observation spaces that inherit from "
@@ -93,6 +94,14 @@ class ObservationRescaleToSizeFilter(ObservationFilter):
 
         return observation
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # scipy rescales a single image at a time
+        rescaled_observations = np.empty((len(observations),) + tuple(self.output_observation_space.shape),
+                                         dtype='uint8')
+        for i, observation in enumerate(observations):
+            rescaled_observations[i] = self.filter(observation, update_internal_state)
+        return rescaled_observations
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         input_observation_space.shape = self.output_observation_space.shape
         return input_observation_space
@@ -14,6 +14,8 @@
 # limitations under the License.
 #
 
+import numpy as np
+
 from rl_coach.spaces import ObservationSpace
 
 from rl_coach.core_types import ObservationType
@@ -27,6 +29,8 @@ class ObservationRGBToYFilter(ObservationFilter):
     """
     def __init__(self):
         super().__init__()
+        self.supports_batching = True
+        self.rgb_to_y_coefficients = np.array([0.2989, 0.5870, 0.1140])
 
     def validate_input_observation_space(self, input_observation_space: ObservationSpace):
         if input_observation_space.num_dimensions != 3:
@@ -40,11 +44,14 @@ class ObservationRGBToYFilter(ObservationFilter):
     def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
 
         # rgb to y
-        r, g, b = observation[:, :, 0], observation[:, :, 1], observation[:, :, 2]
-        observation = 0.2989 * r + 0.5870 * g + 0.1140 * b
+        observation = np.matmul(observation, self.rgb_to_y_coefficients)
 
         return observation
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # the channels are the last axis of both a single observation and a batch
+        return self.filter(observations, update_internal_state)
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         input_observation_space.shape = input_observation_space.shape[:-1]
         return input_observation_space
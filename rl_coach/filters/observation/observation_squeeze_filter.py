@@ -28,6 +28,7 @@ class ObservationSqueezeFilter(ObservationFilter):
     def __init__(self, axis: int = None):
         super().__init__()
         self.axis = axis
+        self.supports_batching = True
 
     def validate_input_observation_space(self, input_observation_space: ObservationSpace):
         if self.axis is None:
@@ -40,6 +41,14 @@ class ObservationSqueezeFilter(ObservationFilter):
     def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
         return observation.squeeze(axis=self.axis)
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # the first axis of the batch is never squeezed
+        if self.axis is None:
+            axis = tuple(i for i in range(1, observations.ndim) if observations.shape[i] == 1)
+        else:
+            axis = self.axis + 1 if self.axis >= 0 else self.axis
+        return observations.squeeze(axis=axis)
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         dummy_tensor = np.random.rand(*tuple(input_observation_space.shape))
         input_observation_space.shape = dummy_tensor.squeeze(axis=self.axis).shape
@@ -15,6 +15,7 @@
 #
 
 import copy
+import uuid
 from collections import deque
 
 import numpy as np
@@ -27,12 +28,61 @@ from rl_coach.filters.observation.observation_filter import ObservationFilter
 class LazyStack(object):
     """
     A lazy version of np.stack which avoids copying the memory until it is
-    needed.
+    needed. The stack can also be written directly to a given array (e.g. to its row in a batch of stacks), to avoid
+    copying the stacked frames twice.
+    The stacks created by the ObservationStackingFilter also hold the running indices of their frames in the stream of
+    frames of the filter, and a unique id of the stream, which identify the frames that are shared between stacks, so
+    that memories can store each frame only once.
     """
+    # stacks which were pickled before the frame indices were added
+    frame_indices = None
+    stream_id = None
 
-    def __init__(self, history, axis=None):
-        self.history = copy.copy(history)
+    def __init__(self, history, axis=None, frame_indices=None, stream_id=None):
+        """
+        :param history: the frames of the stack, from the oldest to the newest
+        :param axis: the axis on which to stack the frames
+        :param frame_indices: the running indices of the frames in the stream of frames they were taken from
+        :param stream_id: an id of the stream of frames, which is unique across filters and processes
+        """
+        self.history = tuple(history)
         self.axis = axis
+        self.frame_indices = frame_indices
+        self.stream_id = stream_id
+
+    @property
+    def shape(self):
+        frame_shape = np.shape(self.history[0])
+        axis = self.axis if self.axis >= 0 else self.axis + len(frame_shape) + 1
+        return frame_shape[:axis] + (len(self.history),) + frame_shape[axis:]
+
+    @property
+    def dtype(self):
+        return np.asarray(self.history[0]).dtype
+
+    @property
+    def frame_ids(self):
+        """
+        :return: an id for each of the frames of the stack, which is the same for all the stacks that share the frame,
+                 and differs from the ids of the frames of other streams (e.g. of other workers)
+        """
+        # stacks which were pickled before the frame indices were added are identified by the frame objects
+        if self.frame_indices is not None:
+            return [(self.stream_id, frame_index) for frame_index in self.frame_indices]
+        return [id(frame) for frame in self.history]
+
+    def copy_to(self, out: np.ndarray) -> None:
+        """
+        Write the stacked frames to the given array, without building the stack as a separate array first
+        :param out: the array to write the stack to
+        :return: None
+        """
+        # the new axis is added by indexing, since concatenating the views created by np.expand_dims is much slower
+        if self.axis >= 0:
+            new_axis_index = (slice(None),) * self.axis + (np.newaxis,)
+        else:
+            new_axis_index = (Ellipsis, np.newaxis) + (slice(None),) * (-self.axis - 1)
+        np.concatenate([frame[new_axis_index] for frame in self.history], axis=self.axis, out=out)
 
     def __array__(self, dtype=None):
         array = np.stack(self.history, axis=self.axis)
@@ -60,6 +110,9 @@ class ObservationStackingFilter(ObservationFilter):
         self.stack_size = stack_size
         self.stacking_axis = stacking_axis
         self.stack = []
+        self.frame_indices = []
+        self.num_frames = 0
+        self.stream_id = None
 
         if stack_size <= 0:
             raise ValueError("The stack shape must be a positive number")
@@ -85,11 +138,18 @@ class ObservationStackingFilter(ObservationFilter):
     def filter(self, observation: ObservationType, update_internal_state: bool=True) -> ObservationType:
 
         if len(self.stack) == 0:
+            # a new stream id is drawn for every episode, so that copies of the filter (e.g. in several workers) never
+            # produce the same frame ids
+            self.stream_id = uuid.uuid4().int
             self.stack = deque([observation] * self.stack_size, maxlen=self.stack_size)
+            self.frame_indices = deque([self.num_frames] * self.stack_size, maxlen=self.stack_size)
+            self.num_frames += 1
         else:
             if update_internal_state:
                 self.stack.append(observation)
-        observation = LazyStack(self.stack, self.stacking_axis)
+                self.frame_indices.append(self.num_frames)
+                self.num_frames += 1
+        observation = LazyStack(self.stack, self.stacking_axis, tuple(self.frame_indices), self.stream_id)
 
         return observation
 
@@ -103,3 +163,4 @@ class ObservationStackingFilter(ObservationFilter):
 
     def reset(self) -> None:
         self.stack = []
+        self.frame_indices = []
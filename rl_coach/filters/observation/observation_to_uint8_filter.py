@@ -30,6 +30,7 @@ class ObservationToUInt8Filter(ObservationFilter):
         super().__init__()
         self.input_low = input_low
         self.input_high = input_high
+        self.supports_batching = True
 
         if input_high <= input_low:
             raise ValueError("The input observation space high values can be less or equal to the input observation "
@@ -54,6 +55,10 @@ class ObservationToUInt8Filter(ObservationFilter):
 
         return observation
 
+    def filter_batch(self, observations: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        # the filter is applied to each value separately, so a batch is filtered the same way as a single observation
+        return self.filter(observations, update_internal_state)
+
     def get_filtered_observation_space(self, input_observation_space: ObservationSpace) -> ObservationSpace:
         input_observation_space.low = 0
         input_observation_space.high = 255
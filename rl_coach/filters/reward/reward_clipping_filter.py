@@ -33,6 +33,7 @@ class RewardClippingFilter(RewardFilter):
         super().__init__()
         self.clipping_low = clipping_low
         self.clipping_high = clipping_high
+        self.supports_batching = True
 
         if clipping_low > clipping_high:
             raise ValueError("The reward clipping low must be lower than the reward clipping max")
@@ -47,6 +48,17 @@ class RewardClippingFilter(RewardFilter):
 
         return reward
 
+    def filter_batch(self, rewards: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        rewards = np.asarray(rewards, dtype=float)
+
+
+        if self.clipping_high:
+            rewards = np.minimum(rewards, self.clipping_high)
+        if self.clipping_low:
+            rewards = np.maximum(rewards, self.clipping_low)
+
+        return rewards
+
     def get_filtered_reward_space(self, input_reward_space: RewardSpace) -> RewardSpace:
         input_reward_space.high = min(self.clipping_high, input_reward_space.high)
         input_reward_space.low = max(self.clipping_low, input_reward_space.low)
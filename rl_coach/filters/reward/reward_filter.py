@@ -14,6 +14,8 @@
 # limitations under the License.
 #
 
+import numpy as np
+
 from rl_coach.filters.filter import Filter
 from rl_coach.spaces import RewardSpace
 
@@ -21,6 +23,23 @@ from rl_coach.spaces import RewardSpace
 class RewardFilter(Filter):
     def __init__(self):
         super().__init__()
+        # filters which support batching implement filter_batch, which filters the rewards of several data points at
+        # once
+        self.supports_batching = False
+        # filters which support batching and whose results depend on all the filtered rewards (e.g. a normalization
+        # filter which updates its statistics with them) always get all the rewards as a single batch, no matter how
+        # many there are
+        self.requires_whole_batch = False
+
+    def filter_batch(self, rewards: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        """
+        Filter the rewards of several data points, given as a single array. Only filters which support batching
+        implement this.
+        :param rewards: the rewards
+        :param update_internal_state: should the filter's internal state change due to this call
+        :return: the filtered rewards
+        """
+        raise NotImplementedError("")
 
     def get_filtered_reward_space(self, input_reward_space: RewardSpace) -> RewardSpace:
         """
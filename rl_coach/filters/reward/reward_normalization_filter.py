@@ -37,6 +37,8 @@ class RewardNormalizationFilter(RewardFilter):
         self.clip_min = clip_min
         self.clip_max = clip_max
         self.running_rewards_stats = None
+        self.supports_batching = True
+        self.requires_whole_batch = True
 
     def set_device(self, device) -> None:
         """
@@ -64,5 +66,8 @@ class RewardNormalizationFilter(RewardFilter):
 
         return reward
 
+    def filter_batch(self, rewards: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        return self.filter(rewards, update_internal_state)
+
     def get_filtered_reward_space(self, input_reward_space: RewardSpace) -> RewardSpace:
         return input_reward_space
@@ -14,6 +14,8 @@
 # limitations under the License.
 #
 
+import numpy as np
+
 from rl_coach.spaces import RewardSpace
 
 from rl_coach.core_types import RewardType
@@ -30,6 +32,7 @@ class RewardRescaleFilter(RewardFilter):
         """
         super().__init__()
         self.rescale_factor = rescale_factor
+        self.supports_batching = True
 
         if rescale_factor == 0:
             raise ValueError("The reward rescale value can not be set to 0")
@@ -38,6 +41,10 @@ class RewardRescaleFilter(RewardFilter):
         reward = float(reward) * self.rescale_factor
         return reward
 
+    def filter_batch(self, rewards: np.ndarray, update_internal_state: bool=True) -> np.ndarray:
+        rewards = np.asarray(rewards, dtype=float) * self.rescale_factor
+        return rewards
+
     def get_filtered_reward_space(self, input_reward_space: RewardSpace) -> RewardSpace:
         input_reward_space.high = input_reward_space.high * self.rescale_factor
         input_reward_space.low = input_reward_space.low * self.rescale_factor
@@ -376,6 +376,13 @@ class GraphManager(object):
         """
         [manager.sync() for manager in self.level_managers]
 
+    def close(self) -> None:
+        """
+        Release the resources held by the levels of the graph. This should be called once the run ends
+        :return: None
+        """
+        [manager.close() for manager in self.level_managers]
+
     def evaluate(self, steps: PlayingStepsType, keep_networks_in_sync: bool=False) -> None:
         """
         Perform evaluation for several steps
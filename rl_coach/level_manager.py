@@ -256,3 +256,10 @@ class LevelManager(EnvironmentInterface):
         :return:
         """
         [agent.sync() for agent in self.agents.values()]
+
+    def close(self) -> None:
+        """
+        Release the resources held by the agents of the level
+        :return: None
+        """
+        [agent.close() for agent in self.agents.values()]
@@ -0,0 +1,98 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import queue
+import threading
+from typing import Any, Callable
+
+
+class BatchPrefetcher(object):
+    """
+    Prepares batches ahead of time on a background thread, and keeps them in a bounded queue until they are requested.
+    This allows overlapping the sampling and the batching work (which is mostly Python code) with the training of the
+    networks on the previous batches (which mostly releases the GIL).
+
+    The prefetched batches are sampled before the transitions which are stored while they wait in the queue, so the
+    queue should be kept small, and the prefetcher should be stopped when the batches are not requested for a while
+    (the agents stop it when their training phase ends). Errors raised while preparing a batch are raised again when the
+    batch is requested. The sample function runs on the background thread, so it must not use objects which are used
+    by other threads without a lock.
+    """
+    def __init__(self, sample_function: Callable[[], Any], queue_size: int=2):
+        """
+        :param sample_function: a function which samples and prepares a single batch
+        :param queue_size: the maximum number of batches to prepare ahead of time
+        """
+        if queue_size <= 0:
+            raise ValueError("The queue size of a batch prefetcher must be a positive number. The given queue size is "
+                             "{}".format(queue_size))
+        self.sample_function = sample_function
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """
+        Start preparing batches on the background thread
+        :return: None
+        """
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._prefetch, daemon=True)
+        self._thread.start()
+
+    def _prefetch(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                item = (self.sample_function(), None)
+            except Exception as e:
+                item = (None, e)
+            while not self._stop_event.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if item[1] is not None:
+                # stop after an error, since sampling will probably keep failing
+                return
+
+    def get(self) -> Any:
+        """
+        Get the next prepared batch, waiting for it if it is not ready yet. The background thread is started by the
+        first call if it was not started before.
+        :return: the batch
+        """
+        self.start()
+        batch, error = self.queue.get()
+        if error is not None:
+            self._thread = None
+            raise error
+        return batch
+
+    def stop(self) -> None:
+        """
+        Stop the background thread and drop the batches which were prepared but not requested
+        :return: None
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        while not self.queue.empty():
+            self.queue.get_nowait()
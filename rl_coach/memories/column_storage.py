@@ -0,0 +1,239 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from rl_coach.core_types import Transition, ColumnarBatch
+
+
+class ColumnStorage(object):
+    """
+    A fixed capacity circular storage of transitions. Each field of the transitions (every state key, the action,
+    the reward, the game over flag and every next state key) is kept in its own preallocated numpy array (column),
+    and new transitions are written through a cursor that wraps around when the storage is full, overwriting the
+    oldest transition. Storing, evicting and gathering transitions never moves the rest of the stored data.
+
+    The storage behaves like a list of transitions ordered from the oldest to the newest, so it can be used as a
+    replacement for the transitions list of the memories. The columns are allocated on the first write, using the
+    shapes and types of the first transition.
+    """
+    STATE_PREFIX = 'state/'
+    NEXT_STATE_PREFIX = 'next_state/'
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: the maximum number of transitions that the storage can hold
+        """
+        if capacity <= 0:
+            raise ValueError("The capacity of a column storage must be a positive number. The given capacity is {}"
+                             .format(capacity))
+        self.capacity = capacity
+        self.columns = OrderedDict()
+        self.info = np.empty(capacity, dtype=object)
+        self.state_keys = []
+        self.next_state_keys = []
+        self.head = 0  # the row of the oldest transition
+        self.size = 0
+
+    def _allocate_array(self, name: str, shape: Tuple, dtype: np.dtype) -> np.ndarray:
+        """
+        Allocate an array backing the storage. Storages which keep their arrays outside the process heap
+        can override this method.
+        :param name: the name of the array
+        :param shape: the full shape of the array
+        :param dtype: the type of the array
+        :return: a zero initialized array of the given shape
+        """
+        return np.zeros(shape, dtype=dtype)
+
+    def _add_column(self, name: str, value: Union[int, float, np.ndarray], dtype: np.dtype=None) -> None:
+        value = np.asarray(value)
+        self.columns[name] = self._allocate_array(name, (self.capacity,) + value.shape,
+                                                  dtype if dtype is not None else value.dtype)
+
+    def _column_keys(self, state: Dict[str, np.ndarray]) -> List[str]:
+        """
+        :param state: a state of the first stored transition
+        :return: the keys of the state which should be stored in a column of their own
+        """
+        return list(state.keys())
+
+    def allocate(self, transition: Transition) -> None:
+        """
+        Allocate all the columns of the storage according to the structure of the given transition
+        :param transition: a transition which represents all the transitions that will be stored
+        :return: None
+        """
+        self.columns = OrderedDict()
+        self.state_keys = self._column_keys(transition.state)
+        self.next_state_keys = self._column_keys(transition.next_state)
+        for key in self.state_keys:
+            self._add_column(self.STATE_PREFIX + key, transition.state[key])
+        for key in self.next_state_keys:
+            self._add_column(self.NEXT_STATE_PREFIX + key, transition.next_state[key])
+        self._add_column('action', transition.action)
+        # the first reward may be an integer even when the rest of the rewards are not
+        self._add_column('reward', transition.reward, np.result_type(np.asarray(transition.reward).dtype, np.float32))
+        self._add_column('game_over', transition.game_over, np.bool_)
+
+    def is_allocated(self) -> bool:
+        return len(self.columns) > 0
+
+    def rows(self, indices: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        """
+        Convert indices of transitions, ordered from the oldest to the newest, to rows in the columns
+        :param indices: an index or an array of indices
+        :return: the corresponding row or array of rows
+        """
+        return (self.head + indices) % self.capacity
+
+    def _index_to_row(self, index: int) -> int:
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("Transition index {} is out of range. The storage holds {} transitions"
+                             .format(index, self.size))
+        return self.rows(index)
+
+    def _write_state(self, row: int, prefix: str, keys: List[str], state: Dict[str, np.ndarray]) -> None:
+        for key in keys:
+            self.columns[prefix + key][row] = state[key]
+
+    def _read_state(self, row: int, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        return {key: self.columns[prefix + key][row] for key in keys}
+
+    def _write_row(self, row: int, transition: Transition) -> None:
+        self._write_state(row, self.STATE_PREFIX, self.state_keys, transition.state)
+        self._write_state(row, self.NEXT_STATE_PREFIX, self.next_state_keys, transition.next_state)
+        self.columns['action'][row] = transition.action
+        self.columns['reward'][row] = transition.reward
+        self.columns['game_over'][row] = transition.game_over
+        self.info[row] = transition.info
+
+    def _copy_rows(self, source_rows: np.ndarray, target_rows: np.ndarray) -> None:
+        for column in self.columns.values():
+            column[target_rows] = column[source_rows]
+        self.info[target_rows] = self.info[source_rows]
+
+    def append(self, transition: Transition) -> int:
+        """
+        Write a new transition to the storage. If the storage is full, the oldest transition is overwritten.
+        :param transition: the transition to write
+        :return: the row in which the transition was written
+        """
+        if not self.is_allocated():
+            self.allocate(transition)
+        row = self.rows(self.size)
+        if self.size == self.capacity:
+            self.head = (self.head + 1) % self.capacity
+        else:
+            self.size += 1
+        self._write_row(row, transition)
+        return row
+
+    def get_row(self, row: int) -> Transition:
+        """
+        Build a transition from a single row of the columns. The state arrays of the transition are views of the
+        stored data, so they are valid only until the row is overwritten.
+        :param row: the row to build the transition from
+        :return: the transition
+        """
+        state = self._read_state(row, self.STATE_PREFIX, self.state_keys)
+        next_state = self._read_state(row, self.NEXT_STATE_PREFIX, self.next_state_keys)
+        return Transition(state=state, action=self.columns['action'][row], reward=self.columns['reward'][row],
+                          next_state=next_state, game_over=self.columns['game_over'][row], info=self.info[row])
+
+    def gather(self, rows: np.ndarray) -> List[Transition]:
+        """
+        Build a list of transitions from the given rows
+        :param rows: the rows to gather
+        :return: a list of transitions
+        """
+        return [self.get_row(row) for row in rows]
+
+    def _gather_state(self, rows: np.ndarray, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        return {key: self.columns[prefix + key][rows] for key in keys}
+
+    def gather_batch(self, rows: np.ndarray, info: Dict[str, np.ndarray]=None) -> ColumnarBatch:
+        """
+        Build a batch from the given rows, by gathering each column with a single indexing operation. Unlike gather,
+        this does not build a transition for each row.
+        :param rows: the rows to gather
+        :param info: arrays of additional values for the rows, which will be returned by the info method of the batch
+        :return: a columnar batch holding copies of the values of the rows
+        """
+        return ColumnarBatch(states=self._gather_state(rows, self.STATE_PREFIX, self.state_keys),
+                             actions=self.columns['action'][rows], rewards=self.columns['reward'][rows],
+                             game_overs=self.columns['game_over'][rows],
+                             next_states=self._gather_state(rows, self.NEXT_STATE_PREFIX, self.next_state_keys),
+                             transitions_info=self.info[rows], info=info)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Get the values of a single column for all the stored transitions, ordered from the oldest to the newest
+        :param name: the name of the column
+        :return: an array of the stored values
+        """
+        return self.columns[name][self.rows(np.arange(self.size))]
+
+    def remove(self, index: int) -> None:
+        """
+        Remove the transition at the given index. Removing the oldest or the newest transition is O(1), while removing
+        a transition from the middle of the storage requires moving all the newer transitions.
+        :param index: the index of the transition to remove
+        :return: None
+        """
+        row = self._index_to_row(index)
+        if index < 0:
+            index += self.size
+        if index == 0:
+            self.head = (self.head + 1) % self.capacity
+        elif index != self.size - 1:
+            self._copy_rows(self.rows(np.arange(index + 1, self.size)), self.rows(np.arange(index, self.size - 1)))
+            row = self.rows(self.size - 1)
+        self.info[row] = None
+        self.size -= 1
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        :return: a dictionary from the names of the columns to the number of bytes allocated for them
+        """
+        return OrderedDict((name, column.nbytes) for name, column in self.columns.items())
+
+    def clear(self) -> None:
+        """
+        Remove all the stored transitions while keeping the allocated columns
+        :return: None
+        """
+        self.info[:] = None
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index: int) -> Transition:
+        return self.get_row(self._index_to_row(index))
+
+    def __delitem__(self, index: int) -> None:
+        self.remove(index)
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self.get_row(self.rows(index))
@@ -0,0 +1,237 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import argparse
+import json
+import os
+import pickle
+from collections import OrderedDict
+from typing import Any, Dict, Generator, List, Tuple
+
+import numpy as np
+
+from rl_coach.core_types import Transition, Episode
+from rl_coach.memories.column_storage import ColumnStorage
+
+
+FORMAT_VERSION = 1
+METADATA_FILE = 'metadata.json'
+INFO_FILE = 'info.pkl'
+EPISODE_END_COLUMN = 'episode_end'
+
+
+def _column_file_name(column_name: str) -> str:
+    return column_name.replace('/', '.') + '.npy'
+
+
+def is_saved_memory(path: str) -> bool:
+    """
+    :param path: a path to a saved replay buffer
+    :return: True if the path is a replay buffer saved in the columnar format, and False otherwise (e.g. a pickle)
+    """
+    return os.path.isfile(os.path.join(path, METADATA_FILE))
+
+
+class ShardedTransitionsWriter(object):
+    """
+    Writes a stream of transitions to a directory in a chunked columnar format, one shard at a time.
+    The directory holds a metadata.json file and a sequence of shard directories. Each shard holds up to shard_size
+    consecutive transitions, with one .npy file per column (every state key, every next state key, the action, the
+    reward, the game over flag and an episode end flag), and a pickle file of the transitions infos. Since the columns
+    are plain .npy files, the shards can be memory mapped and read one at a time when loading.
+    """
+    def __init__(self, directory: str, shard_size: int=10000):
+        """
+        :param directory: the directory to write the transitions to
+        :param shard_size: the maximum number of transitions in each shard
+        """
+        if shard_size <= 0:
+            raise ValueError("The shard size must be a positive number. The given shard size is {}".format(shard_size))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.shards = []
+        self.state_keys = None
+        self.next_state_keys = None
+        self.num_transitions = 0
+        self._pending_transitions = []
+        self._pending_episode_ends = []
+
+    def append(self, transition: Transition, episode_end: bool) -> None:
+        """
+        Add a transition to the current shard, and write the shard to the disk when it is full
+        :param transition: the transition to write
+        :param episode_end: True if this is the last transition of a complete episode
+        :return: None
+        """
+        self._pending_transitions.append(transition)
+        self._pending_episode_ends.append(episode_end)
+        if len(self._pending_transitions) >= self.shard_size:
+            self._write_shard()
+
+    def _write_shard(self) -> None:
+        transitions = self._pending_transitions
+        if len(transitions) == 0:
+            return
+        if self.state_keys is None:
+            self.state_keys = list(transitions[0].state.keys())
+            self.next_state_keys = list(transitions[0].next_state.keys())
+
+        columns = OrderedDict()
+        for key in self.state_keys:
+            columns[ColumnStorage.STATE_PREFIX + key] = np.stack([np.asarray(t.state[key]) for t in transitions])
+        for key in self.next_state_keys:
+            columns[ColumnStorage.NEXT_STATE_PREFIX + key] = \
+                np.stack([np.asarray(t.next_state[key]) for t in transitions])
+        columns['action'] = np.stack([np.asarray(t.action) for t in transitions])
+        columns['reward'] = np.array([t.reward for t in transitions])
+        columns['game_over'] = np.array([t.game_over for t in transitions], dtype=np.bool_)
+        columns[EPISODE_END_COLUMN] = np.array(self._pending_episode_ends, dtype=np.bool_)
+
+        shard_name = 'shard_{:05d}'.format(len(self.shards))
+        shard_path = os.path.join(self.directory, shard_name)
+        os.makedirs(shard_path, exist_ok=True)
+        for column_name, column in columns.items():
+            np.save(os.path.join(shard_path, _column_file_name(column_name)), column, allow_pickle=False)
+        with open(os.path.join(shard_path, INFO_FILE), 'wb') as f:
+            pickle.dump([t.info for t in transitions], f, pickle.HIGHEST_PROTOCOL)
+
+        self.shards.append({'name': shard_name, 'num_transitions': len(transitions)})
+        self.num_transitions += len(transitions)
+        self._pending_transitions = []
+        self._pending_episode_ends = []
+
+    def close(self, metadata: Dict[str, Any]=None) -> None:
+        """
+        Write the last shard and the metadata file
+        :param metadata: additional metadata to store (e.g. the parameters of the episodes)
+        :return: None
+        """
+        self._write_shard()
+        full_metadata = {
+            'format_version': FORMAT_VERSION,
+            'num_transitions': self.num_transitions,
+            'shard_size': self.shard_size,
+            'state_keys': self.state_keys if self.state_keys is not None else [],
+            'next_state_keys': self.next_state_keys if self.next_state_keys is not None else [],
+            'shards': self.shards
+        }
+        if metadata is not None:
+            full_metadata.update(metadata)
+        with open(os.path.join(self.directory, METADATA_FILE), 'w') as f:
+            json.dump(full_metadata, f, indent=4)
+
+
+class ShardedTransitionsReader(object):
+    """
+    Reads transitions that were written in the columnar format, one shard at a time
+    """
+    def __init__(self, directory: str, mmap: bool=True):
+        """
+        :param directory: the directory that the transitions were written to
+        :param mmap: memory map the columns of the shards instead of reading them to memory. the data of each
+                     transition is then read from the disk only when it is accessed
+        """
+        if not is_saved_memory(directory):
+            raise ValueError("{} does not contain a replay buffer saved in the columnar format".format(directory))
+        with open(os.path.join(directory, METADATA_FILE), 'r') as f:
+            self.metadata = json.load(f)
+        if self.metadata['format_version'] > FORMAT_VERSION:
+            raise ValueError("The replay buffer in {} was saved with a newer format version ({}) than the supported "
+                             "version ({})".format(directory, self.metadata['format_version'], FORMAT_VERSION))
+        self.directory = directory
+        self.mmap = mmap
+
+    def __len__(self):
+        return self.metadata['num_transitions']
+
+    def num_shards(self) -> int:
+        return len(self.metadata['shards'])
+
+    def read_shard(self, shard_index: int) -> Tuple[Dict[str, np.ndarray], List[Dict]]:
+        """
+        Read the columns of a single shard
+        :param shard_index: the index of the shard to read
+        :return: a dictionary of the columns of the shard and a list of the transitions infos
+        """
+        shard_path = os.path.join(self.directory, self.metadata['shards'][shard_index]['name'])
+        column_names = [ColumnStorage.STATE_PREFIX + key for key in self.metadata['state_keys']] + \
+                       [ColumnStorage.NEXT_STATE_PREFIX + key for key in self.metadata['next_state_keys']] + \
+                       ['action', 'reward', 'game_over', EPISODE_END_COLUMN]
+        columns = OrderedDict()
+        for column_name in column_names:
+            columns[column_name] = np.load(os.path.join(shard_path, _column_file_name(column_name)),
+                                           mmap_mode='r' if self.mmap else None)
+        with open(os.path.join(shard_path, INFO_FILE), 'rb') as f:
+            infos = pickle.load(f)
+        return columns, infos
+
+    def transitions(self) -> Generator[Tuple[Transition, bool], None, None]:
+        """
+        Iterate over the saved transitions, shard by shard
+        :return: a generator of the transitions, each with a flag marking the last transition of a complete episode
+        """
+        for shard_index in range(self.num_shards()):
+            columns, infos = self.read_shard(shard_index)
+            for i in range(len(infos)):
+                state = {key: columns[ColumnStorage.STATE_PREFIX + key][i] for key in self.metadata['state_keys']}
+                next_state = {key: columns[ColumnStorage.NEXT_STATE_PREFIX + key][i]
+                              for key in self.metadata['next_state_keys']}
+                transition = Transition(state=state, action=columns['action'][i], reward=columns['reward'][i],
+                                        next_state=next_state, game_over=bool(columns['game_over'][i]),
+                                        info=infos[i])
+                yield transition, bool(columns[EPISODE_END_COLUMN][i])
+
+    def episodes(self) -> Generator[Tuple[Episode, bool], None, None]:
+        """
+        Iterate over the saved episodes. The episodes are created with the episode parameters stored in the metadata.
+        :return: a generator of the episodes, each with a flag which is False only for a last incomplete episode
+        """
+        episode_parameters = self.metadata.get('episode_parameters', {})
+        episode = Episode(**episode_parameters)
+        for transition, episode_end in self.transitions():
+            episode.insert(transition)
+            if episode_end:
+                yield episode, True
+                episode = Episode(**episode_parameters)
+        if episode.length() > 0:
+            yield episode, False
+
+
+def convert_pickle(pickle_path: str, directory: str, shard_size: int=10000) -> None:
+    """
+    Convert a replay buffer saved as a pickle (e.g. by an older version of the HumanAgent) to the columnar format
+    :param pickle_path: the path of the pickled replay buffer
+    :param directory: the directory to write the converted replay buffer to
+    :param shard_size: the maximum number of transitions in each shard
+    :return: None
+    """
+    from pandas import read_pickle
+    memory = read_pickle(pickle_path)
+    memory.save(directory, shard_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pickled replay buffer to the columnar format")
+    parser.add_argument('pickle_path', help="the path of the pickled replay buffer")
+    parser.add_argument('directory', help="the directory to write the converted replay buffer to")
+    parser.add_argument('--shard_size', type=int, default=10000, help="the maximum number of transitions per shard")
+    args = parser.parse_args()
+    convert_pickle(args.pickle_path, args.directory, args.shard_size)
+
+
+if __name__ == "__main__":
+    main()
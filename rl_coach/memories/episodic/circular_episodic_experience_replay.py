@@ -0,0 +1,280 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from typing import Any, List, Tuple, Union
+
+import numpy as np
+
+from rl_coach.core_types import Episode, Transition
+from rl_coach.memories.episodic.episodic_experience_replay import EpisodicExperienceReplayParameters, \
+    EpisodicExperienceReplay
+from rl_coach.memories.memory import MemoryGranularity
+
+
+class CircularEpisodicExperienceReplayParameters(EpisodicExperienceReplayParameters):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def path(self):
+        return 'rl_coach.memories.episodic.circular_episodic_experience_replay:CircularEpisodicExperienceReplay'
+
+
+class RingBuffer(object):
+    """
+    A list-like circular buffer backed by a numpy array. Appending items, removing items from any of the ends of the
+    buffer and accessing items by their index are all O(1). The buffer doubles its capacity when it is full, so
+    appending is amortized O(1) when the number of items is not known in advance.
+    """
+    def __init__(self, dtype: np.dtype=object, initial_capacity: int=1024):
+        """
+        :param dtype: the type of the items in the buffer
+        :param initial_capacity: the number of items to allocate space for when creating the buffer
+        """
+        self._data = np.empty(max(1, initial_capacity), dtype=dtype)
+        self._head = 0
+        self._size = 0
+
+    def _rows(self, indices: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        return (self._head + indices) % len(self._data)
+
+    def _index_to_row(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("Index {} is out of range. The buffer holds {} items".format(index, self._size))
+        return self._rows(index)
+
+    def _grow(self, min_capacity: int) -> None:
+        data = np.empty(max(2 * len(self._data), min_capacity), dtype=self._data.dtype)
+        data[:self._size] = self.values()
+        self._data = data
+        self._head = 0
+
+    def _release(self, rows: Union[int, np.ndarray]) -> None:
+        # drop the references to removed objects so that they can be freed
+        if self._data.dtype == object:
+            self._data[rows] = None
+
+    def values(self) -> np.ndarray:
+        """
+        :return: a copy of all the items in the buffer, ordered from the first to the last
+        """
+        return self._data[self._rows(np.arange(self._size))]
+
+    def append(self, item: Any) -> None:
+        if self._size == len(self._data):
+            self._grow(self._size + 1)
+        self._data[self._rows(self._size)] = item
+        self._size += 1
+
+    def extend(self, items: List[Any]) -> None:
+        for item in items:
+            self.append(item)
+
+    def popleft(self, count: int=1) -> None:
+        """
+        Remove items from the beginning of the buffer
+        :param count: the number of items to remove
+        :return: None
+        """
+        count = min(count, self._size)
+        self._release(self._rows(np.arange(count)))
+        self._head = self._rows(count)
+        self._size -= count
+
+    def pop(self, count: int=1) -> None:
+        """
+        Remove items from the end of the buffer
+        :param count: the number of items to remove
+        :return: None
+        """
+        count = min(count, self._size)
+        self._release(self._rows(np.arange(self._size - count, self._size)))
+        self._size -= count
+
+    def delete(self, start: int, count: int=1) -> None:
+        """
+        Remove a range of items from the buffer. Removing items from the ends of the buffer is O(count), while
+        removing items from the middle of the buffer requires moving all the following items.
+        :param start: the index of the first item to remove
+        :param count: the number of items to remove
+        :return: None
+        """
+        if start < 0:
+            start += self._size
+        count = max(0, min(count, self._size - start))
+        if start == 0:
+            self.popleft(count)
+        elif start + count == self._size:
+            self.pop(count)
+        elif count > 0:
+            following_items = self._rows(np.arange(start + count, self._size))
+            self._data[self._rows(np.arange(start, self._size - count))] = self._data[following_items]
+            self.pop(count)
+
+    def clear(self) -> None:
+        self._release(slice(None))
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index: Union[int, slice, np.ndarray]) -> Any:
+        if isinstance(index, slice):
+            return list(self._data[self._rows(np.arange(self._size)[index])])
+        if isinstance(index, np.ndarray):
+            if np.any(index >= self._size) or np.any(index < -self._size):
+                raise IndexError("Some of the indices are out of range. The buffer holds {} items".format(self._size))
+            return self._data[self._rows(index % self._size)]
+        return self._data[self._index_to_row(index)]
+
+    def __setitem__(self, index: int, item: Any) -> None:
+        self._data[self._index_to_row(index)] = item
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step != 1:
+                raise ValueError("Only contiguous ranges can be deleted from a ring buffer")
+            self.delete(start, stop - start)
+        else:
+            self.delete(index, 1)
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield self._data[self._rows(index)]
+
+
+class CircularEpisodicExperienceReplay(EpisodicExperienceReplay):
+    """
+    An episodic experience replay which keeps its transitions and episodes in circular buffers, together with a table
+    of (start, length) records for the complete episodes. Evicting the oldest episode only advances the head of the
+    buffers, so storing, evicting and sampling do not depend on the number of stored transitions.
+
+    The transitions attribute of this memory is a list-like RingBuffer and not a python list.
+    """
+    def __init__(self, max_size: Tuple[MemoryGranularity, int]):
+        """
+        :param max_size: the maximum number of transitions or episodes to hold in the memory
+        """
+        super().__init__(max_size)
+        self._create_buffers()
+
+    def _create_buffers(self) -> None:
+        granularity, size = self.max_size
+        transitions_capacity = size + 1 if granularity == MemoryGranularity.Transitions and size > 0 else 1024
+        self.transitions = RingBuffer(object, transitions_capacity)
+        self._buffer = RingBuffer(object)
+        self._buffer.append(Episode())
+
+        # the starts are running transition indices. the index of the first transition of the i-th complete episode
+        # in the transitions buffer is self._episode_starts[i] - self._episode_starts[0]
+        self._episode_starts = RingBuffer(np.int64)
+        self._episode_lengths = RingBuffer(np.int64)
+        self._next_episode_start = 0
+
+    def get_episode_boundaries(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the positions of the complete episodes in the transitions buffer
+        :return: an array of the indices of the first transition of each complete episode, and an array of the
+                 episodes lengths
+        """
+        starts = self._episode_starts.values()
+        if len(starts) > 0:
+            starts -= starts[0]
+        return starts, self._episode_lengths.values()
+
+    def sample(self, size: int) -> List[Transition]:
+        """
+        Sample a batch of transitions form the replay buffer. If the requested size is larger than the number
+        of samples available in the replay buffer then the batch will return empty.
+        :param size: the size of the batch to sample
+        :return: a batch (list) of selected transitions from the replay buffer
+        """
+        self.reader_writer_lock.lock_writing()
+
+        if self.num_complete_episodes() >= 1:
+            transitions_idx = np.random.randint(self.num_transitions_in_complete_episodes(), size=size)
+            batch = list(self.transitions[transitions_idx])
+
+        else:
+            raise ValueError("The episodic replay buffer cannot be sampled since there are no complete episodes yet. "
+                             "There is currently 1 episodes with {} transitions".format(self._buffer[0].length()))
+
+        self.reader_writer_lock.release_writing()
+
+        return batch
+
+    def close_last_episode(self, lock=True) -> None:
+        if lock:
+            self.reader_writer_lock.lock_writing_and_reading()
+
+        episode_length = self._buffer[-1].length()
+        self._episode_starts.append(self._next_episode_start)
+        self._episode_lengths.append(episode_length)
+        self._next_episode_start += episode_length
+
+        super().close_last_episode(lock=False)
+
+        if lock:
+            self.reader_writer_lock.release_writing_and_reading()
+
+    def _remove_episode(self, episode_index: int) -> None:
+        """
+        Remove the episode in the given index (even if it is not complete yet). Removing the oldest episode is O(1).
+        :param episode_index: the index of the episode to remove
+        :return: None
+        """
+        if len(self._buffer) > episode_index:
+            episode_length = self._buffer[episode_index].length()
+            for transition in self._buffer[episode_index].transitions:
+                self._add_memory_usage(transition, sign=-1)
+            self._length -= 1
+            self._num_transitions -= episode_length
+            self._num_transitions_in_complete_episodes -= episode_length
+
+            if episode_index < len(self._episode_starts):
+                episode_start = self._episode_starts[episode_index] - self._episode_starts[0]
+                if episode_index > 0:
+                    # the running starts of the following episodes are shifted back by the removed transitions
+                    for i in range(episode_index + 1, len(self._episode_starts)):
+                        self._episode_starts[i] -= episode_length
+                    self._next_episode_start -= episode_length
+                self._episode_starts.delete(episode_index)
+                self._episode_lengths.delete(episode_index)
+            else:
+                # the last episode, which is not complete yet
+                episode_start = len(self.transitions) - episode_length
+
+            self.transitions.delete(episode_start, episode_length)
+            self._buffer.delete(episode_index)
+
+    def clean(self) -> None:
+        """
+        Clean the memory by removing all the episodes
+        :return: None
+        """
+        self.reader_writer_lock.lock_writing_and_reading()
+
+        self._create_buffers()
+        self._length = 1
+        self._num_transitions = 0
+        self._num_transitions_in_complete_episodes = 0
+        self._reset_memory_usage()
+
+        self.reader_writer_lock.release_writing_and_reading()
@@ -19,7 +19,8 @@ from typing import List, Tuple, Union, Dict, Any
 import numpy as np
 from rl_coach.utils import ReaderWriterLock
 
-from rl_coach.core_types import Transition, Episode
+from rl_coach.core_types import Transition, Episode, SequenceBatch
+from rl_coach.memories.columnar_format import ShardedTransitionsWriter, ShardedTransitionsReader
 from rl_coach.memories.memory import Memory, MemoryGranularity, MemoryParameters
 
 
@@ -39,6 +40,10 @@ class EpisodicExperienceReplay(Memory):
     calculations of total return and other values that depend on the sequential behavior of the transitions
     in the episode.
     """
+    # the key of the transitions info which holds the recurrent state of the network before acting on the state
+    RECURRENT_STATE_INFO_KEY = 'recurrent_state'
+    # a cache of the episode boundaries. defined on the class as well, for replay buffers pickled without it
+    _episode_boundaries = None
     def __init__(self, max_size: Tuple[MemoryGranularity, int]):
         """
         :param max_size: the maximum number of transitions or episodes to hold in the memory
@@ -50,15 +55,16 @@ class EpisodicExperienceReplay(Memory):
         self._length = 1  # the episodic replay buffer starts with a single empty episode
         self._num_transitions = 0
         self._num_transitions_in_complete_episodes = 0
+        self._episode_boundaries = None
 
-        self.reader_writer_lock = ReaderWriterLock()
+        self.reader_writer_lock = ReaderWriterLock(interprocess=self.shares_storage_between_processes)
 
     def length(self, lock: bool=False) -> int:
         """
         Get the number of episodes in the ER (even if they are not complete)
         """
         length = self._length
-        if self._length is not 0 and self._buffer[-1].is_empty():
+        if self._length != 0 and self._buffer[-1].is_empty():
             length = self._length - 1
 
         return length
@@ -96,6 +102,62 @@ class EpisodicExperienceReplay(Memory):
 
         return batch
 
+    def get_episode_boundaries(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the positions of the complete episodes in the transitions buffer
+        :return: an array of the indices of the first transition of each complete episode, and an array of the
+                 episodes lengths
+        """
+        if self._episode_boundaries is None:
+            lengths = np.array([self._buffer[i].length() for i in range(self.num_complete_episodes())], dtype=np.int64)
+            self._episode_boundaries = (np.cumsum(lengths) - lengths, lengths)
+        return self._episode_boundaries
+
+    def sample_sequences(self, size: int, sequence_length: int, burn_in: int=0) -> SequenceBatch:
+        """
+        Sample a batch of sequences of consecutive transitions from the complete episodes in the replay buffer. The
+        sequences never cross the boundaries of the episodes. The first transition of each sequence is sampled
+        uniformly, and sequences which would pass the end of their episode are moved back to end with it, so only the
+        sequences of episodes shorter than burn_in + sequence_length are padded.
+        If the transitions info holds the recurrent state of the network before acting (under the
+        RECURRENT_STATE_INFO_KEY key), the state of the first transition of each sequence is returned with the batch.
+        :param size: the number of sequences to sample
+        :param sequence_length: the number of steps to train on in each sequence
+        :param burn_in: the number of additional steps at the beginning of each sequence, which are only used for
+                        updating the recurrent state of the network
+        :return: a SequenceBatch of the sampled sequences
+        """
+        self.reader_writer_lock.lock_writing()
+
+        if self.num_complete_episodes() < 1:
+            self.reader_writer_lock.release_writing()
+            raise ValueError("The episodic replay buffer cannot be sampled since there are no complete episodes yet. "
+                             "There is currently 1 episodes with {} transitions".format(self._buffer[0].length()))
+
+        total_length = burn_in + sequence_length
+        starts, lengths = self.get_episode_boundaries()
+        first_transitions_idx = np.random.randint(self.num_transitions_in_complete_episodes(), size=size)
+        episodes_idx = np.searchsorted(starts, first_transitions_idx, side='right') - 1
+        episodes_ends = starts[episodes_idx] + lengths[episodes_idx]
+        first_transitions_idx = np.maximum(np.minimum(first_transitions_idx, episodes_ends - total_length),
+                                           starts[episodes_idx])
+
+        transitions_idx = first_transitions_idx[:, np.newaxis] + np.arange(total_length)
+        mask = transitions_idx < episodes_ends[:, np.newaxis]
+        # the padding steps repeat the last transition of the episode, and are zeroed by the batch
+        transitions_idx = np.minimum(transitions_idx, episodes_ends[:, np.newaxis] - 1)
+        sequences = [[self.transitions[i] for i in sequence_idx] for sequence_idx in transitions_idx]
+
+        recurrent_states = None
+        first_transitions_info = [sequence[0].info for sequence in sequences]
+        if all(self.RECURRENT_STATE_INFO_KEY in info for info in first_transitions_info):
+            recurrent_states = [np.stack(state_part) for state_part in
+                                zip(*[info[self.RECURRENT_STATE_INFO_KEY] for info in first_transitions_info])]
+
+        self.reader_writer_lock.release_writing()
+
+        return SequenceBatch(sequences, mask, burn_in, recurrent_states)
+
     def _enforce_max_length(self) -> None:
         """
         Make sure that the size of the replay buffer does not pass the maximum size allowed.
@@ -109,6 +171,9 @@ class EpisodicExperienceReplay(Memory):
         elif granularity == MemoryGranularity.Episodes:
             while self.length() > size:
                 self._remove_episode(0)
+        elif granularity == MemoryGranularity.Bytes:
+            while size != 0 and self.num_transitions() > 0 and self._memory_usage > size:
+                self._remove_episode(0)
 
     def _update_episode(self, episode: Episode) -> None:
         episode.update_returns()
@@ -138,6 +203,7 @@ class EpisodicExperienceReplay(Memory):
 
         self._num_transitions_in_complete_episodes += last_episode.length()
         self._length += 1
+        self._episode_boundaries = None
 
         # create a new Episode for the next transitions to be placed into
         self._buffer.append(Episode())
@@ -168,6 +234,7 @@ class EpisodicExperienceReplay(Memory):
         last_episode.insert(transition)
         self.transitions.append(transition)
         self._num_transitions += 1
+        self._add_memory_usage(transition)
         if transition.game_over:
             self.close_last_episode(False)
 
@@ -190,6 +257,8 @@ class EpisodicExperienceReplay(Memory):
             self._buffer.append(episode)
         self.transitions.extend(episode.transitions)
         self._num_transitions += episode.length()
+        for transition in episode.transitions:
+            self._add_memory_usage(transition)
         self.close_last_episode(False)
 
         if lock:
@@ -221,6 +290,9 @@ class EpisodicExperienceReplay(Memory):
         """
         if len(self._buffer) > episode_index:
             episode_length = self._buffer[episode_index].length()
+            for transition in self._buffer[episode_index].transitions:
+                self._add_memory_usage(transition, sign=-1)
+            self._episode_boundaries = None
             self._length -= 1
             self._num_transitions -= episode_length
             self._num_transitions_in_complete_episodes -= episode_length
@@ -258,7 +330,7 @@ class EpisodicExperienceReplay(Memory):
         last_complete_episode_index = self.num_complete_episodes() - 1
         episode = None
         if last_complete_episode_index >= 0:
-            episode = self.get(last_complete_episode_index)
+            episode = self.get(last_complete_episode_index, lock=False)
 
         self.reader_writer_lock.release_writing()
 
@@ -282,11 +354,10 @@ class EpisodicExperienceReplay(Memory):
         self.reader_writer_lock.lock_writing_and_reading()
 
         episode = self._buffer[-1]
-        if episode.length() == 0:
-            if len(self._buffer) < 2:
-                return
+        if episode.length() == 0 and len(self._buffer) >= 2:
             episode = self._buffer[-2]
-        episode.transitions[-1].info.update(info)
+        if episode.length() > 0:
+            episode.transitions[-1].info.update(info)
 
         self.reader_writer_lock.release_writing_and_reading()
 
@@ -302,6 +373,8 @@ class EpisodicExperienceReplay(Memory):
         self._length = 1
         self._num_transitions = 0
         self._num_transitions_in_complete_episodes = 0
+        self._episode_boundaries = None
+        self._reset_memory_usage()
 
         self.reader_writer_lock.release_writing_and_reading()
 
@@ -316,3 +389,43 @@ class EpisodicExperienceReplay(Memory):
 
         self.reader_writer_lock.release_writing()
         return mean
+
+    def save(self, directory: str, shard_size: int=10000) -> None:
+        """
+        Save the episodes of the replay buffer to a directory, in the chunked columnar format. The returns of the
+        transitions are not saved, since they are recalculated when the episodes are loaded.
+        :param directory: the directory to save the replay buffer to
+        :param shard_size: the maximum number of transitions in each shard
+        :return: None
+        """
+        self.reader_writer_lock.lock_writing()
+
+        writer = ShardedTransitionsWriter(directory, shard_size)
+        num_complete_episodes = self.num_complete_episodes()
+        for episode_index, episode in enumerate(self._buffer):
+            for transition_index, transition in enumerate(episode.transitions):
+                writer.append(transition, episode_end=episode_index < num_complete_episodes and
+                              transition_index == episode.length() - 1)
+        first_episode = self._buffer[0]
+        writer.close({'episode_parameters': {
+            'discount': first_episode.discount,
+            'bootstrap_total_return_from_old_policy': first_episode.bootstrap_total_return_from_old_policy,
+            'n_step': first_episode.n_step
+        }})
+
+        self.reader_writer_lock.release_writing()
+
+    def load(self, directory: str, mmap: bool=True) -> None:
+        """
+        Store the episodes of a replay buffer that was saved with save(), streaming them shard by shard
+        :param directory: the directory that the replay buffer was saved to
+        :param mmap: memory map the saved shards instead of reading them to memory. the stored transitions then
+                     reference the memory mapped data
+        :return: None
+        """
+        for episode, is_complete in ShardedTransitionsReader(directory, mmap).episodes():
+            if is_complete:
+                self.store_episode(episode)
+            else:
+                for transition in episode.transitions:
+                    self.store(transition)
@@ -39,6 +39,7 @@ class EpisodicHindsightExperienceReplayParameters(EpisodicExperienceReplayParame
         self.hindsight_transitions_per_regular_transition = None
         self.hindsight_goal_selection_method = None
         self.goals_space = None
+        self.relabel_at_sample_time = False
 
     @property
     def path(self):
@@ -53,7 +54,8 @@ class EpisodicHindsightExperienceReplay(EpisodicExperienceReplay):
     def __init__(self, max_size: Tuple[MemoryGranularity, int],
                  hindsight_transitions_per_regular_transition: int,
                  hindsight_goal_selection_method: HindsightGoalSelectionMethod,
-                 goals_space: GoalsSpace):
+                 goals_space: GoalsSpace,
+                 relabel_at_sample_time: bool=False):
         """
         :param max_size: The maximum size of the memory. should be defined in a granularity of Transitions
         :param hindsight_transitions_per_regular_transition: The number of hindsight artificial transitions to generate
@@ -61,12 +63,18 @@ class EpisodicHindsightExperienceReplay(EpisodicExperienceReplay):
         :param hindsight_goal_selection_method: The method that will be used for generating the goals for the
                                                 hindsight transitions. Should be one of HindsightGoalSelectionMethod
         :param goals_space: A GoalsSpace which defines the base properties of the goals space
+        :param relabel_at_sample_time: Store only the actual transitions, and replace the goals of the sampled
+                                       transitions when sampling, as done in the original HER implementation.
+                                       Each sampled transition is relabeled with a probability of k / (k + 1), where
+                                       k is hindsight_transitions_per_regular_transition, which matches the ratio of
+                                       hindsight transitions in the memory when they are generated in advance.
         """
         super().__init__(max_size)
 
         self.hindsight_transitions_per_regular_transition = hindsight_transitions_per_regular_transition
         self.hindsight_goal_selection_method = hindsight_goal_selection_method
         self.goals_space = goals_space
+        self.relabel_at_sample_time = relabel_at_sample_time
         self.last_episode_start_idx = 0
 
     def _sample_goal(self, episode_transitions: List, transition_index: int):
@@ -87,7 +95,7 @@ class EpisodicHindsightExperienceReplay(EpisodicExperienceReplay):
             selected_transition = np.random.choice(episode_transitions)
         elif self.hindsight_goal_selection_method == HindsightGoalSelectionMethod.Random:
             # a random state from the entire replay buffer
-            selected_transition = np.random.choice(self.transitions)
+            selected_transition = self.transitions[np.random.randint(len(self.transitions))]
         else:
             raise ValueError("Invalid goal selection method was used for the hindsight goal selection")
         return self.goals_space.goal_from_state(selected_transition.state)
@@ -105,6 +113,10 @@ class EpisodicHindsightExperienceReplay(EpisodicExperienceReplay):
         ]
 
     def store_episode(self, episode: Episode, lock: bool=True) -> None:
+        if self.relabel_at_sample_time:
+            super().store_episode(episode, lock)
+            return
+
         # generate hindsight transitions only when an episode is finished
         last_episode_transitions = copy.copy(episode.transitions)
 
@@ -145,3 +157,92 @@ class EpisodicHindsightExperienceReplay(EpisodicExperienceReplay):
 
     def store(self, transition: Transition):
         raise ValueError("An episodic HER cannot store a single transition. Only full episodes are to be stored.")
+
+    def _sample_goal_indices(self, transitions_idx: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Sample the indices of the transitions to take the hindsight goals from, for a batch of transitions
+        :param transitions_idx: the indices of the transitions to relabel
+        :param starts: the indices of the first transitions of the episodes of the transitions
+        :param lengths: the lengths of the episodes of the transitions
+        :return: the indices of the transitions to take the goals from
+        """
+        offsets = transitions_idx - starts
+        if self.hindsight_goal_selection_method == HindsightGoalSelectionMethod.Future:
+            # states that were observed in the same episode after the transition that is being replayed
+            future_offsets = offsets + 1 + (np.random.rand(len(offsets)) * (lengths - offsets - 1)).astype(np.int64)
+            return starts + np.minimum(future_offsets, lengths - 1)
+        elif self.hindsight_goal_selection_method == HindsightGoalSelectionMethod.Final:
+            # the final state in the episode
+            return starts + lengths - 1
+        elif self.hindsight_goal_selection_method == HindsightGoalSelectionMethod.Episode:
+            # a random state from the episode
+            return starts + (np.random.rand(len(offsets)) * lengths).astype(np.int64)
+        elif self.hindsight_goal_selection_method == HindsightGoalSelectionMethod.Random:
+            # a random state from the entire replay buffer
+            return np.random.randint(self.num_transitions_in_complete_episodes(), size=len(offsets))
+        else:
+            raise ValueError("Invalid goal selection method was used for the hindsight goal selection")
+
+    def sample(self, size: int) -> List[Transition]:
+        """
+        Sample a batch of transitions form the replay buffer. When relabeling at sample time, some of the sampled
+        transitions are replaced by copies with hindsight goals, rewards and game over flags. The stored transitions
+        are not modified.
+        :param size: the size of the batch to sample
+        :return: a batch (list) of selected transitions from the replay buffer
+        """
+        if not self.relabel_at_sample_time:
+            return super().sample(size)
+
+        self.reader_writer_lock.lock_writing()
+
+        if self.num_complete_episodes() < 1:
+            self.reader_writer_lock.release_writing()
+            raise ValueError("The episodic replay buffer cannot be sampled since there are no complete episodes yet. "
+                             "There is currently 1 episodes with {} transitions".format(self._buffer[0].length()))
+
+        transitions_idx = np.random.randint(self.num_transitions_in_complete_episodes(), size=size)
+        batch = [self.transitions[i] for i in transitions_idx]
+
+        # find the episode of each sampled transition
+        starts, lengths = self.get_episode_boundaries()
+        episodes_idx = np.searchsorted(starts, transitions_idx, side='right') - 1
+        starts, lengths = starts[episodes_idx], lengths[episodes_idx]
+
+        # choose which transitions to relabel
+        k = self.hindsight_transitions_per_regular_transition
+        relabel = np.random.rand(size) < k / (k + 1.)
+        if self.hindsight_goal_selection_method == HindsightGoalSelectionMethod.Future:
+            # cannot create a future hindsight goal in the last transition of an episode
+            relabel &= transitions_idx - starts < lengths - 1
+        relabeled_idx = np.where(relabel)[0]
+
+        if len(relabeled_idx) > 0:
+            goal_transitions_idx = self._sample_goal_indices(transitions_idx[relabeled_idx], starts[relabeled_idx],
+                                                             lengths[relabeled_idx])
+            goals = np.stack([self.goals_space.goal_from_state(self.transitions[i].state)
+                              for i in goal_transitions_idx])
+            achieved_goals = np.stack([self.goals_space.goal_from_state(batch[i].next_state) for i in relabeled_idx])
+            rewards, game_overs = self.goals_space.get_rewards_for_goals_and_achieved_goals(goals, achieved_goals)
+
+            for i, goal, reward, game_over in zip(relabeled_idx, goals, rewards, game_overs):
+                transition = batch[i]
+                if transition.state['desired_goal'].shape != goal.shape:
+                    raise ValueError((
+                        'goal shape {goal_shape} already in transition is '
+                        'different than the one sampled as a hindsight goal '
+                        '{hindsight_goal_shape}.'
+                    ).format(
+                        goal_shape=transition.state['desired_goal'].shape,
+                        hindsight_goal_shape=goal.shape,
+                    ))
+                state = dict(transition.state)
+                state['desired_goal'] = goal
+                next_state = dict(transition.next_state)
+                next_state['desired_goal'] = goal
+                batch[i] = Transition(state=state, action=transition.action, reward=reward, next_state=next_state,
+                                      game_over=bool(game_over), info=transition.info)
+
+        self.reader_writer_lock.release_writing()
+
+        return batch
@@ -14,15 +14,37 @@
 # limitations under the License.
 #
 
+import os
+from collections import OrderedDict
 from enum import Enum
-from typing import Tuple
+from typing import Tuple, List, Dict, Any, Union
+
+import numpy as np
 
 from rl_coach.base_parameters import Parameters
+from rl_coach.core_types import Transition, Batch
+from rl_coach.filters.observation.observation_stacking_filter import LazyStack
+from rl_coach.memories.column_storage import ColumnStorage
 
 
 class MemoryGranularity(Enum):
     Transitions = 0
     Episodes = 1
+    Bytes = 2
+
+
+def get_value_memory_usage(value: Any) -> int:
+    """
+    :param value: a value stored in a transition
+    :return: the number of bytes that the value holds
+    """
+    if isinstance(value, LazyStack):
+        # a stack may hold the same frame several times (e.g. at the beginning of an episode)
+        frames = {frame_id: frame for frame_id, frame in zip(value.frame_ids, value.history)}
+        return sum(get_value_memory_usage(frame) for frame in frames.values())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return np.asarray(value).nbytes
 
 
 class MemoryParameters(Parameters):
@@ -39,12 +61,24 @@ class MemoryParameters(Parameters):
 
 
 class Memory(object):
+    # memories which keep their content in OS shared memory can be called directly by all the workers of a
+    # distributed run, instead of being called through the shared memory scratchpad
+    shares_storage_between_processes = False
+    # the suffix of the directories that memories are saved to with the checkpoints of the agent
+    CHECKPOINT_SUFFIX = '.replay_buffer'
+    # the number of bytes held by each column of the stored transitions, and the stacked frames which are counted in
+    # them. defined on the class as well, for memories which were pickled before the memory usage was tracked
+    _columns_memory_usage = None
+    _frames_memory_usage = None
+
     def __init__(self, max_size: Tuple[MemoryGranularity, int]):
         """
-        :param max_size: the maximum number of objects to hold in the memory
+        :param max_size: the maximum number of objects to hold in the memory. when the size is given in bytes, the
+                         oldest objects are removed once the memory usage of the stored transitions passes it
         """
         self.max_size = max_size
         self._length = 0
+        self._reset_memory_usage()
 
     def store(self, obj):
         raise NotImplementedError("")
@@ -61,7 +95,199 @@ class Memory(object):
     def sample(self, size):
         raise NotImplementedError("")
 
+    def sample_with_info(self, size: int) -> Tuple[List[Any], Dict[str, np.ndarray]]:
+        """
+        Sample a batch from the memory, together with any per-sample values that the memory computes while sampling
+        (for example, importance sampling weights). The values are returned as arrays aligned with the batch instead of
+        being written into the sampled objects.
+        :param size: the size of the batch to sample
+        :return: the sampled batch and a dictionary of arrays with one value per sample
+        """
+        return self.sample(size), {}
+
+    def sample_batch(self, size: int) -> Batch:
+        """
+        Sample a batch from the memory and wrap it, together with its per-sample values, in a Batch. Memories which
+        can build the batch arrays directly from their storage can override this method to return a ColumnarBatch.
+        :param size: the size of the batch to sample
+        :return: the sampled batch
+        """
+        transitions, info = self.sample_with_info(size)
+        return Batch(transitions, info=info)
+
+    def sample_sequences(self, size: int, sequence_length: int, burn_in: int=0):
+        """
+        Sample a batch of sequences of consecutive transitions, for training recurrent networks
+        :param size: the number of sequences to sample
+        :param sequence_length: the number of steps to train on in each sequence
+        :param burn_in: the number of additional steps at the beginning of each sequence, which are only used for
+                        updating the recurrent state of the network
+        :return: a SequenceBatch of the sampled sequences
+        """
+        raise NotImplementedError("")
+
     def clean(self):
         raise NotImplementedError("")
 
+    def _add_memory_usage(self, transition: Transition, sign: int=1) -> None:
+        """
+        Account for the memory held by a transition which was stored in the memory (or removed from it). The memory
+        usage is only tracked by memories which have a size in bytes. Stacked frames which are shared between
+        transitions (e.g. a next state which is also the state of the next transition) are counted once, in the column
+        of the first transition which holds them.
+        :param transition: the transition
+        :param sign: 1 for a stored transition and -1 for a removed transition
+        :return: None
+        """
+        if self._columns_memory_usage is None:
+            return
+        if self._frames_memory_usage is None:
+            self._frames_memory_usage = {}
+        for prefix, state in [(ColumnStorage.STATE_PREFIX, transition.state),
+                              (ColumnStorage.NEXT_STATE_PREFIX, transition.next_state)]:
+            for key, value in state.items():
+                if isinstance(value, LazyStack):
+                    self._add_frames_memory_usage(prefix + key, key, value, sign)
+                else:
+                    self._add_column_memory_usage(prefix + key, sign * get_value_memory_usage(value))
+        self._add_column_memory_usage('action', sign * get_value_memory_usage(transition.action))
+        self._add_column_memory_usage('reward', sign * get_value_memory_usage(transition.reward))
+        self._add_column_memory_usage('game_over', sign * get_value_memory_usage(transition.game_over))
+
+    def _add_frames_memory_usage(self, name: str, key: str, stack: LazyStack, sign: int) -> None:
+        """
+        Account for the frames of a stacked observation, counting each frame once for as long as it is referenced by
+        any of the stored transitions
+        :param name: the name of the column of the stack
+        :param key: the state key of the stack
+        :param stack: the stack
+        :param sign: 1 for a stored stack and -1 for a removed stack
+        :return: None
+        """
+        for frame_id, frame in zip(stack.frame_ids, stack.history):
+            # each frame is kept as [column name, number of bytes, number of references]
+            frame_usage = self._frames_memory_usage.get((key, frame_id))
+            if sign > 0:
+                if frame_usage is None:
+                    frame_usage = [name, get_value_memory_usage(frame), 0]
+                    self._frames_memory_usage[(key, frame_id)] = frame_usage
+                    self._add_column_memory_usage(name, frame_usage[1])
+                frame_usage[2] += 1
+            elif frame_usage is not None:
+                frame_usage[2] -= 1
+                if frame_usage[2] == 0:
+                    del self._frames_memory_usage[(key, frame_id)]
+                    self._add_column_memory_usage(frame_usage[0], -frame_usage[1])
+
+    def _add_column_memory_usage(self, name: str, num_bytes: int) -> None:
+        self._columns_memory_usage[name] = self._columns_memory_usage.get(name, 0) + num_bytes
+        self._memory_usage += num_bytes
+
+    def _reset_memory_usage(self) -> None:
+        if self.max_size[0] == MemoryGranularity.Bytes:
+            self._columns_memory_usage = OrderedDict()
+            self._frames_memory_usage = {}
+        else:
+            self._columns_memory_usage = None
+            self._frames_memory_usage = None
+        self._memory_usage = 0
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Get the number of bytes held by the transitions in the memory, for each of the transitions fields (e.g.
+        state/observation, action). The agents log the total memory usage as a signal. Memories which keep their
+        transitions as objects only track their memory usage when their size is given in bytes, and return an empty
+        dictionary otherwise.
+        :return: a dictionary from the names of the fields to the number of bytes they hold
+        """
+        if self._columns_memory_usage is None:
+            return {}
+        return OrderedDict(self._columns_memory_usage)
+
+    def close(self) -> None:
+        """
+        Release the resources held by the memory outside of the process memory (e.g. files). This is called by the
+        agent which uses the memory when the run ends, or for a memory which is shared between the workers of a
+        distributed run, by the process which started the workers once all of them are done. The memory should not be
+        used afterwards.
+        :return: None
+        """
+        pass
+
+    def get_statistics(self) -> Dict[str, float]:
+        """
+        Get statistics of the memory which are not part of its regular interface (for example, the compression ratio
+        of a compressed memory). The agents log these statistics as signals.
+        :return: a dictionary from the names of the statistics to their values
+        """
+        return {}
+
+    def set_experiment_path(self, experiment_path: str, name: str) -> None:
+        """
+        Called by the agent which created the memory, before storing anything in it. Memories which keep files can
+        place them under the experiment directory.
+        :param experiment_path: the path of the experiment directory, or None if the agent has no experiment directory
+        :param name: the name of the memory (e.g. the full name of the agent which owns it)
+        :return: None
+        """
+        pass
+
+    def save_checkpoint(self, checkpoint_dir: str) -> None:
+        """
+        Save the memory together with a checkpoint of the agent which created it. Memories are pickled with the rest of
+        the agent by default, so only memories which are too large for that need to save a copy of their own.
+        :param checkpoint_dir: the directory to save the memory to
+        :return: None
+        """
+        pass
+
+    def restore_checkpoint(self, checkpoint_dir: str) -> None:
+        """
+        Replace the content of the memory with a memory saved by save_checkpoint
+        :param checkpoint_dir: the directory that the memory was saved to
+        :return: None
+        """
+        pass
+
+    def save(self, directory: str, shard_size: int=10000) -> None:
+        """
+        Save the content of the memory to a directory, in the chunked columnar format of rl_coach.memories.columnar_format
+        :param directory: the directory to save the memory to
+        :param shard_size: the maximum number of transitions in each shard
+        :return: None
+        """
+        raise NotImplementedError("")
+
+    def load(self, directory: str, mmap: bool=True) -> None:
+        """
+        Add the content of a memory that was saved with save() to this memory, streaming it shard by shard
+        :param directory: the directory that the memory was saved to
+        :param mmap: memory map the saved shards instead of reading them to memory
+        :return: None
+        """
+        raise NotImplementedError("")
+
+
+def get_replay_buffer_checkpoint_dir(checkpoint_dir: str, checkpoint_id: int, name: str) -> str:
+    """
+    :param checkpoint_dir: the checkpoints directory
+    :param checkpoint_id: the id of the checkpoint
+    :param name: the name of the replay buffer (e.g. the full name of the agent which owns it)
+    :return: the path to save the replay buffer to with the given checkpoint
+    """
+    return os.path.join(checkpoint_dir, '{}.{}{}'.format(checkpoint_id, name.replace('/', '.'),
+                                                         Memory.CHECKPOINT_SUFFIX))
+
 
+def get_latest_replay_buffer_checkpoint(checkpoint_dir: str, name: str) -> Union[None, str]:
+    """
+    Find the replay buffer saved with the latest checkpoint
+    :param checkpoint_dir: the checkpoints directory
+    :param name: the name of the replay buffer (e.g. the full name of the agent which owns it)
+    :return: the path of the saved replay buffer, or None if the replay buffer was not saved to the directory
+    """
+    checkpoint_ids = [int(f.split('.')[0]) for f in os.listdir(checkpoint_dir)
+                      if f == os.path.basename(get_replay_buffer_checkpoint_dir(checkpoint_dir, f.split('.')[0], name))]
+    if len(checkpoint_ids) == 0:
+        return None
+    return get_replay_buffer_checkpoint_dir(checkpoint_dir, max(checkpoint_ids), name)
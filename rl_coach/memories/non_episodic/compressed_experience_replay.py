@@ -0,0 +1,274 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from functools import partial
+from typing import Callable, Dict, List, Tuple, Union
+
+import numpy as np
+
+from rl_coach.core_types import Transition
+from rl_coach.memories.column_storage import ColumnStorage
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.experience_replay import ExperienceReplayParameters, ExperienceReplay
+
+
+class CompressionCodec(Enum):
+    Zlib = 0
+    LZ4 = 1  # requires the lz4 package
+
+
+def get_codec_functions(codec: CompressionCodec, level: int) -> Tuple[Callable[[bytes], bytes],
+                                                                      Callable[[bytes], bytes]]:
+    """
+    :param codec: the compression codec
+    :param level: the compression level of the codec
+    :return: the compression and the decompression functions of the codec
+    """
+    if codec == CompressionCodec.Zlib:
+        return partial(zlib.compress, level=level), zlib.decompress
+    elif codec == CompressionCodec.LZ4:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ValueError("The LZ4 compression codec requires the lz4 package. Install it with pip install lz4")
+        return partial(lz4.frame.compress, compression_level=level), lz4.frame.decompress
+    else:
+        raise ValueError("Unknown compression codec {}".format(codec))
+
+
+class CompressedExperienceReplayParameters(ExperienceReplayParameters):
+    def __init__(self):
+        super().__init__()
+        # the storage is always preallocated, so this can't be changed
+        self.use_preallocated_storage = True
+        self.compression_codec = CompressionCodec.Zlib
+        self.compression_level = 1
+        self.compressed_state_keys = None
+        self.num_decompression_threads = 1
+
+    @property
+    def path(self):
+        return 'rl_coach.memories.non_episodic.compressed_experience_replay:CompressedExperienceReplay'
+
+
+class CompressedColumnStorage(ColumnStorage):
+    """
+    A column storage which keeps some of the state and next state columns compressed. Each value of a compressed
+    column is compressed separately when it is written, and the values of a batch of rows are decompressed together
+    when the rows are gathered, optionally on several threads (both zlib and lz4 release the GIL while decompressing).
+
+    The storage keeps statistics of the compression ratio and of the decompression time, so that the memory saved by
+    the compression can be weighed against its CPU cost.
+    """
+    def __init__(self, capacity: int, codec: CompressionCodec=CompressionCodec.Zlib, level: int=1,
+                 compressed_state_keys: List[str]=None, num_decompression_threads: int=1):
+        """
+        :param capacity: the maximum number of transitions that the storage can hold
+        :param codec: the compression codec to use
+        :param level: the compression level of the codec. low levels are much faster, and usually compress image
+                      observations almost as well as the high levels
+        :param compressed_state_keys: the keys of the states to compress. if None, all the uint8 observations with at
+                                      least 2 dimensions (i.e. images) are compressed
+        :param num_decompression_threads: the number of threads to decompress the gathered rows with
+        """
+        super().__init__(capacity)
+        self.codec = codec
+        self.level = level
+        self._compress, self._decompress = get_codec_functions(codec, level)
+        self.compressed_state_keys = compressed_state_keys
+        self.num_decompression_threads = num_decompression_threads
+        self._executor = None
+        # the shape and type of the values of each compressed column, and the compressed size of each of its rows
+        self.compressed_columns = {}
+        self.compressed_sizes = {}
+        self.num_decoded_values = 0
+        self.decode_time = 0.
+
+    def _should_compress(self, key: str, value: np.ndarray) -> bool:
+        if self.compressed_state_keys is not None:
+            return key in self.compressed_state_keys
+        return value.dtype == np.uint8 and value.ndim >= 2
+
+    def allocate(self, transition: Transition) -> None:
+        self.compressed_columns = {}
+        self.compressed_sizes = {}
+        super().allocate(transition)
+
+    def _add_column(self, name: str, value: Union[int, float, np.ndarray], dtype: np.dtype=None) -> None:
+        value = np.asarray(value)
+        for prefix in [self.STATE_PREFIX, self.NEXT_STATE_PREFIX]:
+            if name.startswith(prefix) and self._should_compress(name[len(prefix):], value):
+                self.columns[name] = np.empty(self.capacity, dtype=object)
+                self.compressed_columns[name] = (value.shape, value.dtype)
+                self.compressed_sizes[name] = np.zeros(self.capacity, dtype=np.int64)
+                return
+        super()._add_column(name, value, dtype)
+
+    def _write_state(self, row: int, prefix: str, keys: List[str], state: Dict[str, np.ndarray]) -> None:
+        for key in keys:
+            name = prefix + key
+            if name in self.compressed_columns:
+                shape, dtype = self.compressed_columns[name]
+                compressed_value = self._compress(np.ascontiguousarray(state[key], dtype=dtype).tobytes())
+                self.columns[name][row] = compressed_value
+                self.compressed_sizes[name][row] = len(compressed_value)
+            else:
+                self.columns[name][row] = state[key]
+
+    def _copy_rows(self, source_rows: np.ndarray, target_rows: np.ndarray) -> None:
+        super()._copy_rows(source_rows, target_rows)
+        for sizes in self.compressed_sizes.values():
+            sizes[target_rows] = sizes[source_rows]
+
+    def _decode(self, name: str, compressed_value: bytes) -> np.ndarray:
+        shape, dtype = self.compressed_columns[name]
+        return np.frombuffer(self._decompress(compressed_value), dtype=dtype).reshape(shape)
+
+    def _decode_rows(self, name: str, rows: np.ndarray) -> List[np.ndarray]:
+        compressed_values = self.columns[name][rows]
+        if self.num_decompression_threads > 1 and len(rows) > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.num_decompression_threads)
+            return list(self._executor.map(partial(self._decode, name), compressed_values))
+        return [self._decode(name, compressed_value) for compressed_value in compressed_values]
+
+    def _read_state(self, row: int, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        state = {}
+        for key in keys:
+            name = prefix + key
+            if name in self.compressed_columns:
+                state[key] = self._decode(name, self.columns[name][row])
+            else:
+                state[key] = self.columns[name][row]
+        return state
+
+    def _decode_columns(self, names: List[str], rows: np.ndarray) -> Dict[str, List[np.ndarray]]:
+        start_time = time.time()
+        decoded_values = {name: self._decode_rows(name, rows) for name in names}
+        self.decode_time += time.time() - start_time
+        self.num_decoded_values += len(rows) * len(names)
+        return decoded_values
+
+    def gather(self, rows: np.ndarray) -> List[Transition]:
+        """
+        Build a list of transitions from the given rows, decompressing the compressed values of all the rows together
+        :param rows: the rows to gather
+        :return: a list of transitions
+        """
+        decoded_values = self._decode_columns(list(self.compressed_columns.keys()), rows)
+
+        transitions = []
+        for i, row in enumerate(rows):
+            states = []
+            for prefix, keys in [(self.STATE_PREFIX, self.state_keys), (self.NEXT_STATE_PREFIX, self.next_state_keys)]:
+                states.append({key: decoded_values[prefix + key][i] if prefix + key in decoded_values
+                               else self.columns[prefix + key][row] for key in keys})
+            transitions.append(Transition(state=states[0], action=self.columns['action'][row],
+                                          reward=self.columns['reward'][row], next_state=states[1],
+                                          game_over=self.columns['game_over'][row], info=self.info[row]))
+        return transitions
+
+    def _gather_state(self, rows: np.ndarray, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        decoded_values = self._decode_columns([prefix + key for key in keys if prefix + key in self.compressed_columns],
+                                              rows)
+        state = {}
+        for key in keys:
+            name = prefix + key
+            if name in decoded_values:
+                shape, dtype = self.compressed_columns[name]
+                state[key] = np.empty((len(rows),) + shape, dtype=dtype)
+                for i, value in enumerate(decoded_values[name]):
+                    state[key][i] = value
+            else:
+                state[key] = self.columns[name][rows]
+        return state
+
+    def memory_usage(self) -> Dict[str, int]:
+        memory_usage = super().memory_usage()
+        rows = self.rows(np.arange(self.size))
+        for name, sizes in self.compressed_sizes.items():
+            memory_usage[name] = int(sizes[rows].sum())
+        return memory_usage
+
+    def get_statistics(self) -> Dict[str, float]:
+        """
+        :return: the compression ratio of the stored values, their compressed size in bytes, and the average time in
+                 seconds it took to decompress a single value
+        """
+        rows = self.rows(np.arange(self.size))
+        raw_bytes = 0
+        compressed_bytes = 0
+        for name, (shape, dtype) in self.compressed_columns.items():
+            raw_bytes += self.size * int(np.prod(shape)) * np.dtype(dtype).itemsize
+            compressed_bytes += int(self.compressed_sizes[name][rows].sum())
+        return {
+            'Compression Ratio': raw_bytes / compressed_bytes if compressed_bytes > 0 else np.nan,
+            'Compressed Bytes': compressed_bytes,
+            'Decode Time Per Value': self.decode_time / self.num_decoded_values if self.num_decoded_values > 0
+            else np.nan
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_executor']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._executor = None
+
+
+class CompressedExperienceReplay(ExperienceReplay):
+    """
+    An experience replay which keeps the image observations of the transitions compressed in memory, and decompresses
+    them in batches when the transitions are sampled. Image observations usually dominate the memory footprint of the
+    replay buffer and compress well, so this allows holding many more transitions in the same amount of memory at the
+    cost of some CPU time while sampling. The compression statistics are logged by the agent.
+    """
+    def __init__(self, max_size: Tuple[MemoryGranularity, int], allow_duplicates_in_batch_sampling: bool=True,
+                 compression_codec: CompressionCodec=CompressionCodec.Zlib, compression_level: int=1,
+                 compressed_state_keys: List[str]=None, num_decompression_threads: int=1):
+        """
+        :param max_size: the maximum number of transitions to hold in the memory
+        :param allow_duplicates_in_batch_sampling: allow having the same transition multiple times in a batch
+        :param compression_codec: the compression codec to use
+        :param compression_level: the compression level of the codec
+        :param compressed_state_keys: the keys of the states to compress. if None, all the uint8 observations with at
+                                      least 2 dimensions (i.e. images) are compressed
+        :param num_decompression_threads: the number of threads to decompress the sampled transitions with
+        """
+        self.compression_codec = compression_codec
+        self.compression_level = compression_level
+        self.compressed_state_keys = compressed_state_keys
+        self.num_decompression_threads = num_decompression_threads
+        super().__init__(max_size, allow_duplicates_in_batch_sampling, use_preallocated_storage=True)
+
+    def _create_transitions_storage(self) -> CompressedColumnStorage:
+        return CompressedColumnStorage(self.max_size[1], self.compression_codec, self.compression_level,
+                                       self.compressed_state_keys, self.num_decompression_threads)
+
+    def get_statistics(self) -> Dict[str, float]:
+        self.reader_writer_lock.lock_writing()
+
+        statistics = self.transitions.get_statistics()
+
+        self.reader_writer_lock.release_writing()
+
+        return statistics
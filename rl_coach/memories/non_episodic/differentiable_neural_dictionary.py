@@ -16,117 +16,226 @@
 
 import os
 import pickle
+from enum import Enum
 
 import numpy as np
 from annoy import AnnoyIndex
 
 
-class AnnoyDictionary(object):
-    def __init__(self, dict_size, key_width, new_value_shift_coefficient=0.1, batch_size=100, key_error_threshold=0.01,
-                 num_neighbors=50, override_existing_keys=True, rebuild_on_every_update=False):
-        self.rebuild_on_every_update = rebuild_on_every_update
+class DNDIndexType(Enum):
+    Annoy = 0  # an approximate index, which is rebuilt periodically from the keys added since the last rebuild
+    BruteForce = 1  # an exact search over all the keys, which is always up to date
+
+
+class DNDDictionary(object):
+    """
+    A dictionary from keys (embeddings) to values, with a fixed capacity. When the dictionary is full, new entries
+    replace old entries which were not used recently, which are chosen with the clock (second chance) approximation
+    of a least recently used policy: every entry which is added, updated or returned by a query is marked as
+    referenced, and a clock hand sweeps over the entries, clearing the marks, until it finds unmarked entries to evict.
+    The nearest neighbors search over the keys is implemented by the subclasses.
+    """
+    # defaults for dictionaries which were pickled before the clock eviction was added
+    referenced = None
+    clock_hand = 0
+
+    # the minimal number of entries that the clock hand examines at once
+    MIN_CLOCK_SWEEP_SIZE = 1024
+
+    def __init__(self, dict_size, key_width, new_value_shift_coefficient=0.1, key_error_threshold=0.01,
+                 num_neighbors=50, override_existing_keys=True):
         self.max_size = dict_size
         self.curr_size = 0
         self.new_value_shift_coefficient = new_value_shift_coefficient
         self.num_neighbors = num_neighbors
         self.override_existing_keys = override_existing_keys
 
-        self.index = AnnoyIndex(key_width, metric='euclidean')
-        self.index.set_seed(1)
-
         self.embeddings = np.zeros((dict_size, key_width))
         self.values = np.zeros(dict_size)
         self.additional_data = [None] * dict_size
 
-        self.lru_timestamps = np.zeros(dict_size)
-        self.current_timestamp = 0.0
+        self.referenced = np.zeros(dict_size, dtype=np.bool_)
+        self.clock_hand = 0
 
         # keys that are in this distance will be considered as the same key
         self.key_error_threshold = key_error_threshold
 
-        self.initial_update_size = batch_size
-        self.min_update_size = self.initial_update_size
         self.key_dimension = key_width
         self.value_dimension = 1
-        self._reset_buffer()
 
-        self.built_capacity = 0
+    def _mark_referenced(self, indices):
+        if self.referenced is None:
+            self.referenced = np.zeros(self.max_size, dtype=np.bool_)
+        self.referenced[indices] = True
+
+    def _evict(self, num_entries):
+        """
+        Choose entries to replace with new entries, by sweeping the clock hand over the entries
+        :param num_entries: the number of entries to evict
+        :return: the indices of the evicted entries
+        """
+        self._mark_referenced([])
+        evicted = []
+        num_evicted = 0
+        while num_evicted < num_entries:
+            sweep_end = min(self.max_size, self.clock_hand + max(self.MIN_CLOCK_SWEEP_SIZE, 2 * num_entries))
+            candidates = np.flatnonzero(~self.referenced[self.clock_hand:sweep_end])[:num_entries - num_evicted]
+            if num_evicted + len(candidates) == num_entries:
+                sweep_end = self.clock_hand + candidates[-1] + 1
+            # the referenced entries which the hand passes get a second chance, and the evicted entries are marked so
+            # that the following laps of the hand will not evict them again
+            self.referenced[self.clock_hand:sweep_end] = False
+            self.referenced[candidates + self.clock_hand] = True
+            evicted.append(candidates + self.clock_hand)
+            num_evicted += len(candidates)
+            self.clock_hand = sweep_end % self.max_size
+        return np.concatenate(evicted) if evicted else np.zeros(0, dtype=np.int64)
+
+    def _update_existing_entries(self, indices, values, additional_data):
+        # a batch may update the same entry several times, so the updates are applied in rounds, where each round
+        # applies the first remaining update of every entry
+        while len(indices) > 0:
+            unique_indices, first_updates = np.unique(indices, return_index=True)
+            self.values[unique_indices] += self.new_value_shift_coefficient * \
+                (values[first_updates] - self.values[unique_indices])
+            for index, i in zip(unique_indices, first_updates):
+                self.additional_data[index] = additional_data[i]
+            remaining_updates = np.ones(len(indices), dtype=np.bool_)
+            remaining_updates[first_updates] = False
+            indices = indices[remaining_updates]
+            values = values[remaining_updates]
+            additional_data = [data for data, remaining in zip(additional_data, remaining_updates) if remaining]
 
     def add(self, keys, values, additional_data=None):
         if not additional_data:
             additional_data = [None] * len(keys)
-
-        # Adds new embeddings and values to the dictionary
-        indices = []
-        indices_to_remove = []
-        for i in range(keys.shape[0]):
-            index = self._lookup_key_index(keys[i])
-            if index and self.override_existing_keys:
-                # update existing value
-                self.values[index] += self.new_value_shift_coefficient * (values[i] - self.values[index])
-                self.additional_data[index[0][0]] = additional_data[i]
-                self.lru_timestamps[index] = self.current_timestamp
-                indices_to_remove.append(i)
-            else:
-                # add new
-                if self.curr_size >= self.max_size:
-                    # find the LRU entry
-                    index = np.argmin(self.lru_timestamps)
-                else:
-                    index = self.curr_size
-                    self.curr_size += 1
-                self.lru_timestamps[index] = self.current_timestamp
-                indices.append(index)
-
-        for i in reversed(indices_to_remove):
-            keys = np.delete(keys, i, 0)
-            values = np.delete(values, i, 0)
-            del additional_data[i]
-
-        self.buffered_keys = np.vstack((self.buffered_keys, keys))
-        self.buffered_values = np.vstack((self.buffered_values, values))
-        self.buffered_indices = self.buffered_indices + indices
-        self.buffered_additional_data = self.buffered_additional_data + additional_data
-
-        if len(self.buffered_indices) >= self.min_update_size:
-            self.min_update_size = max(self.initial_update_size, int(self.curr_size * 0.02))
-            self._rebuild_index()
-        elif self.rebuild_on_every_update:
-            self._rebuild_index()
-
-        self.current_timestamp += 1
+        values = np.reshape(values, (len(keys), self.value_dimension))
+
+        # the existing keys are looked up for all the keys together, before any of them is added
+        new_keys = np.ones(len(keys), dtype=np.bool_)
+        if self.override_existing_keys:
+            existing_indices = self._lookup_keys_indices(keys)
+            new_keys = existing_indices < 0
+            existing_keys = np.flatnonzero(~new_keys)
+            self._update_existing_entries(existing_indices[existing_keys], values[existing_keys, 0],
+                                          [additional_data[i] for i in existing_keys])
+            self._mark_referenced(existing_indices[existing_keys])
+
+        # only the last keys are added if there are more new keys than the dictionary can hold
+        new_keys = np.flatnonzero(new_keys)[-self.max_size:]
+
+        # new entries are added to the free entries first, and then replace old entries
+        num_free_entries = min(len(new_keys), self.max_size - self.curr_size)
+        indices = np.arange(self.curr_size, self.curr_size + num_free_entries)
+        self.curr_size += num_free_entries
+        if num_free_entries < len(new_keys):
+            indices = np.concatenate([indices, self._evict(len(new_keys) - num_free_entries)])
+        self._mark_referenced(indices)
+
+        self._add_entries(indices.tolist(), keys[new_keys], values[new_keys], [additional_data[i] for i in new_keys])
+
+    def _add_entries(self, indices, keys, values, additional_data):
+        """
+        Write new entries to the dictionary, and make them available to the nearest neighbors search
+        :param indices: the indices of the entries in the dictionary
+        :param keys: the keys of the entries
+        :param values: the values of the entries, as an array of shape [num entries, 1]
+        :param additional_data: the additional data of the entries
+        :return: None
+        """
+        raise NotImplementedError("")
 
     # Returns the stored embeddings and values of the closest embeddings
     def query(self, keys, k):
         if not self.has_enough_entries(k):
             # this will only happen when the DND is not yet populated with enough entries, which is only during heatup
             # these values won't be used and therefore they are meaningless
-            return [0.0], [0.0], [0], [None]
+            return np.zeros(len(keys)), np.zeros(len(keys)), np.zeros(len(keys), dtype=np.int64), [None] * len(keys)
 
         _, indices = self._get_k_nearest_neighbors_indices(keys, k)
+        indices = np.array(indices, dtype=np.int64)
 
-        embeddings = []
-        values = []
-        additional_data = []
-        for ind in indices:
-            self.lru_timestamps[ind] = self.current_timestamp
-            embeddings.append(self.embeddings[ind])
-            values.append(self.values[ind])
-            curr_additional_data = []
-            for sub_ind in ind:
-                curr_additional_data.append(self.additional_data[sub_ind])
-            additional_data.append(curr_additional_data)
-
-        self.current_timestamp += 1
+        self._mark_referenced(indices)
 
-        return embeddings, values, indices, additional_data
+        additional_data = [[self.additional_data[sub_ind] for sub_ind in ind] for ind in indices]
+        return self.embeddings[indices], self.values[indices], indices, additional_data
 
     def has_enough_entries(self, k):
-        return self.curr_size > k and (self.built_capacity > k)
+        return self.curr_size > k
 
     def sample_embeddings(self, num_embeddings):
         return self.embeddings[np.random.choice(self.curr_size, num_embeddings)]
 
+    def update_keys_and_values(self, indices, key_deltas, value_deltas):
+        """
+        Subtract the given deltas from the keys and the values of existing entries
+        :param indices: the indices of the entries to update. the indices should be unique
+        :param key_deltas: the deltas to subtract from the keys
+        :param value_deltas: the deltas to subtract from the values
+        :return: None
+        """
+        self.embeddings[indices] -= key_deltas
+        self.values[indices] -= value_deltas
+
+    def _get_k_nearest_neighbors_indices(self, keys, k):
+        """
+        :param keys: a batch of keys to search for
+        :param k: the number of neighbors to find for each of the keys
+        :return: the distances of the neighbors of each key and their indices, sorted from the nearest neighbor
+        """
+        raise NotImplementedError("")
+
+    def _lookup_keys_indices(self, keys):
+        """
+        :param keys: a batch of keys
+        :return: the index of the stored key which is considered the same as each of the given keys, or -1 for keys
+                 which are not in the dictionary
+        """
+        indices = np.full(len(keys), -1, dtype=np.int64)
+        if len(keys) == 0:
+            return indices
+        distances, neighbors = self._get_k_nearest_neighbors_indices(keys, 1)
+        for i, (distance, neighbor) in enumerate(zip(distances, neighbors)):
+            if len(distance) > 0 and distance[0] <= self.key_error_threshold:
+                indices[i] = neighbor[0]
+        return indices
+
+
+class AnnoyDictionary(DNDDictionary):
+    """
+    A DND dictionary which searches the keys with an approximate Annoy index. New keys are buffered, and the index is
+    rebuilt from all the buffered keys once enough keys were buffered, so the newest keys are not searched until then.
+    """
+    def __init__(self, dict_size, key_width, new_value_shift_coefficient=0.1, batch_size=100, key_error_threshold=0.01,
+                 num_neighbors=50, override_existing_keys=True, rebuild_on_every_update=False):
+        super().__init__(dict_size, key_width, new_value_shift_coefficient, key_error_threshold, num_neighbors,
+                         override_existing_keys)
+        self.rebuild_on_every_update = rebuild_on_every_update
+
+        self.index = AnnoyIndex(key_width, metric='euclidean')
+        self.index.set_seed(1)
+
+        self.initial_update_size = batch_size
+        self.min_update_size = self.initial_update_size
+        self._reset_buffer()
+
+        self.built_capacity = 0
+
+    def _add_entries(self, indices, keys, values, additional_data):
+        self.buffered_keys = np.vstack((self.buffered_keys, keys))
+        self.buffered_values = np.vstack((self.buffered_values, values))
+        self.buffered_indices = self.buffered_indices + indices
+        self.buffered_additional_data = self.buffered_additional_data + additional_data
+
+        if len(self.buffered_indices) >= self.min_update_size:
+            self.min_update_size = max(self.initial_update_size, int(self.curr_size * 0.02))
+            self._rebuild_index()
+        elif self.rebuild_on_every_update:
+            self._rebuild_index()
+
+    def has_enough_entries(self, k):
+        return self.curr_size > k and (self.built_capacity > k)
+
     def _get_k_nearest_neighbors_indices(self, keys, k):
         distances = []
         indices = []
@@ -156,17 +265,71 @@ class AnnoyDictionary(object):
         self.buffered_indices = []
         self.buffered_additional_data = []
 
-    def _lookup_key_index(self, key):
-        distance, index = self._get_k_nearest_neighbors_indices([key], 1)
-        if distance != [[]] and distance[0][0] <= self.key_error_threshold:
-            return index
-        return None
+
+class BruteForceDictionary(DNDDictionary):
+    """
+    A DND dictionary which finds the exact nearest neighbors of a batch of keys by computing their distances to all
+    the stored keys, using a single matrix multiplication per chunk of the batch. New keys are written directly to the
+    keys matrix, and are searched immediately, so adding keys never requires rebuilding an index.
+    """
+    # the maximum number of query-key distances to compute at once, which bounds the memory used by a search
+    MAX_DISTANCES_PER_CHUNK = 2 ** 22
+
+    def __init__(self, dict_size, key_width, new_value_shift_coefficient=0.1, key_error_threshold=0.01,
+                 num_neighbors=50, override_existing_keys=True):
+        super().__init__(dict_size, key_width, new_value_shift_coefficient, key_error_threshold, num_neighbors,
+                         override_existing_keys)
+        # the squared norms of the keys, which are used for computing the distances
+        self.squared_norms = np.zeros(dict_size)
+
+    def _add_entries(self, indices, keys, values, additional_data):
+        self.embeddings[indices] = keys
+        self.values[indices] = np.squeeze(values, -1)
+        self.squared_norms[indices] = np.sum(np.square(keys), axis=1)
+        for i, data in zip(indices, additional_data):
+            self.additional_data[i] = data
+
+    def update_keys_and_values(self, indices, key_deltas, value_deltas):
+        super().update_keys_and_values(indices, key_deltas, value_deltas)
+        self.squared_norms[indices] = np.sum(np.square(self.embeddings[indices]), axis=-1)
+
+    def _get_k_nearest_neighbors_indices(self, keys, k):
+        keys = np.asarray(keys, dtype=self.embeddings.dtype)
+        k = min(k, self.curr_size)
+        if k == 0:
+            return np.zeros((len(keys), 0)), np.zeros((len(keys), 0), dtype=np.int64)
+
+        embeddings = self.embeddings[:self.curr_size]
+        squared_norms = self.squared_norms[:self.curr_size]
+        chunk_size = max(1, self.MAX_DISTANCES_PER_CHUNK // self.curr_size)
+        distances = np.empty((len(keys), k))
+        indices = np.empty((len(keys), k), dtype=np.int64)
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            # |q - e|^2 = |q|^2 - 2 q.e + |e|^2
+            squared_distances = squared_norms - 2 * np.dot(chunk, embeddings.T)
+            squared_distances += np.sum(np.square(chunk), axis=1, keepdims=True)
+            if k < self.curr_size:
+                nearest = np.argpartition(squared_distances, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.tile(np.arange(self.curr_size), (len(chunk), 1))
+            # the expansion above loses precision for very close keys, so the distances of the nearest keys are
+            # computed again directly
+            nearest_distances = np.linalg.norm(embeddings[nearest] - chunk[:, np.newaxis], axis=2)
+            order = np.argsort(nearest_distances, axis=1)
+            indices[start:start + chunk_size] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + chunk_size] = np.take_along_axis(nearest_distances, order, axis=1)
+        return distances, indices
 
 
 class QDND(object):
+    # defaults for dictionaries which were pickled before these attributes were added
+    rebuild_on_every_update = False
+    index_type = DNDIndexType.Annoy
+
     def __init__(self, dict_size, key_width, num_actions, new_value_shift_coefficient=0.1, key_error_threshold=0.01,
                  learning_rate=0.01, num_neighbors=50, return_additional_data=False, override_existing_keys=False,
-                 rebuild_on_every_update=False):
+                 rebuild_on_every_update=False, index_type=DNDIndexType.Annoy):
         self.dict_size = dict_size
         self.key_width = key_width
         self.num_actions = num_actions
@@ -176,15 +339,24 @@ class QDND(object):
         self.num_neighbors = num_neighbors
         self.return_additional_data = return_additional_data
         self.override_existing_keys = override_existing_keys
-        self.dicts = []
+        self.rebuild_on_every_update = rebuild_on_every_update
+        self.index_type = index_type
 
         # create a dict for each action
-        for a in range(num_actions):
-            new_dict = AnnoyDictionary(dict_size, key_width, new_value_shift_coefficient,
-                                       key_error_threshold=key_error_threshold, num_neighbors=num_neighbors,
-                                       override_existing_keys=override_existing_keys,
-                                       rebuild_on_every_update=rebuild_on_every_update)
-            self.dicts.append(new_dict)
+        self.dicts = [self._create_dictionary() for _ in range(num_actions)]
+
+    def _create_dictionary(self) -> DNDDictionary:
+        if self.index_type == DNDIndexType.Annoy:
+            return AnnoyDictionary(self.dict_size, self.key_width, self.new_value_shift_coefficient,
+                                   key_error_threshold=self.key_error_threshold, num_neighbors=self.num_neighbors,
+                                   override_existing_keys=self.override_existing_keys,
+                                   rebuild_on_every_update=self.rebuild_on_every_update)
+        elif self.index_type == DNDIndexType.BruteForce:
+            return BruteForceDictionary(self.dict_size, self.key_width, self.new_value_shift_coefficient,
+                                        key_error_threshold=self.key_error_threshold, num_neighbors=self.num_neighbors,
+                                        override_existing_keys=self.override_existing_keys)
+        else:
+            raise ValueError("Unknown DND index type {}".format(self.index_type))
 
     def add(self, embeddings, actions, values, additional_data=None):
         # add a new set of embeddings and values to each of the underlining dictionaries
@@ -206,23 +378,33 @@ class QDND(object):
         return True
 
     def query(self, embeddings, action, k):
-        # query for nearest neighbors to the given embeddings
-        dnd_embeddings = []
-        dnd_values = []
-        dnd_indices = []
-        dnd_additional_data = []
-        for i in range(len(embeddings)):
-            embedding, value, indices, additional_data = self.dicts[action].query([embeddings[i]], k)
-            dnd_embeddings.append(embedding[0])
-            dnd_values.append(value[0])
-            dnd_indices.append(indices[0])
-            dnd_additional_data.append(additional_data[0])
+        # query for nearest neighbors to all the given embeddings together
+        dnd_embeddings, dnd_values, dnd_indices, dnd_additional_data = self.dicts[action].query(embeddings, k)
 
         if self.return_additional_data:
             return dnd_embeddings, dnd_values, dnd_indices, dnd_additional_data
         else:
             return dnd_embeddings, dnd_values, dnd_indices
 
+    def query_all_actions(self, embeddings, k):
+        """
+        Query the dictionaries of all the actions for the nearest neighbors of a batch of embeddings
+        :param embeddings: the batch of embeddings to query for
+        :param k: the number of neighbors to return for each embedding
+        :return: the neighbors embeddings, values and indices in the dictionary of each action, as arrays of shapes
+                 [num actions, batch size, k, key width], [num actions, batch size, k] and [num actions, batch size, k]
+        """
+        num_embeddings = len(embeddings)
+        dnd_embeddings = np.zeros((self.num_actions, num_embeddings, k, self.key_width))
+        dnd_values = np.zeros((self.num_actions, num_embeddings, k))
+        dnd_indices = np.zeros((self.num_actions, num_embeddings, k), dtype=np.int64)
+        for action in range(self.num_actions):
+            # dictionaries without enough entries (during heatup) are left with zeros, which are never used
+            if self.dicts[action].has_enough_entries(k):
+                dnd_embeddings[action], dnd_values[action], dnd_indices[action], _ = \
+                    self.dicts[action].query(embeddings, k)
+        return dnd_embeddings, dnd_values, dnd_indices
+
     def has_enough_entries(self, k):
         # check if each of the action dictionaries has at least k entries
         for a in range(self.num_actions):
@@ -234,9 +416,8 @@ class QDND(object):
         # Update DND keys and values
         for batch_action, batch_keys, batch_values, batch_indices in zip(actions, key_gradients, value_gradients, indices):
             # Update keys (embeddings) and values in DND
-            for i, index in enumerate(batch_indices):
-                self.dicts[batch_action].embeddings[index, :] -= self.learning_rate * batch_keys[i, :]
-                self.dicts[batch_action].values[index] -= self.learning_rate * batch_values[i]
+            self.dicts[batch_action].update_keys_and_values(batch_indices, self.learning_rate * batch_keys,
+                                                            self.learning_rate * batch_values)
 
     def sample_embeddings(self, num_embeddings):
         num_actions = len(self.dicts)
@@ -256,11 +437,7 @@ class QDND(object):
 
     def clean(self):
         # create a new dict for each action
-        self.dicts = []
-        for a in range(self.num_actions):
-            new_dict = AnnoyDictionary(self.dict_size, self.key_width, self.new_value_shift_coefficient,
-                                       key_error_threshold=self.key_error_threshold, num_neighbors=self.num_neighbors)
-            self.dicts.append(new_dict)
+        self.dicts = [self._create_dictionary() for _ in range(self.num_actions)]
 
 
 def load_dnd(model_dir):
@@ -275,6 +452,10 @@ def load_dnd(model_dir):
         DND = pickle.load(f)
 
         for a in range(DND.num_actions):
+            # only the annoy index needs to be rebuilt
+            if not isinstance(DND.dicts[a], AnnoyDictionary):
+                continue
+
             DND.dicts[a].index = AnnoyIndex(512, metric='euclidean')
             DND.dicts[a].index.set_seed(1)
 
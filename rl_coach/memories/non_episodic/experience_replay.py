@@ -19,7 +19,9 @@ from typing import List, Tuple, Union, Dict, Any
 import numpy as np
 from rl_coach.utils import ReaderWriterLock
 
-from rl_coach.core_types import Transition
+from rl_coach.core_types import Transition, Batch
+from rl_coach.memories.column_storage import ColumnStorage
+from rl_coach.memories.columnar_format import ShardedTransitionsWriter, ShardedTransitionsReader
 from rl_coach.memories.memory import Memory, MemoryGranularity, MemoryParameters
 
 
@@ -28,6 +30,7 @@ class ExperienceReplayParameters(MemoryParameters):
         super().__init__()
         self.max_size = (MemoryGranularity.Transitions, 1000000)
         self.allow_duplicates_in_batch_sampling = True
+        self.use_preallocated_storage = False
 
     @property
     def path(self):
@@ -38,19 +41,40 @@ class ExperienceReplay(Memory):
     """
     A regular replay buffer which stores transition without any additional structure
     """
-    def __init__(self, max_size: Tuple[MemoryGranularity, int], allow_duplicates_in_batch_sampling: bool=True):
+    def __init__(self, max_size: Tuple[MemoryGranularity, int], allow_duplicates_in_batch_sampling: bool=True,
+                 use_preallocated_storage: bool=False):
         """
         :param max_size: the maximum number of transitions or episodes to hold in the memory
         :param allow_duplicates_in_batch_sampling: allow having the same transition multiple times in a batch
+        :param use_preallocated_storage: keep the transitions in preallocated numpy columns with a wrapping write
+                                         cursor instead of a list of transitions. this makes storing and evicting
+                                         transitions O(1) and fixes the memory footprint when the buffer is filled
+                                         for the first time
         """
         super().__init__(max_size)
-        if max_size[0] != MemoryGranularity.Transitions:
-            raise ValueError("Experience replay size can only be configured in terms of transitions")
-        self.transitions = []
+        if max_size[0] not in [MemoryGranularity.Transitions, MemoryGranularity.Bytes]:
+            raise ValueError("Experience replay size can only be configured in terms of transitions or bytes")
+        if use_preallocated_storage and max_size[0] != MemoryGranularity.Transitions:
+            raise ValueError("A preallocated storage has a fixed number of transitions, so the size of an experience "
+                             "replay with a preallocated storage can only be configured in terms of transitions")
+        if use_preallocated_storage and max_size[1] <= 0:
+            raise ValueError("An experience replay with a preallocated storage must have a positive maximum size")
+        self.use_preallocated_storage = use_preallocated_storage
+        self.transitions = self._create_transitions_storage()
         self._num_transitions = 0
         self.allow_duplicates_in_batch_sampling = allow_duplicates_in_batch_sampling
 
-        self.reader_writer_lock = ReaderWriterLock()
+        self.reader_writer_lock = ReaderWriterLock(interprocess=self.shares_storage_between_processes)
+
+    def _create_transitions_storage(self) -> Union[List[Transition], ColumnStorage]:
+        """
+        Create an empty container for the transitions of the replay buffer
+        :return: a list of transitions or a column storage, according to the storage mode of the replay buffer
+        """
+        if self.use_preallocated_storage:
+            return ColumnStorage(self.max_size[1])
+        else:
+            return []
 
     def length(self) -> int:
         """
@@ -64,6 +88,17 @@ class ExperienceReplay(Memory):
         """
         return self._num_transitions
 
+    def _sample_indices(self, size: int) -> np.ndarray:
+        if self.allow_duplicates_in_batch_sampling:
+            return np.random.randint(self.num_transitions(), size=size)
+
+        if self.num_transitions() >= size:
+            return np.random.choice(self.num_transitions(), size=size, replace=False)
+
+        self.reader_writer_lock.release_writing()
+        raise ValueError("The replay buffer cannot be sampled since there are not enough transitions yet. "
+                         "There are currently {} transitions".format(self.num_transitions()))
+
     def sample(self, size: int) -> List[Transition]:
         """
         Sample a batch of transitions form the replay buffer. If the requested size is larger than the number
@@ -74,17 +109,31 @@ class ExperienceReplay(Memory):
         """
         self.reader_writer_lock.lock_writing()
 
-        if self.allow_duplicates_in_batch_sampling:
-            transitions_idx = np.random.randint(self.num_transitions(), size=size)
+        transitions_idx = self._sample_indices(size)
 
+        if self.use_preallocated_storage:
+            batch = self.transitions.gather(self.transitions.rows(transitions_idx))
         else:
-            if self.num_transitions() >= size:
-                transitions_idx = np.random.choice(self.num_transitions(), size=size, replace=False)
-            else:
-                raise ValueError("The replay buffer cannot be sampled since there are not enough transitions yet. "
-                                 "There are currently {} transitions".format(self.num_transitions()))
+            batch = [self.transitions[i] for i in transitions_idx]
 
-        batch = [self.transitions[i] for i in transitions_idx]
+        self.reader_writer_lock.release_writing()
+
+        return batch
+
+    def sample_batch(self, size: int) -> Batch:
+        """
+        Sample a batch of transitions from the replay buffer. When the storage is preallocated, the batch is gathered
+        directly from the columns of the storage as a ColumnarBatch, without building the sampled transitions.
+        :param size: the size of the batch to sample
+        :return: the sampled batch
+        """
+        if not self.use_preallocated_storage:
+            return super().sample_batch(size)
+
+        self.reader_writer_lock.lock_writing()
+
+        transitions_idx = self._sample_indices(size)
+        batch = self.transitions.gather_batch(self.transitions.rows(transitions_idx))
 
         self.reader_writer_lock.release_writing()
 
@@ -101,8 +150,11 @@ class ExperienceReplay(Memory):
         if granularity == MemoryGranularity.Transitions:
             while size != 0 and self.num_transitions() > size:
                 self.remove_transition(0, False)
+        elif granularity == MemoryGranularity.Bytes:
+            while size != 0 and self.num_transitions() > 0 and self._memory_usage > size:
+                self.remove_transition(0, False)
         else:
-            raise ValueError("The granularity of the replay buffer can only be set in terms of transitions")
+            raise ValueError("The granularity of the replay buffer can only be set in terms of transitions or bytes")
 
     def store(self, transition: Transition, lock: bool=True) -> None:
         """
@@ -115,8 +167,11 @@ class ExperienceReplay(Memory):
         if lock:
             self.reader_writer_lock.lock_writing_and_reading()
 
-        self._num_transitions += 1
+        # a preallocated storage overwrites its oldest transition by itself once it is full
         self.transitions.append(transition)
+        if not self.use_preallocated_storage:
+            self._add_memory_usage(transition)
+        self._num_transitions = len(self.transitions)
         self._enforce_max_length()
 
         if lock:
@@ -155,6 +210,8 @@ class ExperienceReplay(Memory):
 
         if self.num_transitions() > transition_index:
             self._num_transitions -= 1
+            if not self.use_preallocated_storage:
+                self._add_memory_usage(self.transitions[transition_index], sign=-1)
             del self.transitions[transition_index]
 
         if lock:
@@ -200,12 +257,32 @@ class ExperienceReplay(Memory):
         if lock:
             self.reader_writer_lock.lock_writing_and_reading()
 
-        self.transitions = []
+        if self.use_preallocated_storage:
+            # keep the allocated columns for the next transitions
+            self.transitions.clear()
+        else:
+            self.transitions = []
         self._num_transitions = 0
+        self._reset_memory_usage()
 
         if lock:
             self.reader_writer_lock.release_writing_and_reading()
 
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Get the number of bytes held by the transitions in the memory, for each of the transitions fields. A
+        preallocated storage reports the size of its allocated columns.
+        :return: a dictionary from the names of the fields to the number of bytes they hold
+        """
+        if self.use_preallocated_storage:
+            self.reader_writer_lock.lock_writing()
+
+            memory_usage = self.transitions.memory_usage()
+
+            self.reader_writer_lock.release_writing()
+            return memory_usage
+        return super().memory_usage()
+
     def mean_reward(self) -> np.ndarray:
         """
         Get the mean reward in the replay buffer
@@ -213,8 +290,38 @@ class ExperienceReplay(Memory):
         """
         self.reader_writer_lock.lock_writing()
 
-        mean = np.mean([transition.reward for transition in self.transitions])
+        if self.use_preallocated_storage:
+            mean = np.mean(self.transitions.column('reward'))
+        else:
+            mean = np.mean([transition.reward for transition in self.transitions])
 
         self.reader_writer_lock.release_writing()
 
         return mean
+
+    def save(self, directory: str, shard_size: int=10000) -> None:
+        """
+        Save the transitions of the replay buffer to a directory, in the chunked columnar format
+        :param directory: the directory to save the replay buffer to
+        :param shard_size: the maximum number of transitions in each shard
+        :return: None
+        """
+        self.reader_writer_lock.lock_writing()
+
+        writer = ShardedTransitionsWriter(directory, shard_size)
+        for transition in self.transitions:
+            writer.append(transition, episode_end=transition.game_over)
+        writer.close()
+
+        self.reader_writer_lock.release_writing()
+
+    def load(self, directory: str, mmap: bool=True) -> None:
+        """
+        Store the transitions of a replay buffer that was saved with save(), streaming them shard by shard
+        :param directory: the directory that the replay buffer was saved to
+        :param mmap: memory map the saved shards instead of reading them to memory. the stored transitions then
+                     reference the memory mapped data, unless the replay buffer uses a preallocated storage
+        :return: None
+        """
+        for transition, _ in ShardedTransitionsReader(directory, mmap).transitions():
+            self.store(transition)
@@ -0,0 +1,230 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from rl_coach.core_types import Transition
+from rl_coach.memories.column_storage import ColumnStorage
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.experience_replay import ExperienceReplayParameters, ExperienceReplay
+
+
+class MemoryMappedExperienceReplayParameters(ExperienceReplayParameters):
+    def __init__(self):
+        super().__init__()
+        # the storage is always preallocated, so this can't be changed
+        self.use_preallocated_storage = True
+        # the directory of the memory mapped files. when running through an agent, it defaults to a replay_buffer
+        # directory under the experiment path
+        self.storage_directory = None
+
+    @property
+    def path(self):
+        return 'rl_coach.memories.non_episodic.memory_mapped_experience_replay:MemoryMappedExperienceReplay'
+
+
+class MemoryMappedColumnStorage(ColumnStorage):
+    """
+    A column storage which keeps the state and next state columns in memory mapped files (np.memmap), while the
+    actions, rewards, game over flags and infos are kept in RAM. Only the pages of the files which are accessed are
+    loaded to memory, so the capacity of the storage is bounded by the disk size rather than by the RAM size.
+    """
+    CHECKPOINT_METADATA_FILE = 'metadata.pkl'
+
+    def __init__(self, capacity: int, directory: str):
+        """
+        :param capacity: the maximum number of transitions that the storage can hold
+        :param directory: the directory in which the memory mapped files will be created
+        """
+        super().__init__(capacity)
+        self.directory = directory
+        self.files = OrderedDict()  # the names of the files of the memory mapped columns
+
+    def _allocate_array(self, name: str, shape: Tuple, dtype: np.dtype) -> np.ndarray:
+        if not name.startswith(self.STATE_PREFIX) and not name.startswith(self.NEXT_STATE_PREFIX):
+            return super()._allocate_array(name, shape, dtype)
+        os.makedirs(self.directory, exist_ok=True)
+        self.files[name] = name.replace('/', '.') + '.dat'
+        return np.memmap(os.path.join(self.directory, self.files[name]), dtype=dtype, mode='w+', shape=shape)
+
+    def _read_rows(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """
+        Read the given rows of a column. The memory mapped columns are read with a single fancy indexing operation over
+        the sorted unique rows, so that the files are read sequentially.
+        :param name: the name of the column
+        :param rows: the rows to read
+        :return: a copy of the values of the rows
+        """
+        if name not in self.files:
+            return self.columns[name][rows]
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        return self.columns[name][unique_rows][inverse]
+
+    def _gather_state(self, rows: np.ndarray, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        return {key: self._read_rows(prefix + key, rows) for key in keys}
+
+    def gather(self, rows: np.ndarray) -> List[Transition]:
+        """
+        Build a list of transitions from the given rows. The states of the returned transitions are copies of the
+        stored data.
+        :param rows: the rows to gather
+        :return: a list of transitions
+        """
+        values = {name: self._read_rows(name, rows) for name in self.columns.keys()}
+        infos = self.info[rows]
+        return [Transition(state={key: values[self.STATE_PREFIX + key][i] for key in self.state_keys},
+                           action=values['action'][i], reward=values['reward'][i],
+                           next_state={key: values[self.NEXT_STATE_PREFIX + key][i] for key in self.next_state_keys},
+                           game_over=values['game_over'][i], info=infos[i])
+                for i in range(len(rows))]
+
+    def flush(self) -> None:
+        """
+        Write any change in the memory mapped columns to the disk
+        :return: None
+        """
+        for name in self.files.keys():
+            self.columns[name].flush()
+
+    def save_checkpoint(self, checkpoint_dir: str) -> None:
+        """
+        Save a copy of the storage to the given directory. The memory mapped files are copied as they are and the rest
+        of the storage is pickled.
+        :param checkpoint_dir: the directory to save the storage to
+        :return: None
+        """
+        self.flush()
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        for file_name in self.files.values():
+            shutil.copyfile(os.path.join(self.directory, file_name), os.path.join(checkpoint_dir, file_name))
+
+        metadata = {key: value for key, value in self.__dict__.items() if key not in ['columns', 'directory']}
+        metadata['columns'] = OrderedDict()
+        for name, column in self.columns.items():
+            metadata['columns'][name] = (column.dtype, column.shape) if name in self.files else np.array(column)
+        with open(os.path.join(checkpoint_dir, self.CHECKPOINT_METADATA_FILE), 'wb') as f:
+            pickle.dump(metadata, f, pickle.HIGHEST_PROTOCOL)
+
+    def restore_checkpoint(self, checkpoint_dir: str) -> None:
+        """
+        Replace the content of the storage with a storage saved by save_checkpoint. The saved memory mapped files are
+        copied into the directory of this storage.
+        :param checkpoint_dir: the directory that the storage was saved to
+        :return: None
+        """
+        with open(os.path.join(checkpoint_dir, self.CHECKPOINT_METADATA_FILE), 'rb') as f:
+            metadata = pickle.load(f)
+        saved_columns = metadata.pop('columns')
+        self.__dict__.update(metadata)
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.columns = OrderedDict()
+        for name, column in saved_columns.items():
+            if name in self.files:
+                path = os.path.join(self.directory, self.files[name])
+                shutil.copyfile(os.path.join(checkpoint_dir, self.files[name]), path)
+                dtype, shape = column
+                self.columns[name] = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+            else:
+                self.columns[name] = column
+
+
+class MemoryMappedExperienceReplay(ExperienceReplay):
+    """
+    An experience replay for capacities which do not fit in RAM. The observations of the transitions are kept in
+    memory mapped files on a local disk, and the rest of the transitions fields are kept in RAM. The sampled rows are
+    gathered from the files with fancy indexing, relying on the page cache of the OS for the recently accessed rows.
+    """
+    # memories which were pickled before temporary directories were removed
+    is_temporary_storage_directory = False
+
+    def __init__(self, max_size: Tuple[MemoryGranularity, int], allow_duplicates_in_batch_sampling: bool=True,
+                 storage_directory: str=None):
+        """
+        :param max_size: the maximum number of transitions to hold in the memory
+        :param allow_duplicates_in_batch_sampling: allow having the same transition multiple times in a batch
+        :param storage_directory: the directory of the memory mapped files. if not given, a temporary directory is
+                                  used, which is removed when the memory is closed
+        """
+        self.storage_directory = storage_directory
+        self.is_temporary_storage_directory = storage_directory is None
+        self.last_checkpoint_dir = None
+        super().__init__(max_size, allow_duplicates_in_batch_sampling, use_preallocated_storage=True)
+
+    def _create_transitions_storage(self) -> MemoryMappedColumnStorage:
+        if self.storage_directory is None:
+            self.storage_directory = tempfile.mkdtemp(prefix='replay_buffer_')
+        return MemoryMappedColumnStorage(self.max_size[1], self.storage_directory)
+
+    def close(self) -> None:
+        """
+        Remove the memory mapped files if they were written to a temporary directory
+        :return: None
+        """
+        if self.is_temporary_storage_directory and os.path.exists(self.storage_directory):
+            shutil.rmtree(self.storage_directory)
+
+    def set_experiment_path(self, experiment_path: str, name: str) -> None:
+        """
+        Keep the memory mapped files in a replay_buffer directory under the experiment path instead of in a temporary
+        directory. The directory is only changed if it was not given explicitly and nothing was stored in the memory.
+        :param experiment_path: the path of the experiment directory
+        :param name: the name of the replay buffer (e.g. the full name of the agent which owns it)
+        :return: None
+        """
+        if experiment_path is None or not self.is_temporary_storage_directory or len(self.transitions.files) > 0:
+            return
+        shutil.rmtree(self.storage_directory)
+        self.storage_directory = os.path.join(experiment_path, 'replay_buffer', name)
+        self.is_temporary_storage_directory = False
+        self.transitions.directory = self.storage_directory
+
+    def save_checkpoint(self, checkpoint_dir: str) -> None:
+        """
+        Save a copy of the replay buffer to the given directory. Since the memory mapped files may be very large,
+        the copy saved by the previous call to this method is removed once the new copy is saved.
+        :param checkpoint_dir: the directory to save the replay buffer to
+        :return: None
+        """
+        self.reader_writer_lock.lock_writing_and_reading()
+
+        self.transitions.save_checkpoint(checkpoint_dir)
+        if self.last_checkpoint_dir is not None and self.last_checkpoint_dir != checkpoint_dir \
+                and os.path.exists(self.last_checkpoint_dir):
+            shutil.rmtree(self.last_checkpoint_dir)
+        self.last_checkpoint_dir = checkpoint_dir
+
+        self.reader_writer_lock.release_writing_and_reading()
+
+    def restore_checkpoint(self, checkpoint_dir: str) -> None:
+        """
+        Replace the content of the replay buffer with a replay buffer saved by save_checkpoint
+        :param checkpoint_dir: the directory that the replay buffer was saved to
+        :return: None
+        """
+        self.reader_writer_lock.lock_writing_and_reading()
+
+        self.transitions.restore_checkpoint(checkpoint_dir)
+        self._num_transitions = len(self.transitions)
+
+        self.reader_writer_lock.release_writing_and_reading()
@@ -15,9 +15,8 @@
 #
 
 import operator
-import random
 from enum import Enum
-from typing import List, Tuple, Any
+from typing import List, Tuple, Any, Dict
 
 import numpy as np
 from rl_coach.memories.memory import MemoryGranularity
@@ -34,6 +33,9 @@ class PrioritizedExperienceReplayParameters(ExperienceReplayParameters):
         self.alpha = 0.6
         self.beta = ConstantSchedule(0.4)
         self.epsilon = 1e-6
+        # the transitions are sampled from the segment trees, which hold their own references to them, so they are
+        # never kept in a preallocated storage and this can't be changed
+        self.use_preallocated_storage = False
 
     @property
     def path(self):
@@ -42,14 +44,17 @@ class PrioritizedExperienceReplayParameters(ExperienceReplayParameters):
 
 class SegmentTree(object):
     """
-    A tree which can be used as a min/max heap or a sum tree
+    A tree which can be used as a min/max heap or a sum tree.
+    The tree is kept in a flat numpy array, and batches of updates and queries are handled together, one tree level
+    at a time.
     Add or update item value - O(log N)
     Sampling an item - O(log N)
+    Updating or sampling a batch of B items - O(log N) array operations of size B
     """
     class Operation(Enum):
-        MAX = {"operator": max, "initial_value": -float("inf")}
-        MIN = {"operator": min, "initial_value": float("inf")}
-        SUM = {"operator": operator.add, "initial_value": 0}
+        MAX = {"operator": max, "numpy_operator": np.maximum, "initial_value": -float("inf")}
+        MIN = {"operator": min, "numpy_operator": np.minimum, "initial_value": float("inf")}
+        SUM = {"operator": operator.add, "numpy_operator": np.add, "initial_value": 0}
 
     def __init__(self, size: int, operation: Operation):
         self.next_leaf_idx_to_write = 0
@@ -62,16 +67,26 @@ class SegmentTree(object):
 
     def _propagate(self, node_idx: int) -> None:
         """
-        Propagate an update of a node's value to its parent node
+        Propagate an update of a node's value up to the root of the tree
         :param node_idx: the index of the node that was updated
         :return: None
         """
-        parent = (node_idx - 1) // 2
+        combine = self.operation.value['operator']
+        while node_idx > 0:
+            node_idx = (node_idx - 1) // 2
+            self.tree[node_idx] = combine(self.tree[node_idx * 2 + 1], self.tree[node_idx * 2 + 2])
 
-        self.tree[parent] = self.operation.value['operator'](self.tree[parent * 2 + 1], self.tree[parent * 2 + 2])
-
-        if parent != 0:
-            self._propagate(parent)
+    def _propagate_batch(self, node_idxs: np.ndarray) -> None:
+        """
+        Propagate an update of several nodes in the same level of the tree up to the root of the tree.
+        Each level is updated using a single array operation.
+        :param node_idxs: the indices of the nodes that were updated
+        :return: None
+        """
+        combine = self.operation.value['numpy_operator']
+        while node_idxs.size > 0 and node_idxs[0] > 0:
+            node_idxs = np.unique((node_idxs - 1) // 2)
+            self.tree[node_idxs] = combine(self.tree[node_idxs * 2 + 1], self.tree[node_idxs * 2 + 2])
 
     def _retrieve(self, root_node_idx: int, val: float)-> int:
         """
@@ -80,16 +95,34 @@ class SegmentTree(object):
         :param val: the value to query for
         :return: the index of the resulting node
         """
-        left = 2 * root_node_idx + 1
-        right = left + 1
-
-        if left >= len(self.tree):
-            return root_node_idx
-
-        if val <= self.tree[left]:
-            return self._retrieve(left, val)
-        else:
-            return self._retrieve(right, val-self.tree[left])
+        node_idx = root_node_idx
+        left = 2 * node_idx + 1
+        while left < len(self.tree):
+            if val <= self.tree[left]:
+                node_idx = left
+            else:
+                val -= self.tree[left]
+                node_idx = left + 1
+            left = 2 * node_idx + 1
+        return node_idx
+
+    def _retrieve_batch(self, vals: np.ndarray) -> np.ndarray:
+        """
+        Retrieve the leaves matching a batch of values, by descending from the root of the tree with all the values
+        together, one level at a time
+        :param vals: the values to query for
+        :return: the indices of the resulting nodes
+        """
+        vals = np.array(vals, dtype=np.float64)
+        node_idxs = np.zeros(vals.shape, dtype=np.int64)
+        leaves_start = self.size - 1
+        while node_idxs.size > 0 and node_idxs[0] < leaves_start:
+            left = 2 * node_idxs + 1
+            left_vals = self.tree[left]
+            go_right = vals > left_vals
+            vals = np.where(go_right, vals - left_vals, vals)
+            node_idxs = np.where(go_right, left + 1, left)
+        return node_idxs
 
     def total_value(self) -> float:
         """
@@ -128,6 +161,21 @@ class SegmentTree(object):
         self.tree[node_idx] = new_val
         self._propagate(node_idx)
 
+    def update_batch(self, leaf_idxs: np.ndarray, new_vals: np.ndarray) -> None:
+        """
+        Update the values of several leaves at once. If the same leaf appears several times, its last value is used.
+        :param leaf_idxs: the indices of the leaves to update
+        :param new_vals: the new values of the leaves
+        :return: None
+        """
+        node_idxs = np.asarray(leaf_idxs, dtype=np.int64) + self.size - 1
+        if np.any(node_idxs < self.size - 1) or np.any(node_idxs >= len(self.tree)):
+            raise ValueError("Some of the given leaf indices ({}) can not be found in the tree. The available leaves "
+                             "are: 0-{}".format(leaf_idxs, self.size - 1))
+
+        self.tree[node_idxs] = new_vals
+        self._propagate_batch(node_idxs)
+
     def get(self, val: float) -> Tuple[int, float, Any]:
         """
         Given a value between 0 and the tree sum, return the object which this value is in it's range.
@@ -145,6 +193,20 @@ class SegmentTree(object):
 
         return leaf_idx, data_value, data
 
+    def get_batch(self, vals: np.ndarray) -> Tuple[np.ndarray, np.ndarray, List[Any]]:
+        """
+        A batched version of get. Given several values between 0 and the tree sum, return the leaves which each of the
+        values is in their range.
+        :param vals: an array of values within the range 0 and the tree sum
+        :return: the indices of the resulting leaves in the tree, their values and the objects themselves
+        """
+        node_idxs = self._retrieve_batch(vals)
+        leaf_idxs = node_idxs - self.size + 1
+        data_values = self.tree[node_idxs]
+        data = [self.data[leaf_idx] for leaf_idx in leaf_idxs]
+
+        return leaf_idxs, data_values, data
+
     def __str__(self):
         result = ""
         start = 0
@@ -184,35 +246,36 @@ class PrioritizedExperienceReplay(ExperienceReplay):
         self.beta = beta
         self.epsilon = epsilon
         self.maximal_priority = 1.0
+        # the number of times each leaf was written to, which allows ignoring priority updates of sampled transitions
+        # that were overwritten before the update arrived (e.g. when batches are sampled ahead of time)
+        self.leaf_versions = np.zeros(self.power_of_2_size, dtype=np.int64)
 
-    def _update_priority(self, leaf_idx: int, error: float) -> None:
-        """
-        Update the priority of a given transition, using its index in the tree and its error
-        :param leaf_idx: the index of the transition leaf in the tree
-        :param error: the new error value
-        :return: None
-        """
-        if error < 0:
-            raise ValueError("The priorities must be non-negative values")
-        priority = (error + self.epsilon)
-        self.sum_tree.update(leaf_idx, priority ** self.alpha)
-        self.min_tree.update(leaf_idx, priority ** self.alpha)
-        self.max_tree.update(leaf_idx, priority)
-        self.maximal_priority = self.max_tree.total_value()
-
-    def update_priorities(self, indices: List[int], error_values: List[float]) -> None:
+    def update_priorities(self, indices: List[int], error_values: List[float], versions: List[int]=None) -> None:
         """
         Update the priorities of a batch of transitions using their indices and their new TD error terms
         :param indices: the indices of the transitions to update
         :param error_values: the new error values
+        :param versions: the versions of the transitions leaves, as returned by sample_with_info. if given, the
+                         transitions which were overwritten since they were sampled are not updated
         :return: None
         """
-        self.reader_writer_lock.lock_writing_and_reading()
-
         if len(indices) != len(error_values):
             raise ValueError("The number of indexes requested for update don't match the number of error values given")
-        for transition_idx, error in zip(indices, error_values):
-            self._update_priority(transition_idx, error)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        errors = np.asarray(error_values, dtype=np.float64).reshape(-1)
+        if np.any(errors < 0):
+            raise ValueError("The priorities must be non-negative values")
+
+        self.reader_writer_lock.lock_writing_and_reading()
+
+        if versions is not None:
+            is_current = self.leaf_versions[indices] == np.asarray(versions).reshape(-1)
+            indices, errors = indices[is_current], errors[is_current]
+        priorities = errors + self.epsilon
+        self.sum_tree.update_batch(indices, priorities ** self.alpha)
+        self.min_tree.update_batch(indices, priorities ** self.alpha)
+        self.max_tree.update_batch(indices, priorities)
+        self.maximal_priority = self.max_tree.total_value()
 
         self.reader_writer_lock.release_writing_and_reading()
 
@@ -220,46 +283,52 @@ class PrioritizedExperienceReplay(ExperienceReplay):
         """
         Sample a batch of transitions form the replay buffer. If the requested size is larger than the number
         of samples available in the replay buffer then the batch will return empty.
+        The indices and importance sampling weights of the transitions are not returned. Use sample_with_info to get
+        them as well.
         :param size: the size of the batch to sample
         :return: a batch (list) of selected transitions from the replay buffer
         """
+        batch, _ = self.sample_with_info(size)
+        return batch
+
+    def sample_with_info(self, size: int) -> Tuple[List[Transition], Dict[str, np.ndarray]]:
+        """
+        Sample a batch of transitions form the replay buffer, together with their indices in the segment trees and
+        their normalized importance sampling weights. The stored transitions are not modified.
+        :param size: the size of the batch to sample
+        :return: a batch (list) of selected transitions from the replay buffer and a dictionary holding an array of
+                 tree indices (idx), an array of the versions of the tree leaves (version) and an array of importance
+                 sampling weights (weight) for the batch
+        """
 
         self.reader_writer_lock.lock_writing()
 
         if self.num_transitions() >= size:
-            # split the tree leaves to equal segments and sample one transition from each segment
-            batch = []
-            segment_size = self.sum_tree.total_value() / size
+            total_priority = self.sum_tree.total_value()
+
+            # split the tree leaves to equal segments and sample one value from each segment
+            segment_size = total_priority / size
+            vals = (np.arange(size) + np.random.uniform(size=size)) * segment_size
+            leaf_idxs, priorities, batch = self.sum_tree.get_batch(vals)
 
             # get the maximum weight in the memory
-            min_probability = self.min_tree.total_value() / self.sum_tree.total_value()  # min P(j) = min p^a / sum(p^a)
+            min_probability = self.min_tree.total_value() / total_priority  # min P(j) = min p^a / sum(p^a)
             max_weight = (min_probability * self.num_transitions()) ** -self.beta.current_value  # max wi
 
-            # sample a batch
-            for i in range(size):
-                start_probability = segment_size * i
-                end_probability = segment_size * (i + 1)
-
-                # sample leaf and calculate its weight
-                val = random.uniform(start_probability, end_probability)
-                leaf_idx, priority, transition = self.sum_tree.get(val)
-                priority /= self.sum_tree.total_value()   # P(j) = p^a / sum(p^a)
-                weight = (self.num_transitions() * priority) ** -self.beta.current_value  # (N * P(j)) ^ -beta
-                normalized_weight = weight / max_weight  # wj = ((N * P(j)) ^ -beta) / max wi
-
-                transition.info['idx'] = leaf_idx
-                transition.info['weight'] = normalized_weight
-
-                batch.append(transition)
+            # calculate the weights of the batch
+            probabilities = priorities / total_priority  # P(j) = p^a / sum(p^a)
+            weights = (self.num_transitions() * probabilities) ** -self.beta.current_value  # (N * P(j)) ^ -beta
+            normalized_weights = weights / max_weight  # wj = ((N * P(j)) ^ -beta) / max wi
 
             self.beta.step()
 
         else:
+            self.reader_writer_lock.release_writing()
             raise ValueError("The replay buffer cannot be sampled since there are not enough transitions yet. "
                              "There are currently {} transitions".format(self.num_transitions()))
 
         self.reader_writer_lock.release_writing()
-        return batch
+        return batch, {'idx': leaf_idxs, 'version': self.leaf_versions[leaf_idxs], 'weight': normalized_weights}
 
     def store(self, transition: Transition) -> None:
         """
@@ -270,6 +339,7 @@ class PrioritizedExperienceReplay(ExperienceReplay):
         self.reader_writer_lock.lock_writing_and_reading()
 
         transition_priority = self.maximal_priority
+        self.leaf_versions[self.sum_tree.next_leaf_idx_to_write] += 1
         self.sum_tree.add(transition_priority ** self.alpha, transition)
         self.min_tree.add(transition_priority ** self.alpha, transition)
         self.max_tree.add(transition_priority, transition)
@@ -288,5 +358,6 @@ class PrioritizedExperienceReplay(ExperienceReplay):
         self.sum_tree = SegmentTree(self.power_of_2_size, SegmentTree.Operation.SUM)
         self.min_tree = SegmentTree(self.power_of_2_size, SegmentTree.Operation.MIN)
         self.max_tree = SegmentTree(self.power_of_2_size, SegmentTree.Operation.MAX)
+        self.leaf_versions += 1
 
         self.reader_writer_lock.release_writing_and_reading()
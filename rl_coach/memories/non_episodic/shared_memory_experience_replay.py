@@ -0,0 +1,275 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pickle
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from rl_coach.core_types import Transition, ColumnarBatch
+from rl_coach.memories.column_storage import ColumnStorage
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.experience_replay import ExperienceReplayParameters, ExperienceReplay
+
+
+class SharedMemoryExperienceReplayParameters(ExperienceReplayParameters):
+    def __init__(self):
+        super().__init__()
+        # the storage is always preallocated, so this can't be changed
+        self.use_preallocated_storage = True
+
+    @property
+    def path(self):
+        return 'rl_coach.memories.non_episodic.shared_memory_experience_replay:SharedMemoryExperienceReplay'
+
+
+def get_resource_tracker_pid() -> int:
+    """
+    :return: the pid of the resource tracker of this process, which processes forked from it share with it
+    """
+    resource_tracker.ensure_running()
+    return resource_tracker._resource_tracker._pid
+
+
+def attach_shared_memory(name: str, owner_resource_tracker_pid: int) -> SharedMemory:
+    """
+    Attach to an existing shared memory segment, without letting the resource tracker of this process remove the
+    segment when the process exits. The segment is owned by the process which created it, and is registered with its
+    resource tracker, so that the segment is removed if that process crashes. Processes forked from it share the same
+    resource tracker, so the segment is only unregistered from the resource trackers of other processes.
+    :param name: the name of the segment
+    :param owner_resource_tracker_pid: the pid of the resource tracker of the process which created the segment
+    :return: the attached segment
+    """
+    segment = SharedMemory(name=name)
+    if get_resource_tracker_pid() != owner_resource_tracker_pid:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+class SharedMemoryColumnStorage(ColumnStorage):
+    """
+    A column storage which keeps its columns in OS shared memory, so that several processes can write and read the
+    same transitions directly, without sending them through another process.
+
+    The cursors of the storage are kept in a small shared control block. The columns are allocated by the process
+    which stores the first transition, and their description (the schema) is written to a shared segment of its own,
+    which the other processes read in order to attach to the columns. Pickling the storage only pickles the names of
+    the shared segments, and unpickling it attaches to them.
+
+    The infos of the transitions are not shared, and the transitions read from the storage always have an empty info.
+    Accessing the storage from several processes should be synchronized with an external lock.
+    """
+    # the fields of the control block
+    HEAD = 0
+    SIZE = 1
+    ALLOCATED = 2
+    SCHEMA_SIZE = 3
+    NUM_CONTROL_FIELDS = 4
+    MAX_SEGMENT_NAME_LENGTH = 256
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: the maximum number of transitions that the storage can hold
+        """
+        self._segments = OrderedDict()
+        self._create_control_block()
+        self._owner_resource_tracker_pid = get_resource_tracker_pid()
+        super().__init__(capacity)
+
+    def _create_control_block(self) -> None:
+        self._control_segment = SharedMemory(create=True, size=8 * self.NUM_CONTROL_FIELDS +
+                                             self.MAX_SEGMENT_NAME_LENGTH)
+        self._attach_control_block()
+        self._control[:] = 0
+
+    def _attach_control_block(self) -> None:
+        self._control = np.ndarray((self.NUM_CONTROL_FIELDS,), dtype=np.int64, buffer=self._control_segment.buf)
+        self._schema_segment_name = np.ndarray((self.MAX_SEGMENT_NAME_LENGTH,), dtype=np.uint8,
+                                               buffer=self._control_segment.buf, offset=8 * self.NUM_CONTROL_FIELDS)
+
+    @property
+    def head(self) -> int:
+        return int(self._control[self.HEAD])
+
+    @head.setter
+    def head(self, value: int) -> None:
+        self._control[self.HEAD] = value
+
+    @property
+    def size(self) -> int:
+        return int(self._control[self.SIZE])
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self._control[self.SIZE] = value
+
+    def _allocate_array(self, name: str, shape: Tuple, dtype: np.dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        segment = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+        self._segments[name] = (segment, dtype.str, shape)
+        return np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+    def allocate(self, transition: Transition) -> None:
+        super().allocate(transition)
+        schema = pickle.dumps({
+            'state_keys': self.state_keys,
+            'next_state_keys': self.next_state_keys,
+            'columns': [(name, segment.name, dtype, shape) for name, (segment, dtype, shape) in self._segments.items()]
+        })
+        schema_segment = SharedMemory(create=True, size=len(schema))
+        schema_segment.buf[:len(schema)] = schema
+        self._segments['schema'] = (schema_segment, None, None)
+
+        schema_segment_name = schema_segment.name.encode()
+        self._schema_segment_name[:] = 0
+        self._schema_segment_name[:len(schema_segment_name)] = np.frombuffer(schema_segment_name, dtype=np.uint8)
+        self._control[self.SCHEMA_SIZE] = len(schema)
+        self._control[self.ALLOCATED] = 1
+
+    def _attach_columns(self) -> None:
+        schema_segment_name = bytes(self._schema_segment_name).rstrip(b'\0').decode()
+        schema_segment = attach_shared_memory(schema_segment_name, self._owner_resource_tracker_pid)
+        schema = pickle.loads(bytes(schema_segment.buf[:int(self._control[self.SCHEMA_SIZE])]))
+        self._segments = OrderedDict([('schema', (schema_segment, None, None))])
+
+        self.state_keys = schema['state_keys']
+        self.next_state_keys = schema['next_state_keys']
+        self.columns = OrderedDict()
+        for name, segment_name, dtype, shape in schema['columns']:
+            segment = attach_shared_memory(segment_name, self._owner_resource_tracker_pid)
+            self._segments[name] = (segment, dtype, shape)
+            self.columns[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+
+    def is_allocated(self) -> bool:
+        # the columns may have been allocated by another process
+        if len(self.columns) == 0 and self._control[self.ALLOCATED]:
+            self._attach_columns()
+        return len(self.columns) > 0
+
+    def _write_row(self, row: int, transition: Transition) -> None:
+        super()._write_row(row, transition)
+        self.info[row] = None
+
+    def get_row(self, row: int) -> Transition:
+        self.is_allocated()
+        return super().get_row(row)
+
+    def gather(self, rows: np.ndarray) -> List[Transition]:
+        self.is_allocated()
+        return super().gather(rows)
+
+    def gather_batch(self, rows: np.ndarray, info: Dict[str, np.ndarray]=None) -> ColumnarBatch:
+        self.is_allocated()
+        return super().gather_batch(rows, info)
+
+    def column(self, name: str) -> np.ndarray:
+        self.is_allocated()
+        return super().column(name)
+
+    def unlink(self) -> None:
+        """
+        Remove the shared memory segments of the storage. The storage cannot be used by any of the processes after
+        calling this method.
+        :return: None
+        """
+        # the columns may have been allocated by another process, after this copy of the storage was unpickled
+        self.is_allocated()
+        self.columns = OrderedDict()
+        for segment, _, _ in self._segments.values():
+            segment.close()
+            segment.unlink()
+        self._segments = OrderedDict()
+        self._control = None
+        self._schema_segment_name = None
+        self._control_segment.close()
+        self._control_segment.unlink()
+
+    def __getstate__(self):
+        state = {key: value for key, value in self.__dict__.items()
+                 if key not in ['columns', 'state_keys', 'next_state_keys', 'info', '_segments', '_control',
+                                '_schema_segment_name', '_control_segment']}
+        state['control_segment_name'] = self._control_segment.name
+        return state
+
+    def __setstate__(self, state):
+        control_segment_name = state.pop('control_segment_name')
+        self.__dict__.update(state)
+        self._control_segment = attach_shared_memory(control_segment_name, self._owner_resource_tracker_pid)
+        self._attach_control_block()
+        self._segments = OrderedDict()
+        self.columns = OrderedDict()
+        self.state_keys = []
+        self.next_state_keys = []
+        self.info = np.empty(self.capacity, dtype=object)
+
+
+class SharedMemoryExperienceReplay(ExperienceReplay):
+    """
+    An experience replay for multi-worker runs, which keeps its transitions in OS shared memory. When the memory is
+    shared between the workers (shared_memory = True in the memory parameters), each worker attaches to the shared
+    columns and stores and samples transitions directly, instead of calling the memory through the shared memory
+    scratchpad process. The workers are synchronized with an interprocess readers-writer lock.
+
+    The infos of the transitions are not shared between the workers, and the sampled transitions have an empty info.
+    """
+    shares_storage_between_processes = True
+    is_unlinked = False
+
+    def __init__(self, max_size: Tuple[MemoryGranularity, int], allow_duplicates_in_batch_sampling: bool=True):
+        """
+        :param max_size: the maximum number of transitions to hold in the memory
+        :param allow_duplicates_in_batch_sampling: allow having the same transition multiple times in a batch
+        """
+        super().__init__(max_size, allow_duplicates_in_batch_sampling, use_preallocated_storage=True)
+
+    def _create_transitions_storage(self) -> SharedMemoryColumnStorage:
+        return SharedMemoryColumnStorage(self.max_size[1])
+
+    def num_transitions(self) -> int:
+        # the transitions may have been stored by other processes
+        return len(self.transitions)
+
+    def clean(self, lock: bool=True) -> None:
+        if lock:
+            self.reader_writer_lock.lock_writing_and_reading()
+
+        self.transitions.clear()
+
+        if lock:
+            self.reader_writer_lock.release_writing_and_reading()
+
+    def unlink(self) -> None:
+        """
+        Remove the shared memory of the replay buffer. This should be called once, by any of the processes which hold a
+        copy of the replay buffer, after all the workers are done using it.
+        :return: None
+        """
+        self.transitions.unlink()
+        self.reader_writer_lock.remove_lock_file()
+        self.is_unlinked = True
+
+    def close(self) -> None:
+        """
+        Remove the shared memory of the replay buffer. When the replay buffer is shared between the workers of a
+        distributed run, it is closed through the shared memory scratchpad after all the workers stopped
+        :return: None
+        """
+        if not self.is_unlinked:
+            self.unlink()
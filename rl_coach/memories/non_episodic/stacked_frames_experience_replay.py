@@ -0,0 +1,230 @@
+#
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from rl_coach.core_types import Transition
+from rl_coach.filters.observation.observation_stacking_filter import LazyStack
+from rl_coach.memories.column_storage import ColumnStorage
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.experience_replay import ExperienceReplayParameters, ExperienceReplay
+
+
+class StackedFramesExperienceReplayParameters(ExperienceReplayParameters):
+    def __init__(self):
+        super().__init__()
+        # the storage is always preallocated, so this can't be changed
+        self.use_preallocated_storage = True
+
+    @property
+    def path(self):
+        return 'rl_coach.memories.non_episodic.stacked_frames_experience_replay:StackedFramesExperienceReplay'
+
+
+class FrameStore(object):
+    """
+    A circular store of single observation frames. Each written frame gets a running index, which stays valid until
+    the frame is overwritten, capacity frames later.
+    """
+    def __init__(self, frames: np.ndarray):
+        """
+        :param frames: a preallocated array to hold the frames. the first dimension is the capacity of the store
+        """
+        self.frames = frames
+        self.capacity = frames.shape[0]
+        self.num_written_frames = 0
+
+    def append(self, frame: np.ndarray) -> int:
+        """
+        Write a new frame to the store, overwriting the oldest frame if the store is full
+        :param frame: the frame to write
+        :return: the running index of the frame
+        """
+        self.frames[self.num_written_frames % self.capacity] = frame
+        self.num_written_frames += 1
+        return self.num_written_frames - 1
+
+    def oldest_valid_index(self) -> int:
+        """
+        :return: the running index of the oldest frame that was not overwritten yet
+        """
+        return max(0, self.num_written_frames - self.capacity)
+
+    def stack(self, indices: np.ndarray, axis: int) -> np.ndarray:
+        """
+        Rebuild a stack of frames
+        :param indices: the running indices of the frames in the stack, from the oldest to the newest
+        :param axis: the axis on which to stack the frames
+        :return: the stacked frames
+        """
+        return np.stack(self.frames[indices % self.capacity], axis=axis)
+
+
+class StackedFramesColumnStorage(ColumnStorage):
+    """
+    A column storage which keeps every observation frame of the stacked observations (LazyStack objects created
+    by the ObservationStackingFilter) only once. The frames are written to a circular frame store, and each transition
+    holds only the indices of the frames in its state and next state stacks. The stacks are rebuilt when the
+    transitions are read.
+
+    Consecutive transitions in an episode share their frames, since the state of a transition is the next state of
+    the previous one. The first stack of each episode is made of copies of the first frame, which is stored once.
+    When the frame store wraps around, the oldest transitions whose frames were overwritten are dropped, so the
+    storage may hold slightly less transitions than its capacity.
+    """
+    FRAMES_PREFIX = 'frames/'
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: the maximum number of transitions that the storage can hold
+        """
+        super().__init__(capacity)
+        self.stacked_keys = []
+        self.stacking_axes = {}
+        self.frame_stores = OrderedDict()
+        self._last_next_state = {}
+        self._last_next_state_frames = {}
+
+    def _column_keys(self, state: Dict[str, np.ndarray]) -> List[str]:
+        return [key for key, value in state.items() if not isinstance(value, LazyStack)]
+
+    def allocate(self, transition: Transition) -> None:
+        super().allocate(transition)
+        self.stacked_keys = [key for key, value in transition.state.items() if isinstance(value, LazyStack)]
+        if set(self.stacked_keys) != set(key for key, value in transition.next_state.items()
+                                         if isinstance(value, LazyStack)):
+            raise ValueError("The state and the next state of the transitions must contain the same stacked "
+                             "observations")
+
+        self.frame_stores = OrderedDict()
+        for key in self.stacked_keys:
+            stack = transition.state[key]
+            frame = np.asarray(stack.history[0])
+            stack_size = len(stack.history)
+            frames_capacity = self.capacity + 2 * stack_size
+            self.frame_stores[key] = FrameStore(self._allocate_array(self.FRAMES_PREFIX + key,
+                                                                     (frames_capacity,) + frame.shape, frame.dtype))
+            self.stacking_axes[key] = stack.axis
+            for prefix in [self.STATE_PREFIX, self.NEXT_STATE_PREFIX]:
+                self.columns[self.FRAMES_PREFIX + prefix + key] = \
+                    self._allocate_array(self.FRAMES_PREFIX + prefix + key, (self.capacity, stack_size), np.int64)
+
+    def _store_frames(self, key: str, stack: LazyStack, known_frames: Dict[int, int]) -> List[int]:
+        """
+        Write the frames of a stack to the frame store, skipping frames which are already stored
+        :param key: the state key of the stack
+        :param stack: the stack to write
+        :param known_frames: a mapping from the ids of the frames which are already stored to their indices in the
+                             frame store. the newly written frames are added to it
+        :return: the indices of the frames of the stack
+        """
+        indices = []
+        for frame_id, frame in zip(stack.frame_ids, stack.history):
+            index = known_frames.get(frame_id)
+            if index is None:
+                index = self.frame_stores[key].append(frame)
+                known_frames[frame_id] = index
+            indices.append(index)
+        return indices
+
+    def _has_valid_frames(self, row: int) -> bool:
+        # the frames of the state are never newer than the frames of the next state
+        for key in self.stacked_keys:
+            if self.columns[self.FRAMES_PREFIX + self.STATE_PREFIX + key][row].min() < \
+                    self.frame_stores[key].oldest_valid_index():
+                return False
+        return True
+
+    def append(self, transition: Transition) -> int:
+        if not self.is_allocated():
+            self.allocate(transition)
+
+        frames = {}
+        for key in self.stacked_keys:
+            state_stack = transition.state[key]
+            next_state_stack = transition.next_state[key]
+            # when the transition continues the previous one, the frames of its state are found by their ids among
+            # the frames of the previous next state, even if the stacks were copied or pickled on their way here
+            known_frames = dict(self._last_next_state_frames.get(key, {}))
+            state_frames = self._store_frames(key, state_stack, known_frames)
+            next_state_frames = self._store_frames(key, next_state_stack, known_frames)
+            frames[key] = (state_frames, next_state_frames)
+            # the previous next state is kept alive, since stacks without frame indices are identified by the ids of
+            # their frame objects, which may be reused once the frames are released
+            self._last_next_state[key] = next_state_stack
+            self._last_next_state_frames[key] = dict(zip(next_state_stack.frame_ids, next_state_frames))
+
+        # drop the oldest transitions whose frames were overwritten by the new frames
+        while self.size > 0 and not self._has_valid_frames(self.head):
+            self.info[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+
+        row = super().append(transition)
+        for key, (state_frames, next_state_frames) in frames.items():
+            self.columns[self.FRAMES_PREFIX + self.STATE_PREFIX + key][row] = state_frames
+            self.columns[self.FRAMES_PREFIX + self.NEXT_STATE_PREFIX + key][row] = next_state_frames
+        return row
+
+    def _read_state(self, row: int, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        state = super()._read_state(row, prefix, keys)
+        for key in self.stacked_keys:
+            state[key] = self.frame_stores[key].stack(self.columns[self.FRAMES_PREFIX + prefix + key][row],
+                                                      self.stacking_axes[key])
+        return state
+
+    def _gather_state(self, rows: np.ndarray, prefix: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        state = super()._gather_state(rows, prefix, keys)
+        for key in self.stacked_keys:
+            frame_store = self.frame_stores[key]
+            # the frames are gathered as [batch, stack, ...] and the stack dimension is moved to the stacking axis
+            frames = frame_store.frames[self.columns[self.FRAMES_PREFIX + prefix + key][rows] % frame_store.capacity]
+            axis = self.stacking_axes[key]
+            state[key] = np.moveaxis(frames, 1, axis + 1 if axis >= 0 else axis)
+        return state
+
+    def memory_usage(self) -> Dict[str, int]:
+        memory_usage = super().memory_usage()
+        for key, frame_store in self.frame_stores.items():
+            memory_usage[self.FRAMES_PREFIX + key] = frame_store.frames.nbytes
+        return memory_usage
+
+    def clear(self) -> None:
+        super().clear()
+        self._last_next_state = {}
+        self._last_next_state_frames = {}
+
+
+class StackedFramesExperienceReplay(ExperienceReplay):
+    """
+    An experience replay for stacked image observations (e.g. Atari with an ObservationStackingFilter), which stores
+    each observation frame only once in a circular frame store, instead of keeping two stacks of frames for every
+    transition. The stacked states and next states are rebuilt from the frame indices when the transitions are sampled.
+    Observations which are not stacked are kept in preallocated columns, as in the preallocated storage mode of the
+    regular experience replay.
+    """
+    def __init__(self, max_size: Tuple[MemoryGranularity, int], allow_duplicates_in_batch_sampling: bool=True):
+        """
+        :param max_size: the maximum number of transitions to hold in the memory
+        :param allow_duplicates_in_batch_sampling: allow having the same transition multiple times in a batch
+        """
+        super().__init__(max_size, allow_duplicates_in_batch_sampling, use_preallocated_storage=True)
+
+    def _create_transitions_storage(self) -> StackedFramesColumnStorage:
+        return StackedFramesColumnStorage(self.max_size[1])
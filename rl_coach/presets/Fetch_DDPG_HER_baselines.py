@@ -80,6 +80,7 @@ agent_params.memory.goals_space = GoalsSpace(goal_name='achieved_goal',
                                                                       goal_reaching_reward=0,
                                                                       default_reward=-1),
                                              distance_metric=GoalsSpace.DistanceMetric.Euclidean)
+agent_params.memory.relabel_at_sample_time = True
 agent_params.memory.shared_memory = True
 
 # exploration parameters
@@ -465,6 +465,17 @@ class GoalToRewardConversion(object):
         """
         raise NotImplementedError("")
 
+    def convert_distances_to_rewards(self, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Given a batch of distances from the goals, return the rewards and the flags representing if the goals were
+        reached. Conversions which can be vectorized should override this method.
+        :param distances: an array of distances from the goals
+        :return: an array of rewards and a boolean array of flags
+        """
+        rewards_and_flags = [self.convert_distance_to_reward(distance) for distance in distances]
+        return np.array([reward for reward, _ in rewards_and_flags]), \
+            np.array([np.all(flag) for _, flag in rewards_and_flags], dtype=np.bool_)
+
 
 class ReachingGoal(GoalToRewardConversion):
     """
@@ -488,6 +499,11 @@ class ReachingGoal(GoalToRewardConversion):
         else:
             return self.default_reward, False
 
+    def convert_distances_to_rewards(self, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        reached = np.all(np.reshape(distances, (-1, 1)) <= np.reshape(self.distance_from_goal_threshold, (1, -1)),
+                         axis=1)
+        return np.where(reached, self.goal_reaching_reward, self.default_reward), reached
+
 
 class InverseDistanceFromGoal(GoalToRewardConversion):
     """
@@ -506,6 +522,12 @@ class InverseDistanceFromGoal(GoalToRewardConversion):
     def convert_distance_to_reward(self, distance: Union[float, np.ndarray]) -> Tuple[float, bool]:
         return min(self.max_reward, 1 / (distance + eps)), distance <= self.distance_from_goal_threshold
 
+    def convert_distances_to_rewards(self, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        distances = np.asarray(distances)
+        reached = np.all(np.reshape(distances, (-1, 1)) <= np.reshape(self.distance_from_goal_threshold, (1, -1)),
+                         axis=1)
+        return np.minimum(self.max_reward, 1 / (distances + eps)), reached
+
 
 class GoalsSpace(VectorObservationSpace, ActionSpace):
     """
@@ -581,6 +603,39 @@ class GoalsSpace(VectorObservationSpace, ActionSpace):
         dist = self.distance_from_goal(goal, state)
         return self.reward_type.convert_distance_to_reward(dist)
 
+    def distances_from_goals(self, goals: np.ndarray, achieved_goals: np.ndarray) -> np.ndarray:
+        """
+        Calculate the distances between a batch of goals and a batch of achieved goals
+        :param goals: an array of goals, where the first dimension is the batch dimension
+        :param achieved_goals: an array of goals extracted from states, matching the given goals
+        :return: an array of distances
+        """
+        goals = np.reshape(goals, (len(goals), -1)).astype(np.float64)
+        achieved_goals = np.reshape(achieved_goals, (len(achieved_goals), -1)).astype(np.float64)
+
+        if self.distance_metric == self.DistanceMetric.Cosine:
+            norms = np.linalg.norm(goals, axis=1) * np.linalg.norm(achieved_goals, axis=1)
+            return 1 - np.sum(goals * achieved_goals, axis=1) / norms
+        elif self.distance_metric == self.DistanceMetric.Euclidean:
+            return np.linalg.norm(goals - achieved_goals, axis=1)
+        elif self.distance_metric == self.DistanceMetric.Manhattan:
+            return np.sum(np.abs(goals - achieved_goals), axis=1)
+        elif callable(self.distance_metric):
+            return np.array([self.distance_metric(goal, achieved_goal)
+                             for goal, achieved_goal in zip(goals, achieved_goals)])
+        else:
+            raise ValueError("The given distance metric for the goal is not valid.")
+
+    def get_rewards_for_goals_and_achieved_goals(self, goals: np.ndarray, achieved_goals: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The batch version of get_reward_for_goal_and_state, which gets the achieved goals instead of the states
+        :param goals: an array of goals, where the first dimension is the batch dimension
+        :param achieved_goals: an array of goals extracted from states, matching the given goals
+        :return: an array of rewards and a boolean array representing if each of the goals was reached
+        """
+        return self.reward_type.convert_distances_to_rewards(self.distances_from_goals(goals, achieved_goals))
+
 
 class AgentSelection(DiscreteActionSpace):
     """
@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+tf = pytest.importorskip('tensorflow')
+from rl_coach.architectures.tensorflow_components.shared_variables import SharedRunningStats, \
+    LocalSharedRunningStats
+
+
+@pytest.fixture
+def reset():
+    tf.reset_default_graph()
+
+
+@pytest.mark.unit_test
+def test_local_shared_running_stats(reset):
+    shared_stats = SharedRunningStats(name='shared', create_ops=False)
+    shared_stats.create_ops(shape=[3], clip_values=(-5, 5))
+    local_stats = LocalSharedRunningStats(name='local', create_ops=False, sync_every_n_pushes=4)
+    local_stats.create_ops(shape=[3], clip_values=(-5, 5))
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    shared_stats.set_session(sess)
+    local_stats.set_session(sess)
+
+    for _ in range(10):
+        batch = np.random.randn(2, 3) * 3 + 1
+        shared_stats.push(batch)
+        local_stats.push(batch)
+        assert np.allclose(local_stats.mean, shared_stats.mean)
+        assert np.allclose(local_stats.std, shared_stats.std)
+        assert np.allclose(local_stats.normalize(batch), shared_stats.normalize(batch))
+
+    # only the first 8 pushes were synced to the shared variables
+    assert np.isclose(sess.run(local_stats._count), 16 + local_stats.epsilon)
+    assert local_stats.has_unsynced_samples
+    local_stats.sync()
+    assert not local_stats.has_unsynced_samples
+    assert np.isclose(sess.run(local_stats._count), 20 + local_stats.epsilon)
+    assert np.allclose(sess.run(local_stats._mean), shared_stats.mean)
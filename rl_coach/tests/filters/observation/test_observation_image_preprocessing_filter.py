@@ -0,0 +1,90 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+import scipy.misc
+
+from rl_coach.filters.observation.observation_crop_filter import ObservationCropFilter
+from rl_coach.filters.observation.observation_image_preprocessing_filter import ObservationImagePreprocessingFilter, \
+    get_resize_weights
+from rl_coach.filters.observation.observation_rescale_to_size_filter import ObservationRescaleToSizeFilter, \
+    RescaleInterpolationType
+from rl_coach.filters.observation.observation_rgb_to_y_filter import ObservationRGBToYFilter
+from rl_coach.filters.observation.observation_to_uint8_filter import ObservationToUInt8Filter
+from rl_coach.spaces import ImageObservationSpace
+from rl_coach.core_types import EnvResponse
+from rl_coach.filters.filter import InputFilter
+
+
+def filter_with_chain(observation_filters, observation):
+    input_filter = InputFilter()
+    for i, observation_filter in enumerate(observation_filters):
+        input_filter.add_observation_filter('observation', str(i), observation_filter)
+    env_response = EnvResponse(next_state={'observation': observation}, reward=0, game_over=False)
+    return input_filter.filter(env_response)[0].next_state['observation']
+
+
+@pytest.mark.unit_test
+def test_filter():
+    observation = np.random.randint(0, 256, (20, 30, 3)).astype('uint8')
+    chain = [ObservationCropFilter(np.array([2, 3, 0]), np.array([-1, 25, -1])),
+             ObservationRGBToYFilter(),
+             ObservationToUInt8Filter(0, 255)]
+    fused_filter = ObservationImagePreprocessingFilter.from_filters(chain)
+    assert fused_filter.to_grayscale and fused_filter.output_size is None
+    assert np.all(fused_filter.input_crop_low == [2, 3]) and np.all(fused_filter.input_crop_high == [-1, 25])
+
+    expected_observation = filter_with_chain(chain[1:], observation[2:, 3:25])
+    filtered_observation = filter_with_chain([fused_filter], observation)
+
+    assert filtered_observation.dtype == 'uint8'
+    assert filtered_observation.shape == expected_observation.shape == (18, 22)
+    assert np.all(np.abs(filtered_observation.astype(int) - expected_observation) <= 1)
+
+    # the observation space
+    observation_space = fused_filter.get_filtered_observation_space(ImageObservationSpace(np.array([20, 30, 3]),
+                                                                                          high=255))
+    assert np.all(observation_space.shape == [18, 22])
+
+    # filters which cannot be fused
+    with pytest.raises(ValueError):
+        ObservationImagePreprocessingFilter.from_filters([ObservationToUInt8Filter(0, 255), ObservationRGBToYFilter()])
+
+
+@pytest.mark.unit_test
+def test_resize():
+    # upscaling interpolates linearly between the centers of the input pixels
+    weights = get_resize_weights(2, 4, RescaleInterpolationType.BILINEAR)
+    assert np.allclose(weights.dot([0, 1]), [0, 0.25, 0.75, 1])
+
+    # downscaling averages the covered pixels
+    weights = get_resize_weights(30, 10, RescaleInterpolationType.BILINEAR)
+    assert np.allclose(weights.sum(axis=1), 1)
+    assert np.allclose(weights[5].dot(np.arange(30)), 16)
+
+    for interpolation_type in RescaleInterpolationType:
+        fused_filter = ObservationImagePreprocessingFilter((10, 20), rescaling_interpolation_type=interpolation_type,
+                                                           output_crop_low=np.array([0, 5]))
+        filtered_observation = fused_filter.filter(np.full((20, 30, 3), 100, dtype='uint8'))
+        assert filtered_observation.shape == (10, 15)
+        # the Y coefficients sum to 0.9999, so the chain gives 99 as well
+        assert np.all(filtered_observation == 99)
+
+
+@pytest.mark.filterwarnings('ignore:Conversion of')
+@pytest.mark.unit_test
+def test_filter_matches_chain():
+    if not hasattr(scipy.misc, 'imresize'):
+        pytest.skip("scipy.misc.imresize is not available")
+    # a smooth image, since the resampling of PIL rounds the image after each axis is resized
+    rows, columns = np.meshgrid(np.linspace(0, 3, 210), np.linspace(0, 5, 160), indexing='ij')
+    observation = np.stack([np.sin(rows), np.cos(columns), np.sin(rows + columns)], axis=-1)
+    observation = ((observation + 1) * 127.5).astype('uint8')
+    chain = [ObservationRescaleToSizeFilter(ImageObservationSpace(np.array([84, 84, 3]), high=255)),
+             ObservationRGBToYFilter(),
+             ObservationToUInt8Filter(0, 255)]
+    expected_observation = filter_with_chain(chain, observation)
+    filtered_observation = filter_with_chain([ObservationImagePreprocessingFilter.from_filters(chain)], observation)
+    assert np.all(np.abs(filtered_observation.astype(int) - expected_observation) <= 2)
@@ -7,7 +7,7 @@ import numpy as np
 
 from rl_coach.filters.observation.observation_stacking_filter import ObservationStackingFilter
 from rl_coach.spaces import ObservationSpace
-from rl_coach.core_types import EnvResponse
+from rl_coach.core_types import EnvResponse, stack_values
 from rl_coach.filters.filter import InputFilter
 
 
@@ -76,3 +76,27 @@ def test_reset(stack_filter, env_response):
     filtered_observation = result.next_state['observation']
     assert np.all(np.array(filtered_observation)[:, :, :, 0] == unfiltered_observation)
     assert np.all(np.array(filtered_observation)[:, :, :, -1] == unfiltered_observation)
+
+
+@pytest.mark.unit_test
+def test_frame_indices_and_copy_to():
+    stacking_filter = ObservationStackingFilter(3, stacking_axis=-1)
+    observations = [np.random.rand(5, 6) for _ in range(4)]
+
+    stacks = [stacking_filter.filter(observation) for observation in observations]
+    assert [stack.frame_indices for stack in stacks] == [(0, 0, 0), (0, 0, 1), (0, 1, 2), (1, 2, 3)]
+
+    # the frame indices keep running after a reset
+    stacking_filter.reset()
+    assert stacking_filter.filter(observations[0]).frame_indices == (4, 4, 4)
+
+    # the frame ids of different filters (e.g. of different workers) never collide
+    other_stacking_filter = ObservationStackingFilter(3, stacking_axis=-1)
+    other_stack = other_stacking_filter.filter(observations[0])
+    assert other_stack.frame_indices == stacks[0].frame_indices
+    assert not set(other_stack.frame_ids) & set(frame_id for stack in stacks for frame_id in stack.frame_ids)
+
+    # the stacks are written to a batch without building them separately
+    batch = stack_values(stacks)
+    assert batch.shape == (4, 5, 6, 3)
+    assert all(np.array_equal(batch[i], np.array(stack)) for i, stack in enumerate(stacks))
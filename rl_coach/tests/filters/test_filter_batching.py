@@ -0,0 +1,106 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import EnvResponse
+from rl_coach.filters.filter import InputFilter
+from rl_coach.filters.observation.observation_crop_filter import ObservationCropFilter
+from rl_coach.filters.observation.observation_move_axis_filter import ObservationMoveAxisFilter
+from rl_coach.filters.observation.observation_rgb_to_y_filter import ObservationRGBToYFilter
+from rl_coach.filters.observation.observation_squeeze_filter import ObservationSqueezeFilter
+from rl_coach.filters.observation.observation_to_uint8_filter import ObservationToUInt8Filter
+from rl_coach.filters.reward.reward_clipping_filter import RewardClippingFilter
+from rl_coach.filters.reward.reward_filter import RewardFilter
+from rl_coach.filters.reward.reward_rescale_filter import RewardRescaleFilter
+
+
+@pytest.fixture
+def input_filter():
+    input_filter = InputFilter(is_a_reference_filter=False)
+    input_filter.add_observation_filter('observation', 'crop', ObservationCropFilter(np.array([1, 2, 0]),
+                                                                                      np.array([9, 12, 3])))
+    input_filter.add_observation_filter('observation', 'rgb_to_y', ObservationRGBToYFilter())
+    input_filter.add_observation_filter('observation', 'to_uint8', ObservationToUInt8Filter(0, 255))
+    input_filter.add_observation_filter('observation', 'move_axis', ObservationMoveAxisFilter(0, -1))
+    input_filter.add_observation_filter('observation', 'squeeze', ObservationSqueezeFilter())
+    input_filter.add_reward_filter('rescale', RewardRescaleFilter(0.5))
+    input_filter.add_reward_filter('clipping', RewardClippingFilter(-1, 1))
+    return input_filter
+
+
+@pytest.mark.unit_test
+def test_filter_batch_matches_single_data_points(input_filter):
+    # enough data points for stacking them into a single batch
+    rewards = np.arange(InputFilter.MIN_STACKED_BATCH_SIZE) - 3
+    env_responses = [EnvResponse({'observation': np.random.randint(0, 256, (10, 15, 3)).astype('uint8')},
+                                 reward=reward, game_over=False) for reward in rewards]
+
+    filtered_env_responses = input_filter.filter(env_responses)
+    for env_response, filtered_env_response in zip(env_responses, filtered_env_responses):
+        expected_env_response = input_filter.filter(env_response)[0]
+        assert filtered_env_response.next_state['observation'].shape == (10, 8)
+        assert np.all(filtered_env_response.next_state['observation'] ==
+                      expected_env_response.next_state['observation'])
+        assert filtered_env_response.reward == expected_env_response.reward
+
+    assert [filtered_env_response.reward for filtered_env_response in filtered_env_responses] == \
+        list(np.clip(rewards * 0.5, -1, 1))
+
+
+@pytest.mark.unit_test
+def test_filter_batch_of_different_shapes(input_filter):
+    env_responses = [EnvResponse({'observation': np.full(shape, 100, dtype='uint8')}, reward=0, game_over=False)
+                     for shape in [(10, 15, 3), (12, 20, 3)] * InputFilter.MIN_STACKED_BATCH_SIZE]
+
+    filtered_env_responses = input_filter.filter(env_responses)
+    for filtered_env_response in filtered_env_responses:
+        assert filtered_env_response.next_state['observation'].shape == (10, 8)
+        assert np.all(filtered_env_response.next_state['observation'] == 99)
+
+
+class RewardMeanSubtractionFilter(RewardFilter):
+    """
+    subtracts the mean of all the rewards seen so far, like a (simplified) reward normalization filter
+    """
+    def __init__(self):
+        super().__init__()
+        self.supports_batching = True
+        self.requires_whole_batch = True
+        self.rewards = []
+
+    def filter(self, reward, update_internal_state=True):
+        return self.filter_batch(np.array([reward]), update_internal_state)[0]
+
+    def filter_batch(self, rewards, update_internal_state=True):
+        if update_internal_state:
+            self.rewards.extend(rewards)
+        return rewards - np.mean(self.rewards)
+
+
+@pytest.mark.unit_test
+def test_filter_few_values_with_a_filter_which_requires_the_whole_batch():
+    input_filter = InputFilter(is_a_reference_filter=False)
+    input_filter.add_reward_filter('rescale', RewardRescaleFilter(2))
+    input_filter.add_reward_filter('mean_subtraction', RewardMeanSubtractionFilter())
+    env_responses = [EnvResponse({'observation': np.zeros(3)}, reward=reward, game_over=False) for reward in [1, 2, 3]]
+
+    # all the rewards are used for the mean, also for the first reward
+    filtered_env_responses = input_filter.filter(env_responses)
+    assert [filtered_env_response.reward for filtered_env_response in filtered_env_responses] == [-2, 0, 2]
+
+
+@pytest.mark.unit_test
+def test_filter_single_values_directly():
+    observation = np.random.randint(0, 256, (10, 15, 1)).astype('uint8')
+    assert ObservationSqueezeFilter().filter(observation).shape == (10, 15)
+    assert ObservationMoveAxisFilter(-1, 0).filter(observation).shape == (1, 10, 15)
+    assert ObservationCropFilter(np.array([1, 2, 0]), np.array([9, 12, 1])).filter(observation).shape == (8, 10, 1)
+    assert ObservationRGBToYFilter().filter(np.ones((10, 15, 3))).shape == (10, 15)
+
+    reward = RewardClippingFilter(-1, 1).filter(3)
+    assert reward == 1 and not isinstance(reward, np.ndarray)
+    reward = RewardRescaleFilter(0.5).filter(3)
+    assert reward == 1.5 and not isinstance(reward, np.ndarray)
@@ -0,0 +1,53 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import EnvResponse
+from rl_coach.filters.filter import InputFilter
+from rl_coach.filters.observation.observation_filter import ObservationFilter
+from rl_coach.filters.observation.observation_clipping_filter import ObservationClippingFilter
+from rl_coach.filters.reward.reward_clipping_filter import RewardClippingFilter
+
+
+class InPlaceNegationFilter(ObservationFilter):
+    modifies_input_in_place = True
+
+    def filter(self, observation, update_internal_state=True):
+        observation *= -1
+        return observation
+
+
+@pytest.mark.unit_test
+def test_input_filter_copies_only_the_changed_containers():
+    input_filter = InputFilter(is_a_reference_filter=False)
+    input_filter.add_observation_filter('observation', 'clipping', ObservationClippingFilter(0, 1))
+    input_filter.add_reward_filter('clipping', RewardClippingFilter(-1, 1))
+
+    measurements = np.arange(3)
+    env_response = EnvResponse({'observation': np.full(3, 2.), 'measurements': measurements}, reward=5,
+                               game_over=False, info={'lives': 3})
+    filtered_env_response = input_filter.filter(env_response)[0]
+    filtered_env_response.info['action'] = 1
+
+    assert np.all(filtered_env_response.next_state['observation'] == 1)
+    assert filtered_env_response.reward == 1
+    # the given env response is not changed, and the observations which are not filtered are not copied
+    assert np.all(env_response.next_state['observation'] == 2)
+    assert env_response.reward == 5
+    assert env_response.info == {'lives': 3}
+    assert filtered_env_response.next_state['measurements'] is measurements
+
+
+@pytest.mark.unit_test
+def test_input_filter_copies_the_input_of_in_place_filters():
+    input_filter = InputFilter(is_a_reference_filter=False)
+    input_filter.add_observation_filter('observation', 'negation', InPlaceNegationFilter())
+
+    observation = np.ones(3)
+    filtered_env_response = input_filter.filter(EnvResponse({'observation': observation}, reward=0,
+                                                            game_over=False))[0]
+    assert np.all(filtered_env_response.next_state['observation'] == -1)
+    assert np.all(observation == 1)
@@ -0,0 +1,22 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from rl_coach.core_types import Transition
+
+
+def make_transition(i: int, shape: Tuple[int, ...]=(2,), dtype: np.dtype=np.uint8, game_over: bool=False,
+                    info: Dict=None) -> Transition:
+    """
+    Create a transition whose contents are derived from its index, so that the transitions read back from a memory
+    can be checked against the stored ones
+    :param i: the index of the transition. the observation of the state is filled with i, the observation of the
+              next state with i + 1, the reward is i and the action is i % 3
+    :param shape: the shape of the observations
+    :param dtype: the data type of the observations
+    :param game_over: the game over flag of the transition
+    :param info: the info of the transition
+    :return: the transition
+    """
+    return Transition(state={'observation': np.full(shape, i, dtype=dtype)}, action=i % 3, reward=i,
+                      next_state={'observation': np.full(shape, i + 1, dtype=dtype)}, game_over=game_over, info=info)
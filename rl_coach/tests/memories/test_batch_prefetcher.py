@@ -0,0 +1,39 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import itertools
+import time
+
+import pytest
+
+from rl_coach.memories.batch_prefetcher import BatchPrefetcher
+
+
+@pytest.mark.unit_test
+def test_batch_prefetcher():
+    counter = itertools.count()
+    prefetcher = BatchPrefetcher(lambda: next(counter), queue_size=2)
+    assert [prefetcher.get() for _ in range(5)] == [0, 1, 2, 3, 4]
+
+    # the queue is bounded, so only a few batches are prepared ahead of time
+    time.sleep(0.1)
+    assert next(counter) <= 5 + 2 + 1
+    prefetcher.stop()
+    assert prefetcher.queue.empty()
+
+    # the prefetcher starts again when a batch is requested after it was stopped, and the batches which were dropped
+    # are not returned
+    assert prefetcher.get() > 5
+    prefetcher.stop()
+
+
+@pytest.mark.unit_test
+def test_batch_prefetcher_error():
+    def sample():
+        raise ValueError("not enough transitions")
+
+    prefetcher = BatchPrefetcher(sample)
+    with pytest.raises(ValueError):
+        prefetcher.get()
@@ -0,0 +1,80 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Transition, Episode
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.episodic.circular_episodic_experience_replay import CircularEpisodicExperienceReplay, \
+    RingBuffer
+
+
+def store_episodes(memory, episode_lengths):
+    step = 0
+    for episode_length in episode_lengths:
+        for i in range(episode_length):
+            memory.store(Transition(state={'observation': np.array([step])}, action=0, reward=step,
+                                    next_state={'observation': np.array([step + 1])},
+                                    game_over=i == episode_length - 1))
+            step += 1
+
+
+@pytest.mark.unit_test
+def test_ring_buffer():
+    buffer = RingBuffer(object, initial_capacity=2)
+    buffer.extend(range(5))
+    assert list(buffer) == [0, 1, 2, 3, 4]
+    buffer.popleft(2)
+    buffer.append(5)
+    assert list(buffer) == [2, 3, 4, 5]
+    assert buffer[-1] == 5
+    assert buffer[1:3] == [3, 4]
+    assert list(buffer[np.array([0, 3])]) == [2, 5]
+    del buffer[1]
+    assert list(buffer) == [2, 4, 5]
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+@pytest.mark.unit_test
+def test_evict_oldest_episodes():
+    memory = CircularEpisodicExperienceReplay((MemoryGranularity.Transitions, 10))
+    store_episodes(memory, [4, 3, 5, 2])
+    # the first episode was evicted while the third one was stored
+    assert memory.num_complete_episodes() == 3
+    assert memory.num_transitions() == 10
+    assert [t.reward for t in memory.transitions] == list(range(4, 14))
+    assert memory.get_episode(0).transitions[0].reward == 4
+    assert memory.get_last_complete_episode().length() == 2
+
+    starts, lengths = memory.get_episode_boundaries()
+    assert list(starts) == [0, 3, 8]
+    assert list(lengths) == [3, 5, 2]
+
+    for transition in memory.sample(20):
+        assert 4 <= transition.reward <= 13
+
+
+@pytest.mark.unit_test
+def test_remove_middle_episode_and_clean():
+    memory = CircularEpisodicExperienceReplay((MemoryGranularity.Episodes, 5))
+    store_episodes(memory, [2, 3, 4])
+    episode = Episode()
+    episode.insert(Transition(state={}, action=0, reward=100, next_state={}, game_over=True))
+    memory.store_episode(episode)
+
+    memory.remove_episode(1)
+    assert memory.num_complete_episodes() == 3
+    assert [t.reward for t in memory.transitions] == [0, 1, 5, 6, 7, 8, 100]
+    starts, lengths = memory.get_episode_boundaries()
+    assert list(starts) == [0, 2, 6]
+    assert list(lengths) == [2, 4, 1]
+
+    memory.clean()
+    assert memory.num_transitions() == 0
+    assert memory.length() == 0
+    store_episodes(memory, [3])
+    assert memory.get_episode_boundaries()[1].tolist() == [3]
@@ -0,0 +1,75 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pickle
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Episode
+from rl_coach.memories.columnar_format import ShardedTransitionsReader, is_saved_memory, convert_pickle
+from rl_coach.memories.episodic.episodic_experience_replay import EpisodicExperienceReplay
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.experience_replay import ExperienceReplay
+from rl_coach.tests.memories.memory_test_utils import make_transition
+
+
+@pytest.mark.unit_test
+def test_save_and_load_experience_replay(tmpdir):
+    directory = str(tmpdir.join('replay_buffer'))
+    memory = ExperienceReplay((MemoryGranularity.Transitions, 100))
+    for i in range(25):
+        memory.store(make_transition(i, shape=(2, 2), game_over=i % 10 == 9, info={'step': i}))
+    memory.save(directory, shard_size=10)
+    assert is_saved_memory(directory)
+    assert ShardedTransitionsReader(directory).num_shards() == 3
+
+    loaded_memory = ExperienceReplay((MemoryGranularity.Transitions, 100), use_preallocated_storage=True)
+    loaded_memory.load(directory)
+    assert loaded_memory.num_transitions() == 25
+    for i, transition in enumerate(loaded_memory.transitions):
+        assert transition.reward == i
+        assert transition.action == i % 3
+        assert transition.game_over == (i % 10 == 9)
+        assert transition.info == {'step': i}
+        assert np.all(transition.state['observation'] == i)
+        assert np.all(transition.next_state['observation'] == i + 1)
+
+
+@pytest.mark.unit_test
+def test_save_and_load_episodic_experience_replay(tmpdir):
+    directory = str(tmpdir.join('replay_buffer'))
+    memory = EpisodicExperienceReplay((MemoryGranularity.Transitions, 100))
+    episode = Episode(discount=0.5)
+    for i in range(3):
+        episode.insert(make_transition(i, shape=(2, 2), game_over=i == 2, info={'step': i}))
+    memory.store_episode(episode)
+    for i in range(3, 7):
+        memory.store(make_transition(i, shape=(2, 2), info={'step': i}))
+    memory.save(directory, shard_size=4)
+
+    loaded_memory = EpisodicExperienceReplay((MemoryGranularity.Transitions, 100))
+    loaded_memory.load(directory, mmap=False)
+    assert loaded_memory.num_complete_episodes() == 1
+    assert loaded_memory.num_transitions() == 7
+    loaded_episode = loaded_memory.get_episode(0)
+    assert loaded_episode.discount == 0.5
+    assert loaded_episode.get_returns() == [0 + 0.5 * 1 + 0.25 * 2, 1 + 0.5 * 2, 2]
+    assert loaded_memory.get_episode(1).length() == 4
+
+
+@pytest.mark.unit_test
+def test_convert_pickle(tmpdir):
+    pytest.importorskip('pandas')
+    memory = ExperienceReplay((MemoryGranularity.Transitions, 100))
+    for i in range(5):
+        memory.store(make_transition(i, shape=(2, 2), info={'step': i}))
+    pickle_path = str(tmpdir.join('replay_buffer.p'))
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(memory, f)
+
+    directory = str(tmpdir.join('replay_buffer'))
+    convert_pickle(pickle_path, directory)
+    assert len(ShardedTransitionsReader(directory)) == 5
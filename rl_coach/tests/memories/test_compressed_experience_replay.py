@@ -0,0 +1,49 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pickle
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Transition
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.compressed_experience_replay import CompressedExperienceReplay
+from rl_coach.tests.memories.memory_test_utils import make_transition
+
+
+def make_transition_with_measurements(i: int) -> Transition:
+    # the image observations are compressed while the measurements are stored as is
+    transition = make_transition(i, shape=(84, 84))
+    transition.state['measurements'] = np.array([i, i], dtype=np.float32)
+    transition.next_state['measurements'] = np.array([i + 1, i + 1], dtype=np.float32)
+    return transition
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("num_decompression_threads", [1, 4])
+def test_compressed_experience_replay(num_decompression_threads):
+    memory = CompressedExperienceReplay((MemoryGranularity.Transitions, 50),
+                                        num_decompression_threads=num_decompression_threads)
+    for i in range(60):
+        memory.store(make_transition_with_measurements(i))
+    assert memory.num_transitions() == 50
+    assert set(memory.transitions.compressed_columns.keys()) == {'state/observation', 'next_state/observation'}
+
+    for transition in memory.sample(32) + [memory.get_transition(3)]:
+        expected = make_transition_with_measurements(int(transition.reward))
+        assert transition.state['observation'].dtype == np.uint8
+        assert np.all(transition.state['observation'] == expected.state['observation'])
+        assert np.all(transition.next_state['observation'] == expected.next_state['observation'])
+        assert np.all(transition.state['measurements'] == expected.state['measurements'])
+
+    statistics = memory.get_statistics()
+    assert statistics['Compression Ratio'] > 10
+    assert statistics['Compressed Bytes'] > 0
+    assert statistics['Decode Time Per Value'] > 0
+
+    # the decompression threads are not pickled
+    copied_memory = pickle.loads(pickle.dumps(memory))
+    assert copied_memory.sample(8)[0].state['observation'].shape == (84, 84)
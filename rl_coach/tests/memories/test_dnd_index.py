@@ -0,0 +1,111 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.memories.non_episodic.differentiable_neural_dictionary import QDND, DNDIndexType, \
+    BruteForceDictionary
+
+
+@pytest.mark.unit_test
+def test_brute_force_nearest_neighbors():
+    dictionary = BruteForceDictionary(100, 8, key_error_threshold=0)
+    dictionary.MAX_DISTANCES_PER_CHUNK = 100  # search in several chunks
+    keys = np.random.rand(50, 8)
+    dictionary.add(keys, np.arange(50, dtype=np.float64)[:, np.newaxis])
+    assert dictionary.curr_size == 50
+
+    queries = np.random.rand(7, 8)
+    embeddings, values, indices, _ = dictionary.query(queries, 5)
+    expected_indices = np.argsort(np.linalg.norm(queries[:, np.newaxis] - keys, axis=2), axis=1)[:, :5]
+    assert np.array_equal(indices, expected_indices)
+    assert np.array_equal(values, expected_indices)
+    assert np.allclose(embeddings, keys[expected_indices])
+
+    # an existing key is updated instead of being added again
+    dictionary.override_existing_keys = True
+    dictionary.add(keys[:2], np.array([[10.], [11.]]))
+    assert dictionary.curr_size == 50
+    assert np.allclose(dictionary.values[:2], [1., 2.])
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("index_type", [DNDIndexType.Annoy, DNDIndexType.BruteForce])
+def test_qdnd_query(index_type):
+    dnd = QDND(1000, 4, 2, key_error_threshold=0, num_neighbors=3, index_type=index_type,
+               rebuild_on_every_update=True)
+    embeddings = np.random.rand(40, 4)
+    actions = np.arange(40) % 2
+    dnd.add(embeddings, actions, np.arange(40))
+    assert dnd.has_enough_entries(3)
+
+    dnd_embeddings, dnd_values, dnd_indices = dnd.query(embeddings[:6:2], 0, 3)
+    assert dnd_embeddings.shape == (3, 3, 4)
+    assert dnd_values.shape == dnd_indices.shape == (3, 3)
+    # each key is its own nearest neighbor
+    assert np.array_equal(dnd_values[:, 0], [0, 2, 4])
+
+    dnd.clean()
+    assert not dnd.has_enough_entries(3)
+
+
+@pytest.mark.unit_test
+def test_qdnd_query_all_actions():
+    dnd = QDND(1000, 4, 3, key_error_threshold=0, num_neighbors=3, index_type=DNDIndexType.BruteForce)
+    embeddings = np.random.rand(30, 4)
+    dnd.add(embeddings[:20], np.arange(20) % 2, np.arange(20))
+
+    # the dictionary of the last action is still empty, so its neighbors are zeros
+    dnd_embeddings, dnd_values, dnd_indices = dnd.query_all_actions(embeddings[20:], 3)
+    assert dnd_embeddings.shape == (3, 10, 3, 4)
+    assert dnd_values.shape == dnd_indices.shape == (3, 10, 3)
+    assert np.all(dnd_values[2] == 0)
+    for action in range(2):
+        expected_embeddings, expected_values, expected_indices = dnd.query(embeddings[20:], action, 3)
+        assert np.array_equal(dnd_embeddings[action], expected_embeddings)
+        assert np.array_equal(dnd_values[action], expected_values)
+        assert np.array_equal(dnd_indices[action], expected_indices)
+
+
+@pytest.mark.unit_test
+def test_clock_eviction_and_repeated_updates():
+    dictionary = BruteForceDictionary(10, 2, new_value_shift_coefficient=0.5, key_error_threshold=0)
+    keys = np.arange(20, dtype=np.float64).reshape(10, 2)
+    dictionary.add(keys, np.ones((10, 1)))
+
+    # all the entries were just added, so after giving all of them a second chance the oldest ones are evicted
+    dictionary.add(keys[:3] + 100, np.zeros((3, 1)))
+    assert dictionary.curr_size == 10
+    assert np.array_equal(dictionary.embeddings[:3], keys[:3] + 100)
+
+    # the entry returned by the query gets a second chance, and the next entry is evicted instead
+    dictionary.query(keys[3:4], 1)
+    dictionary.override_existing_keys = True
+    dictionary.add(np.array([[-1., -1.]]), np.zeros((1, 1)))
+    assert np.array_equal(dictionary.embeddings[4], [-1., -1.])
+
+    # updates of the same entry in a single batch are applied one after the other
+    dictionary.add(keys[[5, 5]], np.array([[3.], [5.]]))
+    assert dictionary.values[5] == 3.5
+    assert dictionary.curr_size == 10
+
+
+@pytest.mark.unit_test
+def test_clock_eviction_of_a_mostly_referenced_dictionary():
+    dictionary = BruteForceDictionary(4, 2, key_error_threshold=0)
+    keys = np.arange(8, dtype=np.float64).reshape(4, 2)
+    dictionary.add(keys, np.zeros((4, 1)))
+    dictionary.referenced[:] = True
+    dictionary.referenced[0] = False
+
+    # the entry evicted in the first sweep of the hand is not evicted again in the next sweep
+    evicted = dictionary._evict(2)
+    assert len(np.unique(evicted)) == 2
+
+    dictionary.referenced[:] = True
+    dictionary.referenced[1] = False
+    dictionary.add(keys + 100, np.ones((4, 1)))
+    assert np.array_equal(np.sort(dictionary.embeddings, axis=0), keys + 100)
@@ -0,0 +1,68 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Transition, Episode
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.episodic.episodic_experience_replay import EpisodicExperienceReplay
+from rl_coach.memories.episodic.circular_episodic_experience_replay import CircularEpisodicExperienceReplay
+
+
+def make_episode(first: int, length: int) -> Episode:
+    episode = Episode()
+    for i in range(first, first + length):
+        episode.insert(Transition(state={'observation': np.array([i, i])}, action=i, reward=i,
+                                  next_state={'observation': np.array([i + 1, i + 1])}, game_over=False,
+                                  info={EpisodicExperienceReplay.RECURRENT_STATE_INFO_KEY: (np.full(3, i),
+                                                                                            np.full(3, -i))}))
+    return episode
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("memory_class", [EpisodicExperienceReplay, CircularEpisodicExperienceReplay])
+def test_sample_sequences(memory_class):
+    memory = memory_class((MemoryGranularity.Transitions, 1000))
+    memory.store_episode(make_episode(0, 20))
+    memory.store_episode(make_episode(100, 3))
+    memory.store_episode(make_episode(200, 8))
+
+    batch = memory.sample_sequences(200, sequence_length=4, burn_in=2)
+    assert batch.size == 200
+    assert batch.sequence_length == 6
+    assert batch.burn_in == 2
+
+    rewards = batch.rewards()
+    observations = batch.states(['observation'])['observation']
+    c, h = batch.recurrent_states
+    assert rewards.shape == (200, 6)
+    assert observations.shape == (200, 6, 2)
+    assert np.all(c[:, 0] == rewards[:, 0]) and np.all(h[:, 0] == -rewards[:, 0])
+
+    for sequence_rewards, sequence_mask in zip(rewards, batch.mask):
+        first = sequence_rewards[0]
+        if 100 <= first < 200:
+            # the short episode is padded
+            assert sequence_mask.tolist() == [True] * 3 + [False] * 3
+            assert sequence_rewards.tolist() == [100, 101, 102, 0, 0, 0]
+        else:
+            # the sequences do not cross the end of their episode
+            assert np.all(sequence_mask)
+            assert np.all(np.diff(sequence_rewards) == 1)
+            assert sequence_rewards[-1] < (20 if first < 100 else 208)
+    assert np.all(observations[..., 0] == rewards)
+
+
+@pytest.mark.unit_test
+def test_bytes_granularity():
+    memory = EpisodicExperienceReplay((MemoryGranularity.Bytes, 800))
+    for i in range(5):
+        memory.store_episode(make_episode(10 * i, 5))
+    # each transition holds 16 + 16 bytes of observations, 8 bytes for each of the action and the reward and a game
+    # over byte
+    assert memory.num_complete_episodes() == 3
+    assert memory.get_episode(0).get_first_transition().reward == 20
+    assert sum(memory.memory_usage().values()) == 15 * (16 + 16 + 8 + 8 + 1)
@@ -0,0 +1,168 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Transition
+from rl_coach.filters.observation.observation_stacking_filter import ObservationStackingFilter
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.experience_replay import ExperienceReplay
+from rl_coach.tests.memories.memory_test_utils import make_transition
+
+
+@pytest.fixture()
+def buffer():
+    return ExperienceReplay((MemoryGranularity.Transitions, 5), use_preallocated_storage=True)
+
+
+@pytest.mark.unit_test
+def test_store_and_get(buffer: ExperienceReplay):
+    for i in range(3):
+        buffer.store(make_transition(i))
+    assert buffer.num_transitions() == 3
+    assert buffer.transitions.columns['state/observation'].shape == (5, 2)
+    assert buffer.transitions.columns['state/observation'].dtype == np.uint8
+    assert buffer.transitions.columns['reward'].dtype == np.float64
+
+    transition = buffer.get_transition(1)
+    assert np.all(transition.state['observation'] == 1)
+    assert np.all(transition.next_state['observation'] == 2)
+    assert transition.action == 1
+    assert transition.reward == 1
+    assert not transition.game_over
+    assert buffer.get_transition(3) is None
+
+
+@pytest.mark.unit_test
+def test_wrap_around(buffer: ExperienceReplay):
+    for i in range(12):
+        buffer.store(make_transition(i))
+    assert buffer.num_transitions() == 5
+    assert [t.reward for t in buffer.transitions] == [7, 8, 9, 10, 11]
+    assert buffer.get_transition(0).reward == 7
+    assert buffer.mean_reward() == 9
+
+    buffer.update_last_transition_info({'value': 3})
+    assert buffer.get_transition(-1).info['value'] == 3
+
+    batch = buffer.sample(16)
+    assert len(batch) == 16
+    for transition in batch:
+        assert 7 <= transition.reward <= 11
+        assert np.all(transition.state['observation'] == transition.reward)
+
+
+@pytest.mark.unit_test
+def test_remove(buffer: ExperienceReplay):
+    for i in range(7):
+        buffer.store(make_transition(i))
+    buffer.remove_transition(0)
+    assert [t.reward for t in buffer.transitions] == [3, 4, 5, 6]
+    buffer.remove_transition(1)
+    assert [t.reward for t in buffer.transitions] == [3, 5, 6]
+    assert buffer.num_transitions() == 3
+    buffer.store(make_transition(7))
+    assert [t.reward for t in buffer.transitions] == [3, 5, 6, 7]
+
+
+@pytest.mark.unit_test
+def test_clean(buffer: ExperienceReplay):
+    for i in range(7):
+        buffer.store(make_transition(i))
+    buffer.clean()
+    assert buffer.num_transitions() == 0
+    buffer.store(make_transition(10))
+    assert buffer.num_transitions() == 1
+    assert buffer.get_transition(0).reward == 10
+
+
+@pytest.mark.unit_test
+def test_bytes_granularity():
+    # each transition holds 2 + 2 bytes of observations, 8 bytes of action, 8 bytes of reward and a game over byte
+    buffer = ExperienceReplay((MemoryGranularity.Bytes, 100))
+    for i in range(10):
+        buffer.store(make_transition(i))
+    assert buffer.num_transitions() == 4
+    assert buffer.get_transition(0).reward == 6
+    assert buffer.memory_usage() == {'state/observation': 8, 'next_state/observation': 8, 'action': 32,
+                                     'reward': 32, 'game_over': 4}
+
+    buffer.clean()
+    assert sum(buffer.memory_usage().values()) == 0
+
+    with pytest.raises(ValueError):
+        ExperienceReplay((MemoryGranularity.Bytes, 100), use_preallocated_storage=True)
+
+
+@pytest.mark.unit_test
+def test_bytes_granularity_of_stacked_frames():
+    stacking_filter = ObservationStackingFilter(4)
+    stacks = [stacking_filter.filter(np.full(100, i, dtype=np.uint8)) for i in range(11)]
+    buffer = ExperienceReplay((MemoryGranularity.Bytes, 10000))
+    for i in range(10):
+        buffer.store(Transition(state={'observation': stacks[i]}, action=0, reward=0,
+                                next_state={'observation': stacks[i + 1]}, game_over=False))
+
+    # the frames which are shared between the stacks are counted once, in the column which held them first
+    memory_usage = buffer.memory_usage()
+    assert memory_usage['state/observation'] == 100
+    assert memory_usage['next_state/observation'] == 1000
+
+    # the frames of the removed transition are still held by the following transitions
+    buffer.remove_transition(0)
+    assert buffer.memory_usage()['state/observation'] == 100
+    assert buffer.memory_usage()['next_state/observation'] == 1000
+    for _ in range(9):
+        buffer.remove_transition(0)
+    assert sum(buffer.memory_usage().values()) == 0
+
+    # the memory usage is only tracked for a size in bytes
+    buffer = ExperienceReplay((MemoryGranularity.Transitions, 10))
+    buffer.store(make_transition(0))
+    assert buffer.memory_usage() == {}
+
+
+@pytest.mark.unit_test
+def test_bytes_granularity_of_stacked_frames_from_several_workers():
+    # the frames of the workers have the same running indices, but they are counted separately
+    buffer = ExperienceReplay((MemoryGranularity.Bytes, 10000))
+    for worker in range(2):
+        stacking_filter = ObservationStackingFilter(4)
+        stacks = [stacking_filter.filter(np.full(100, i, dtype=np.uint8)) for i in range(3)]
+        for i in range(2):
+            buffer.store(Transition(state={'observation': stacks[i]}, action=0, reward=0,
+                                    next_state={'observation': stacks[i + 1]}, game_over=False))
+    assert buffer.memory_usage()['state/observation'] == 200
+    assert buffer.memory_usage()['next_state/observation'] == 400
+
+
+@pytest.mark.unit_test
+def test_sample_columnar_batch(buffer: ExperienceReplay):
+    for i in range(4):
+        buffer.store(make_transition(i, game_over=i == 3))
+    buffer.update_last_transition_info({'step': 3})
+
+    batch = buffer.transitions.gather_batch(buffer.transitions.rows(np.array([3, 1, 2])), info={'idx': [3, 1, 2]})
+    assert batch.size == 3
+    assert batch.states(['observation'])['observation'].dtype == np.uint8
+    assert list(batch.states(['observation'])['observation'][:, 0]) == [3, 1, 2]
+    assert list(batch.next_states(['observation'], expand_dims=True)['observation'][:, 0, 0]) == [4, 2, 3]
+    assert list(batch.actions()) == [0, 1, 2]
+    assert list(batch.rewards()) == [3, 1, 2]
+    assert list(batch.game_overs()) == [True, False, False]
+
+    # shuffling and slicing keep the columns aligned
+    batch.shuffle()
+    assert list(batch.info('idx')) == list(batch.rewards())
+    assert list(batch.actions()) == [r % 3 for r in batch.rewards()]
+    batch.slice(1, 3)
+    assert batch.size == 2
+    assert list(batch.info('idx')) == list(batch.rewards())
+    assert [transition.reward for transition in batch.transitions] == list(batch.rewards())
+
+    batch = buffer.sample_batch(8)
+    assert batch.size == 8
+    assert np.all(batch.states(['observation'])['observation'][:, 0] == batch.rewards())
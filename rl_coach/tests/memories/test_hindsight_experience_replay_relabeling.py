@@ -0,0 +1,59 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Transition, Episode
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.episodic.episodic_hindsight_experience_replay import EpisodicHindsightExperienceReplay, \
+    HindsightGoalSelectionMethod
+from rl_coach.spaces import GoalsSpace, ReachingGoal
+
+
+def make_episode(first: int, length: int) -> Episode:
+    episode = Episode()
+    for i in range(first, first + length):
+        episode.insert(Transition(
+            state={'observation': np.array([i], dtype=np.float32), 'desired_goal': np.array([-1.])},
+            action=i,
+            reward=-1,
+            next_state={'observation': np.array([i + 1], dtype=np.float32), 'desired_goal': np.array([-1.])},
+            game_over=False
+        ))
+    return episode
+
+
+@pytest.mark.unit_test
+def test_relabel_at_sample_time():
+    memory = EpisodicHindsightExperienceReplay(
+        (MemoryGranularity.Transitions, 100), hindsight_transitions_per_regular_transition=4,
+        hindsight_goal_selection_method=HindsightGoalSelectionMethod.Future,
+        goals_space=GoalsSpace(goal_name='observation',
+                               reward_type=ReachingGoal(distance_from_goal_threshold=0.1, goal_reaching_reward=0,
+                                                        default_reward=-1),
+                               distance_metric=GoalsSpace.DistanceMetric.Euclidean),
+        relabel_at_sample_time=True)
+    memory.store_episode(make_episode(0, 10))
+    memory.store_episode(make_episode(100, 5))
+
+    # only the actual transitions are stored
+    assert memory.num_transitions() == 15
+
+    batch = memory.sample(500)
+    relabeled = [t for t in batch if t.state['desired_goal'][0] != -1]
+    assert 0 < len(relabeled) < len(batch)
+    for transition in relabeled:
+        goal = transition.state['desired_goal'][0]
+        observation = transition.state['observation'][0]
+        # the goals are taken from future states of the same episode
+        assert observation < goal < (10 if observation < 10 else 105)
+        assert transition.next_state['desired_goal'][0] == goal
+        reached = goal == transition.next_state['observation'][0]
+        assert transition.reward == (0 if reached else -1)
+        assert transition.game_over == reached
+
+    # the stored transitions are not modified
+    assert all(t.state['desired_goal'][0] == -1 for t in memory.transitions)
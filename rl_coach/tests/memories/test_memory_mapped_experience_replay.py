@@ -0,0 +1,94 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import pytest
+import numpy as np
+
+from rl_coach.memories.memory import MemoryGranularity, get_replay_buffer_checkpoint_dir, \
+    get_latest_replay_buffer_checkpoint
+from rl_coach.memories.non_episodic.memory_mapped_experience_replay import MemoryMappedExperienceReplay
+from rl_coach.tests.memories.memory_test_utils import make_transition
+
+
+@pytest.mark.unit_test
+def test_store_and_sample(tmpdir):
+    memory = MemoryMappedExperienceReplay((MemoryGranularity.Transitions, 8), storage_directory=str(tmpdir))
+    for i in range(13):
+        memory.store(make_transition(i, shape=(4, 4)))
+    assert memory.num_transitions() == 8
+    assert isinstance(memory.transitions.columns['state/observation'], np.memmap)
+    assert not isinstance(memory.transitions.columns['reward'], np.memmap)
+    assert os.path.exists(os.path.join(str(tmpdir), 'state.observation.dat'))
+
+    for transition in memory.sample(32):
+        assert 5 <= transition.reward <= 12
+        assert np.all(transition.state['observation'] == transition.reward)
+        assert np.all(transition.next_state['observation'] == transition.reward + 1)
+        assert transition.action == transition.reward % 3
+
+
+@pytest.mark.unit_test
+def test_sample_batch_and_close():
+    memory = MemoryMappedExperienceReplay((MemoryGranularity.Transitions, 8))
+    for i in range(13):
+        memory.store(make_transition(i, shape=(4, 4)))
+
+    # the rows of the memory mapped columns are read in sorted order, and returned in the sampled order
+    batch = memory.transitions.gather_batch(memory.transitions.rows(np.array([7, 2, 7, 0])))
+    assert np.array_equal(batch.rewards(), [12, 7, 12, 5])
+    assert np.array_equal(batch.states(['observation'])['observation'][:, 0, 0], [12, 7, 12, 5])
+    assert np.array_equal(batch.next_states(['observation'])['observation'][:, 0, 0], [13, 8, 13, 6])
+
+    # the temporary directory of the memory mapped files is removed when the memory is closed
+    assert os.path.exists(memory.storage_directory)
+    memory.close()
+    assert not os.path.exists(memory.storage_directory)
+
+
+@pytest.mark.unit_test
+def test_set_experiment_path(tmpdir):
+    # the files are moved from the temporary directory to the experiment directory, and kept after closing the memory
+    memory = MemoryMappedExperienceReplay((MemoryGranularity.Transitions, 8))
+    temporary_directory = memory.storage_directory
+    memory.set_experiment_path(str(tmpdir), 'main_level/agent')
+    assert not os.path.exists(temporary_directory)
+    memory.store(make_transition(0, shape=(4, 4)))
+    assert memory.storage_directory == os.path.join(str(tmpdir), 'replay_buffer', 'main_level/agent')
+    assert len(os.listdir(memory.storage_directory)) == 2
+    memory.close()
+    assert os.path.exists(memory.storage_directory)
+
+    # a directory which was given explicitly is not changed
+    memory = MemoryMappedExperienceReplay((MemoryGranularity.Transitions, 8),
+                                          storage_directory=str(tmpdir.join('given')))
+    memory.set_experiment_path(str(tmpdir), 'main_level/agent')
+    assert memory.storage_directory == str(tmpdir.join('given'))
+
+
+@pytest.mark.unit_test
+def test_checkpoint_and_restore(tmpdir):
+    checkpoint_dir = str(tmpdir.mkdir('checkpoint'))
+    memory = MemoryMappedExperienceReplay((MemoryGranularity.Transitions, 8),
+                                          storage_directory=str(tmpdir.join('replay_buffer')))
+    for i in range(10):
+        memory.store(make_transition(i, shape=(4, 4)))
+    memory.save_checkpoint(get_replay_buffer_checkpoint_dir(checkpoint_dir, 0, 'main_level/agent'))
+    memory.store(make_transition(10, shape=(4, 4)))
+    memory.save_checkpoint(get_replay_buffer_checkpoint_dir(checkpoint_dir, 1, 'main_level/agent'))
+    # only the latest copy of the replay buffer is kept
+    assert os.listdir(checkpoint_dir) == ['1.main_level.agent.replay_buffer']
+    memory.store(make_transition(11, shape=(4, 4)))
+
+    restored_memory = MemoryMappedExperienceReplay((MemoryGranularity.Transitions, 8),
+                                                   storage_directory=str(tmpdir.join('restored_replay_buffer')))
+    restored_memory.restore_checkpoint(get_latest_replay_buffer_checkpoint(checkpoint_dir, 'main_level/agent'))
+    assert restored_memory.num_transitions() == 8
+    assert [t.reward for t in restored_memory.transitions] == list(range(3, 11))
+    assert np.all(restored_memory.get_transition(-1).next_state['observation'] == 11)
+
+    # the restored buffer keeps working after the restore, without changing the checkpoint
+    restored_memory.store(make_transition(20, shape=(4, 4)))
+    assert restored_memory.get_transition(-1).reward == 20
+    assert get_latest_replay_buffer_checkpoint(checkpoint_dir, 'other_agent') is None
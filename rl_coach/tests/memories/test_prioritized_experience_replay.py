@@ -5,8 +5,11 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 import pytest
+import numpy as np
 
-from rl_coach.memories.non_episodic.prioritized_experience_replay import SegmentTree
+from rl_coach.core_types import Transition
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.prioritized_experience_replay import SegmentTree, PrioritizedExperienceReplay
 
 
 @pytest.mark.unit_test
@@ -87,7 +90,95 @@ def test_max_tree():
     assert max_tree.__str__() == "[5.]\n[5. 3.]\n[5. 2. 3. 3.]\n"
 
 
+@pytest.mark.unit_test
+def test_batch_get_and_update():
+    sum_tree = SegmentTree(size=8, operation=SegmentTree.Operation.SUM)
+    min_tree = SegmentTree(size=8, operation=SegmentTree.Operation.MIN)
+    reference_tree = SegmentTree(size=8, operation=SegmentTree.Operation.SUM)
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    for i, value in enumerate(values):
+        sum_tree.add(value, str(i))
+        min_tree.add(value, str(i))
+        reference_tree.add(value, str(i))
+    assert sum_tree.total_value() == 31
+
+    # batched queries return the same leaves as single queries
+    queries = np.array([0.5, 3, 3.5, 8.9, 9, 14, 22.5, 31])
+    leaf_idxs, priorities, data = sum_tree.get_batch(queries)
+    for query, leaf_idx, priority, item in zip(queries, leaf_idxs, priorities, data):
+        assert sum_tree.get(query) == (leaf_idx, priority, item)
+
+    # batched updates match sequential updates, with the last value winning for repeated leaves
+    leaf_idxs = np.array([6, 1, 5, 1])
+    new_values = np.array([7, 2, 0.5, 10])
+    sum_tree.update_batch(leaf_idxs, new_values)
+    for leaf_idx, new_value in zip(leaf_idxs, new_values):
+        reference_tree.update(leaf_idx, new_value)
+    assert np.all(sum_tree.tree == reference_tree.tree)
+
+    min_tree.update_batch(leaf_idxs, new_values)
+    assert min_tree.total_value() == 0.5
+
+    with pytest.raises(ValueError):
+        sum_tree.update_batch(np.array([8]), np.array([1]))
+
+
+@pytest.mark.unit_test
+def test_sample_with_info():
+    memory = PrioritizedExperienceReplay((MemoryGranularity.Transitions, 8), alpha=1)
+    for i in range(8):
+        memory.store(Transition(state={'observation': np.array([i])}, action=0, reward=i, game_over=False))
+    memory.update_priorities(list(range(8)), [0, 0, 0, 0, 0, 0, 0, 1])
+
+    batch, info = memory.sample_with_info(4)
+    assert len(batch) == 4
+    assert info['idx'].shape == (4,) and info['weight'].shape == (4,)
+    assert np.all(info['weight'] <= 1)
+
+    # almost all the priority is given to the last transition
+    assert np.all(info['idx'] == 7)
+    assert all(transition.reward == 7 for transition in batch)
+
+    # the stored transitions are not modified by sampling
+    assert 'idx' not in batch[0].info and 'weight' not in batch[0].info
+
+
+@pytest.mark.unit_test
+def test_update_priorities_of_overwritten_transitions():
+    memory = PrioritizedExperienceReplay((MemoryGranularity.Transitions, 4), alpha=1, epsilon=0)
+    for i in range(4):
+        memory.store(Transition(state={'observation': np.array([i])}, action=0, reward=i, game_over=False))
+    _, info = memory.sample_with_info(4)
+
+    # the first leaf is overwritten by a new transition before the priorities of the batch are updated
+    memory.store(Transition(state={'observation': np.array([4])}, action=0, reward=4, game_over=False))
+    memory.update_priorities(np.arange(4), [2, 2, 2, 2], [info['version'][info['idx'] == i][0] for i in range(4)])
+    assert memory.sum_tree.tree[memory.sum_tree.size - 1:].tolist() == [1, 2, 2, 2]
+
+
+
+@pytest.mark.unit_test
+def test_invalid_calls_release_the_lock():
+    memory = PrioritizedExperienceReplay((MemoryGranularity.Transitions, 4))
+    memory.store(Transition(state={'observation': np.array([0])}, action=0, reward=0, game_over=False))
+    with pytest.raises(ValueError):
+        memory.sample_with_info(2)
+    with pytest.raises(ValueError):
+        memory.update_priorities([0], [-1])
+    with pytest.raises(ValueError):
+        memory.update_priorities([0, 1], [1])
+
+    # the memory can still be used after the failed calls
+    memory.store(Transition(state={'observation': np.array([1])}, action=0, reward=1, game_over=False))
+    _, info = memory.sample_with_info(2)
+    memory.update_priorities(info['idx'], [1, 1])
+
+
 if __name__ == "__main__":
     test_sum_tree()
     test_min_tree()
     test_max_tree()
+    test_batch_get_and_update()
+    test_sample_with_info()
+    test_update_priorities_of_overwritten_transitions()
+    test_invalid_calls_release_the_lock()
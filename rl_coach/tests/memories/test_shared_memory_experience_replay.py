@@ -0,0 +1,116 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import multiprocessing
+import pickle
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+import numpy as np
+
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.shared_memory_experience_replay import SharedMemoryExperienceReplay
+from rl_coach.tests.memories.memory_test_utils import make_transition
+from rl_coach.utils import SharedMemoryScratchPad
+
+
+def store_transitions(pickled_memory, first, last):
+    memory = pickle.loads(pickled_memory)
+    for i in range(first, last):
+        memory.store(make_transition(i, shape=(3,), dtype=np.float32))
+
+
+def attach_without_unregistering(pickled_memory):
+    # the forked process shares the resource tracker of its parent, so unregistering the segments from it would
+    # prevent it from removing them if the parent crashes
+    def unregister(name, rtype):
+        raise RuntimeError("{} was unregistered".format(name))
+    resource_tracker.unregister = unregister
+    memory = pickle.loads(pickled_memory)
+    memory.store(make_transition(0, shape=(3,), dtype=np.float32))
+    assert memory.num_transitions() == 2
+
+
+@pytest.fixture()
+def memory():
+    memory = SharedMemoryExperienceReplay((MemoryGranularity.Transitions, 50))
+    yield memory
+    memory.close()
+
+
+@pytest.mark.unit_test
+def test_attach_after_pickling(memory):
+    attached_memory = pickle.loads(pickle.dumps(memory))
+    for i in range(3):
+        memory.store(make_transition(i, shape=(3,), dtype=np.float32))
+    # the columns were allocated after the memory was pickled
+    assert attached_memory.num_transitions() == 3
+    assert attached_memory.get_transition(2).reward == 2
+    attached_memory.store(make_transition(3, shape=(3,), dtype=np.float32))
+    assert memory.num_transitions() == 4
+    assert np.all(memory.get_transition(3).state['observation'] == 3)
+
+
+@pytest.mark.unit_test
+def test_store_from_several_processes(memory):
+    context = multiprocessing.get_context('fork')
+    pickled_memory = pickle.dumps(memory)
+    workers = [context.Process(target=store_transitions, args=(pickled_memory, 100 * w, 100 * w + 20))
+               for w in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    assert memory.num_transitions() == 50
+    for transition in memory.sample(64):
+        assert np.all(transition.state['observation'] == transition.reward)
+        assert np.all(transition.next_state['observation'] == transition.reward + 1)
+        assert transition.action == transition.reward % 3
+
+
+@pytest.mark.unit_test
+def test_close_removes_shared_memory(memory):
+    memory.store(make_transition(0, shape=(3,), dtype=np.float32))
+    segment_names = [segment.name for segment, _, _ in memory.transitions._segments.values()]
+    lock_path = memory.reader_writer_lock.path
+    memory.close()
+
+    assert not os.path.exists(lock_path)
+    for segment_name in segment_names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=segment_name)
+    # closing the memory again (e.g. by the fixture) does nothing
+    memory.close()
+
+
+@pytest.mark.unit_test
+def test_close_through_the_scratchpad():
+    # the scratchpad holds a copy of the memory which was pickled before the columns were allocated by a worker
+    memory = SharedMemoryExperienceReplay((MemoryGranularity.Transitions, 50))
+    scratchpad = SharedMemoryScratchPad()
+    scratchpad.add('memory', pickle.loads(pickle.dumps(memory)))
+    memory.store(make_transition(0, shape=(3,), dtype=np.float32))
+    segment_names = [segment.name for segment, _, _ in memory.transitions._segments.values()]
+    lock_path = memory.reader_writer_lock.path
+
+    scratchpad.close()
+    assert not os.path.exists(lock_path)
+    for segment_name in segment_names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=segment_name)
+
+
+@pytest.mark.unit_test
+def test_forked_processes_keep_the_segments_registered(memory):
+    # the columns are allocated before the memory is pickled, so the worker attaches to all the segments
+    memory.store(make_transition(0, shape=(3,), dtype=np.float32))
+    worker = multiprocessing.get_context('fork').Process(target=attach_without_unregistering,
+                                                         args=(pickle.dumps(memory),))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
@@ -0,0 +1,102 @@
+# nasty hack to deal with issue #46
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import copy
+import pickle
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import Transition
+from rl_coach.filters.observation.observation_stacking_filter import ObservationStackingFilter
+from rl_coach.memories.memory import MemoryGranularity
+from rl_coach.memories.non_episodic.stacked_frames_experience_replay import StackedFramesExperienceReplay
+
+
+def play_episodes(memory, episode_lengths, stack_size=4, pickle_transitions=False):
+    """
+    store transitions the same way the agent does, where each frame is filled with its global step number.
+    the transitions can also be pickled before they are stored, as when they are sent to a memory in another process
+    """
+    stacking_filter = ObservationStackingFilter(stack_size)
+    step = 0
+    for episode_length in episode_lengths:
+        stacking_filter.reset()
+        state = {'observation': stacking_filter.filter(np.full((3, 3), step, dtype=np.uint8)),
+                 'measurements': np.array([step])}
+        for i in range(episode_length):
+            step += 1
+            next_state = {'observation': stacking_filter.filter(np.full((3, 3), step, dtype=np.uint8)),
+                          'measurements': np.array([step])}
+            transition = Transition(state=copy.copy(state), action=step % 2, reward=step, next_state=next_state,
+                                    game_over=i == episode_length - 1)
+            if pickle_transitions:
+                transition = pickle.loads(pickle.dumps(transition))
+            memory.store(transition)
+            state = next_state
+
+
+@pytest.mark.unit_test
+def test_frames_are_stored_once():
+    memory = StackedFramesExperienceReplay((MemoryGranularity.Transitions, 100))
+    play_episodes(memory, [10, 5])
+    assert memory.num_transitions() == 15
+    # one frame per step, and one more for the first frame of each episode
+    assert memory.transitions.frame_stores['observation'].num_written_frames == 17
+
+
+@pytest.mark.unit_test
+def test_frames_of_pickled_transitions_are_stored_once():
+    memory = StackedFramesExperienceReplay((MemoryGranularity.Transitions, 100))
+    play_episodes(memory, [10, 5], pickle_transitions=True)
+    assert memory.num_transitions() == 15
+    assert memory.transitions.frame_stores['observation'].num_written_frames == 17
+    for transition in memory.transitions:
+        assert transition.next_state['observation'][0, 0, -1] == transition.reward
+        assert transition.state['observation'][0, 0, -1] == transition.reward - 1
+
+
+@pytest.mark.unit_test
+def test_stacks_are_rebuilt():
+    memory = StackedFramesExperienceReplay((MemoryGranularity.Transitions, 100))
+    play_episodes(memory, [2, 3])
+
+    # the first transition of the second episode starts from a stack of copies of the first frame
+    transition = memory.get_transition(2)
+    assert transition.state['observation'].shape == (3, 3, 4)
+    assert list(transition.state['observation'][0, 0]) == [2, 2, 2, 2]
+    assert list(transition.next_state['observation'][0, 0]) == [2, 2, 2, 3]
+    assert transition.state['measurements'][0] == 2
+
+    transition = memory.get_transition(4)
+    assert list(transition.state['observation'][0, 0]) == [2, 2, 3, 4]
+    assert list(transition.next_state['observation'][0, 0]) == [2, 3, 4, 5]
+    assert transition.game_over
+
+    for transition in memory.sample(20):
+        assert transition.next_state['observation'][0, 0, -1] == transition.reward
+
+
+@pytest.mark.unit_test
+def test_wrap_around():
+    memory = StackedFramesExperienceReplay((MemoryGranularity.Transitions, 10))
+    play_episodes(memory, [7, 7, 7])
+    assert 0 < memory.num_transitions() <= 10
+    for transition in memory.transitions:
+        assert transition.next_state['observation'][0, 0, -1] == transition.reward
+        assert transition.state['measurements'][0] == transition.reward - 1
+    assert memory.get_transition(-1).reward == 21
+
+
+@pytest.mark.unit_test
+def test_gather_batch():
+    memory = StackedFramesExperienceReplay((MemoryGranularity.Transitions, 100))
+    play_episodes(memory, [2, 3])
+    rows = memory.transitions.rows(np.array([4, 0, 2]))
+    batch = memory.transitions.gather_batch(rows)
+    transitions = memory.transitions.gather(rows)
+    for key in ['observation', 'measurements']:
+        assert np.array_equal(batch.states([key])[key], np.stack([t.state[key] for t in transitions]))
+        assert np.array_equal(batch.next_states([key])[key], np.stack([t.next_state[key] for t in transitions]))
@@ -0,0 +1,54 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import copy
+import pickle
+
+import pytest
+import numpy as np
+
+from rl_coach.core_types import ActionInfo, Episode, Transition
+
+
+@pytest.mark.unit_test
+def test_discounted_returns():
+    rewards = np.array([1., 2., 3., 4.])
+    assert np.allclose(Episode.calculate_discounted_returns(rewards, 0.5),
+                       [1 + 1 + 0.75 + 0.5, 2 + 1.5 + 1, 3 + 2, 4])
+    assert np.allclose(Episode.calculate_discounted_returns(rewards, 0.5, n_step=2),
+                       [1 + 1, 2 + 1.5, 3 + 2, 4])
+    assert np.allclose(Episode.calculate_discounted_returns(rewards, 0.5, n_step=2, bootstraps=[0, 0, 8, 16]),
+                       [1 + 1 + 2, 2 + 1.5 + 4, 3 + 2, 4])
+
+    episode = Episode(discount=0.5, bootstrap_total_return_from_old_policy=True, n_step=2)
+    for reward, value in zip(rewards, [0, 0, 8, 16]):
+        episode.insert(Transition(reward=reward, info={'max_action_value': np.array([value])}))
+    episode.update_returns()
+    assert np.allclose(episode.get_returns(), [4, 7.5, 5, 4])
+
+
+@pytest.mark.unit_test
+def test_transition_fields():
+    transition = Transition(state={'observation': np.zeros(2)}, action=1, reward=0.5, game_over=False)
+    assert transition.next_state is transition.state
+    with pytest.raises(Exception, match='total_return was not filled'):
+        transition.total_return
+
+    # the action info record is merged into the info dictionary when the dictionary is read
+    transition.add_info(ActionInfo(1, action_probability=0.3, max_action_value=2.))
+    with pytest.raises(ValueError):
+        transition.add_info({'action_probability': 0.5})
+    transition.add_info({'mask': 1})
+    assert transition.info['action_probability'] == 0.3
+    assert transition.info['max_action_value'] == 2.
+    assert transition.info['mask'] == 1
+
+    copied_transition = copy.copy(transition)
+    copied_transition.info['mask'] = 0
+    assert transition.info['mask'] == 1
+    for restored_transition in [copy.deepcopy(transition), pickle.loads(pickle.dumps(transition))]:
+        assert restored_transition.reward == 0.5
+        assert restored_transition.info == transition.info
+        with pytest.raises(Exception, match='total_return was not filled'):
+            restored_transition.total_return
@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import multiprocessing
+import pickle
+import threading
+import time
+
+import pytest
+
+from rl_coach.utils import ReaderWriterLock
+
+
+def hold_writing_lock(pickled_lock, locked, release):
+    lock = pickle.loads(pickled_lock)
+    lock.lock_writing_and_reading()
+    locked.set()
+    release.wait()
+    lock.release_writing_and_reading()
+
+
+@pytest.mark.unit_test
+def test_reader_writer_lock_threads():
+    lock = ReaderWriterLock()
+    events = []
+
+    lock.lock_writing()
+    lock.lock_writing()  # readers share the lock
+    writer = threading.Thread(target=lambda: (lock.lock_writing_and_reading(), events.append('writer'),
+                                              lock.release_writing_and_reading()))
+    writer.start()
+    time.sleep(0.05)
+    assert events == []  # the writer waits for the readers
+    lock.release_writing()
+    lock.release_writing()
+    writer.join(timeout=1)
+    assert events == ['writer']
+
+    # the lock can be pickled even though it holds threading primitives
+    copied_lock = pickle.loads(pickle.dumps(lock))
+    copied_lock.lock_writing_and_reading()
+    copied_lock.release_writing_and_reading()
+
+
+@pytest.mark.unit_test
+def test_reader_writer_lock_processes():
+    context = multiprocessing.get_context('fork')
+    lock = ReaderWriterLock(interprocess=True)
+    locked, release = context.Event(), context.Event()
+    writer = context.Process(target=hold_writing_lock, args=(pickle.dumps(lock), locked, release))
+    writer.start()
+    assert locked.wait(timeout=5)
+
+    acquired = []
+    reader = threading.Thread(target=lambda: (lock.lock_writing(), acquired.append(True), lock.release_writing()))
+    reader.start()
+    time.sleep(0.05)
+    assert acquired == []  # the reader waits for the writer in the other process
+    release.set()
+    reader.join(timeout=5)
+    writer.join(timeout=5)
+    assert acquired == [True]
+    os.remove(lock.path)
@@ -20,13 +20,13 @@ import inspect
 import json
 import os
 import signal
+import tempfile
 import threading
 import time
 from subprocess import Popen
 from typing import List, Tuple
 
 import numpy as np
-from multiprocessing import Manager
 
 killed_processes = []
 
@@ -502,6 +502,13 @@ class SharedMemoryScratchPad(object):
             args = (args,)
         return getattr(self.dict[key], func)(*args)
 
+    def close(self):
+        # the values which are shared between the workers (e.g. a shared replay buffer) are closed once all the workers
+        # are done using them
+        for value in self.dict.values():
+            if hasattr(value, 'close'):
+                value.close()
+
 
 class Timer(object):
     def __init__(self, prefix):
@@ -515,37 +522,93 @@ class Timer(object):
 
 
 class ReaderWriterLock(object):
-    def __init__(self):
-        self.num_readers_lock = Manager().Lock()
-        self.writers_lock = Manager().Lock()
-        self.num_readers = 0
-        self.now_writing = False
+    """
+    A readers-writer lock with a preference for writers. Writers (lock_writing_and_reading) get exclusive access, while
+    readers (lock_writing, which only blocks the writing) can hold the lock together. Waiting threads are blocked on a
+    condition variable until the lock is released, instead of polling.
+
+    By default, the lock only synchronizes the threads of a single process. An interprocess lock also synchronizes all
+    the processes which hold a copy of it (e.g. by unpickling it), using shared and exclusive flock locks on a lock file.
+    Pickling the lock never pickles its state, so a memory that holds a lock can be pickled at any time.
+    """
+    def __init__(self, interprocess: bool=False, path: str=None):
+        """
+        :param interprocess: synchronize several processes and not only the threads of the current process
+        :param path: the path of the lock file of an interprocess lock. if not given, a new lock file is created
+        """
+        self.interprocess = interprocess
+        self.path = path
+        if self.interprocess and self.path is None:
+            file_descriptor, self.path = tempfile.mkstemp(prefix='coach_lock_')
+            os.close(file_descriptor)
+        self._create_primitives()
+
+    def _create_primitives(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._num_readers = 0
+        self._num_waiting_writers = 0
+        self._now_writing = False
+        self._lock_file = open(self.path, 'a') if self.interprocess else None
+
+    def _lock_file_mode(self, mode: str):
+        # flock locks are held per open file, so they are taken once for all the threads of the process
+        if self.interprocess:
+            import fcntl
+            fcntl.flock(self._lock_file.fileno(), {'shared': fcntl.LOCK_SH, 'exclusive': fcntl.LOCK_EX,
+                                                   'unlocked': fcntl.LOCK_UN}[mode])
 
     def some_worker_is_reading(self):
-        return self.num_readers > 0
+        return self._num_readers > 0
 
     def some_worker_is_writing(self):
-        return self.now_writing is True
+        return self._now_writing
 
     def lock_writing_and_reading(self):
-        self.writers_lock.acquire()  # first things first - block all other writers
-        self.now_writing = True  # block new readers who haven't started reading yet
-        while self.some_worker_is_reading():  # let existing readers finish their homework
-            time.sleep(0.05)
+        with self._condition:
+            self._num_waiting_writers += 1  # block new readers who haven't started reading yet
+            while self._now_writing or self._num_readers > 0:
+                self._condition.wait()
+            self._num_waiting_writers -= 1
+            self._now_writing = True
+        self._lock_file_mode('exclusive')
 
     def release_writing_and_reading(self):
-        self.now_writing = False  # release readers - guarantee no readers starvation
-        self.writers_lock.release()  # release writers
+        self._lock_file_mode('unlocked')
+        with self._condition:
+            self._now_writing = False
+            self._condition.notify_all()
 
     def lock_writing(self):
-        while self.now_writing:
-            time.sleep(0.05)
-
-        self.num_readers_lock.acquire()
-        self.num_readers += 1
-        self.num_readers_lock.release()
+        with self._condition:
+            while self._now_writing or self._num_waiting_writers > 0:
+                self._condition.wait()
+            if self._num_readers == 0:
+                self._lock_file_mode('shared')
+            self._num_readers += 1
 
     def release_writing(self):
-        self.num_readers_lock.acquire()
-        self.num_readers -= 1
-        self.num_readers_lock.release()
\ No newline at end of file
+        with self._condition:
+            self._num_readers -= 1
+            if self._num_readers == 0:
+                self._lock_file_mode('unlocked')
+                self._condition.notify_all()
+
+    def remove_lock_file(self):
+        """
+        Close and remove the lock file of an interprocess lock. The lock cannot be used by any of the processes after
+        calling this method.
+        """
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        if self.interprocess and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getstate__(self):
+        return {'interprocess': self.interprocess, 'path': self.path}
+
+    def __setstate__(self, state):
+        # locks pickled by older versions hold no interprocess state
+        self.interprocess = state.get('interprocess', False)
+        self.path = state.get('path', None)
+        self._create_primitives()